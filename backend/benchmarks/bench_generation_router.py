@@ -0,0 +1,102 @@
+"""Compare calling one image model directly with the ``ModelRouter`` during a simulated incident.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_generation_router
+
+Models are ``StubBackend`` instances, so nothing leaves the machine. In the healthy
+scenario the primary has a small slow tail; during the incident it also fails half of
+its calls and a fifth of them hang. The router adds a deadline, hedging at the primary's
+p95, a circuit breaker, failover to a healthy secondary and a text-only fallback.
+"""
+import asyncio
+import contextlib
+import io
+import time
+
+from google.genai import types
+
+from utils.generation_backend import StubBackend
+from utils.generation_executor import GenerationExecutor
+from utils.generation_output import parse_response
+from utils.generation_router import ModelRouter
+
+REQUESTS = 400
+CONCURRENCY = 32
+LATENCY_SECONDS = 0.1
+DEADLINE_SECONDS = 1.0
+CONTENTS = [types.Part.from_text(text="Redesign this living room")]
+
+SCENARIOS = {
+    "healthy": {"failure_rate": 0.0, "slow_rate": 0.03, "slow_seconds": 2.0},
+    "incident": {"failure_rate": 0.5, "slow_rate": 0.2, "slow_seconds": 2.0},
+}
+
+
+def stub(model: str, **overrides) -> StubBackend:
+    settings = {"latency": LATENCY_SECONDS, "jitter": LATENCY_SECONDS / 2, "failure_rate": 0.0,
+                "no_image_rate": 0.0, "slow_rate": 0.0, "image_size": 64, "seed": model}
+    settings.update(overrides)
+    return StubBackend(model, **settings)
+
+
+async def drive(backend) -> dict:
+    # Routing decisions and model failures are logged per call; keep the table readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        return await _drive(backend)
+
+
+async def _drive(backend) -> dict:
+    latencies = []
+    errors = 0
+    images = 0
+    counter = iter(range(REQUESTS))
+
+    async def worker():
+        nonlocal errors, images
+        for _ in counter:
+            started = time.perf_counter()
+            try:
+                response = await backend.generate_content(CONTENTS)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            if parse_response(response, "").image_data:
+                images += 1
+
+    await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+    latencies.sort()
+    pick = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "errors": errors, "images": images}
+
+
+def print_row(label: str, result: dict, extra: str = ""):
+    print(
+        f"  {label:<8} p50 {result['p50']:>6.0f}ms  p95 {result['p95']:>6.0f}ms  p99 {result['p99']:>6.0f}ms  "
+        f"errors {result['errors'] / REQUESTS:>5.1%}  with image {result['images'] / REQUESTS:>5.1%}{extra}"
+    )
+
+
+async def run():
+    for scenario, primary_settings in SCENARIOS.items():
+        print(f"\n{scenario} ({REQUESTS} calls, {CONCURRENCY} concurrent)")
+        direct = await drive(stub("primary", **primary_settings))
+        print_row("direct", direct)
+
+        router = ModelRouter(
+            [stub("primary", **primary_settings), stub("secondary", latency=LATENCY_SECONDS * 1.5)],
+            text_fallback=stub("text", latency=LATENCY_SECONDS / 4, jitter=0, no_image_rate=1.0),
+            deadline=DEADLINE_SECONDS,
+            # The benchmark's calls hold no slots, so this only bounds the hedges
+            executor=GenerationExecutor(CONCURRENCY, 0, 1),
+        )
+        routed = await drive(router)
+        stats = router.stats()
+        opened = sum(route["times_opened"] for route in stats["routes"])
+        print_row("router", routed, f"  (hedges {stats['hedges']}, won {stats['hedge_wins']}, "
+                                    f"breaker opened {opened}x, text-only {stats['text_fallbacks']})")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,95 @@
+"""Benchmark serial vs concurrent image fetching against a local stub HTTP server.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_image_fetch
+
+Each stub image is served after its own artificial delay. The serial loop (what
+`try_on` used to do) takes the sum of the delays, while `fetch_images` should
+take roughly the slowest one.
+"""
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from utils.image_cache import image_cache
+from utils.image_fetcher import close_http_client, fetch_images
+
+DELAYS = [0.2, 0.3, 0.5, 0.25, 0.4, 0.35, 0.15, 0.45]
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64 * 1024
+
+
+class StubImageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        delay = float(self.path.split("?", 1)[0].rsplit("/", 1)[-1])
+        time.sleep(delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(PNG_BYTES)))
+        self.end_headers()
+        self.wfile.write(PNG_BYTES)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubImageServer(ThreadingHTTPServer):
+    # The default backlog of 5 drops SYNs when all images are requested at once.
+    request_queue_size = 64
+
+
+def serial_fetch(urls):
+    with httpx.Client(timeout=10) as client:
+        return [client.get(url).content for url in urls]
+
+
+async def concurrent_fetch(urls):
+    # The first round opens the pooled connections; the second shows the keep-alive steady state.
+    # Each round uses fresh query strings so the image cache doesn't short-circuit the network.
+    timings = []
+    for round_number in range(2):
+        start = time.perf_counter()
+        results = await fetch_images([f"{url}?round={round_number}" for url in urls])
+        timings.append(time.perf_counter() - start)
+    # Repeating a round is what a repeat render looks like: every image comes from the cache.
+    start = time.perf_counter()
+    await fetch_images([f"{url}?round=0" for url in urls])
+    timings.append(time.perf_counter() - start)
+    await close_http_client()
+    return results, timings
+
+
+def main():
+    server = StubImageServer(("127.0.0.1", 0), StubImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base}/image/{delay}" for delay in DELAYS]
+
+    try:
+        start = time.perf_counter()
+        serial_fetch(urls)
+        serial_elapsed = time.perf_counter() - start
+
+        results, (cold_elapsed, warm_elapsed, cached_elapsed) = asyncio.run(concurrent_fetch(urls))
+    finally:
+        server.shutdown()
+
+    print(f"images:             {len(urls)}")
+    print(f"sum of delays:      {sum(DELAYS):.2f}s")
+    print(f"slowest delay:      {max(DELAYS):.2f}s")
+    print(f"serial fetch:       {serial_elapsed:.2f}s")
+    print(f"concurrent (cold):  {cold_elapsed:.2f}s")
+    print(f"concurrent (warm):  {warm_elapsed:.2f}s")
+    print(f"repeat (cached):    {cached_elapsed:.3f}s")
+    print(f"image cache:        {image_cache.stats()}")
+    print(f"sniffed mime types: {sorted({r.mime_type for r in results if r.ok})}")
+    print(f"failures:           {[r.error for r in results if not r.ok]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Benchmark the upload normalization pipeline over the repository's sample images.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_image_pipeline
+
+For every image in ../examples and ../screenshots it reports the upload size before and
+after normalization, the base64 payload the model request would carry, and the time spent
+decoding, resizing and encoding.
+"""
+import base64
+import glob
+import os
+
+from utils.image_pipeline import IMAGE_MAX_EDGE_PX, normalize_image_bytes
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+IMAGE_GLOBS = ["examples/*", "screenshots/*"]
+
+
+def main():
+    paths = sorted(path for pattern in IMAGE_GLOBS for path in glob.glob(os.path.join(REPO_ROOT, pattern)))
+    print(f"max edge: {IMAGE_MAX_EDGE_PX}px")
+    print(f"{'image':<28} {'size':>11} {'->':>2} {'size':>11} {'before':>9} {'after':>6} {'decode':>9} {'resize':>9} {'encode':>9}")
+
+    total_in = total_out = payload_in = payload_out = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        normalized, mime_type, stats = normalize_image_bytes(data)
+
+        before_payload = len(base64.b64encode(data))
+        after_payload = len(base64.b64encode(normalized))
+        total_in += len(data)
+        total_out += len(normalized)
+        payload_in += before_payload
+        payload_out += after_payload
+
+        name = os.path.relpath(path, REPO_ROOT)
+        source = "x".join(map(str, stats["source_size"]))
+        output = "x".join(map(str, stats["output_size"]))
+        print(
+            f"{name:<28} {source:>11} {'->':>2} {output:>11} "
+            f"{len(data) / 1024:>7.0f}KB {len(normalized) / 1024:>4.0f}KB "
+            f"{stats['decode_ms']:>7.1f}ms {stats['resize_ms']:>7.1f}ms {stats['encode_ms']:>7.1f}ms"
+        )
+
+    print()
+    print(f"upload bytes:        {total_in} -> {total_out} ({100 * (1 - total_out / total_in):.1f}% smaller)")
+    print(f"model payload (b64): {payload_in} -> {payload_out} ({100 * (1 - payload_out / payload_in):.1f}% smaller)")
+
+
+if __name__ == "__main__":
+    main()
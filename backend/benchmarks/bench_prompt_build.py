@@ -0,0 +1,152 @@
+"""Compare the CPU time and allocations of building a try-on model request, before and after
+compiled prompt templates, memoized furniture parts and structured logging.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_prompt_build
+
+The legacy path is the previous code: an f-string prompt with a furniture section built by
+concatenation, ``print`` of the whole prompt and a fresh ``types.Part`` for every furniture
+image (whose bytes it is handed, so the image fetch itself is not counted). The current path
+renders the compiled template, reuses the cached furniture parts and logs the prompt at debug
+level, which is off by default. Both build the ``Part`` of the uploaded room image.
+"""
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+from google.genai import types
+from PIL import Image
+
+os.environ.setdefault("IMAGE_CACHE_DIR", tempfile.mkdtemp(prefix="bench-prompt-"))
+
+from utils.image_cache import cache_image
+from utils.prompts import furniture_part_cache, try_on_prompt
+from utils.structured_log import get_logger
+
+FURNITURE_COUNT = 4
+REQUESTS = 2_000
+ALLOCATION_SAMPLES = 200
+
+logger = get_logger("bench")
+FIELDS = {
+    "design_type": "Interior",
+    "room_type": "Living Room",
+    "style": "Modern",
+    "background_color": "white",
+    "foreground_color": "oak",
+    "instructions": "Keep the window and add plants near it",
+}
+
+
+def _jpeg(seed: int, size: int = 768) -> bytes:
+    buffer = io.BytesIO()
+    Image.effect_mandelbrot((size, size), (-2 + seed * 0.1, -1.5, 1, 1.5), 60).convert("RGB").save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+FURNITURE = [
+    {"id": f"furniture-{i}", "name": f"Armchair {i}", "category": "chair", "image_url": f"http://bench/furniture/{i}.jpg"}
+    for i in range(FURNITURE_COUNT)
+]
+FURNITURE_BYTES = {furniture["image_url"]: _jpeg(i) for i, furniture in enumerate(FURNITURE)}
+PLACE_BYTES = _jpeg(10, 1024)
+
+
+async def legacy_request(sink) -> list:
+    furniture_info = "\n\n### User's Furniture to Include:\n"
+    furniture_parts = []
+    for idx, furniture in enumerate(FURNITURE):
+        furniture_info += f"{idx + 1}. **{furniture['name']}** (Category: {furniture['category']})\n"
+    for furniture in FURNITURE:
+        furniture_parts.append(types.Part.from_bytes(data=FURNITURE_BYTES[furniture["image_url"]], mime_type="image/jpeg"))
+
+    prompt = f"""
+    You are a professional AI interior and exterior designer.
+    Your task is to redesign a user's uploaded space.
+
+    ### User Input
+    - **Design Type:** {FIELDS['design_type']}
+    - **Room Type:** {FIELDS['room_type']}
+    - **Style:** {FIELDS['style']}
+    - **Background Color Preference:** {FIELDS['background_color']}
+    - **Foreground Color Preference:** {FIELDS['foreground_color']}
+    - **Instructions:** {FIELDS['instructions']}
+    {furniture_info}
+
+    ### Objective:
+    1. Apply the chosen design style (e.g., {FIELDS['style']}) to the uploaded {FIELDS['room_type']}.
+    2. Enhance the space visually while respecting the structure of the original layout.
+    3. Harmonize background/foreground color preferences subtly in the decor.
+    4. Produce a **photo-realistic redesign image** and a **short textual description**.
+    5. You don't need change any structure of the room, just the design.
+    6. The design should be realistic and practical for the user.
+    7. The design should be aligned with the user's preferences and instructions.
+    8. Also return the cost and time required for the redesign.
+    9. Return the cost of design and the the in depth description of the design.
+    10. Return all colors of the design in hex format.
+    11. Return cost of the design in USD.
+    12. **IMPORTANT**: If user furniture images are provided, naturally integrate them into the redesigned space. Place them appropriately based on their category and the room layout. Make sure they blend seamlessly with the overall design aesthetic.
+
+    Return:
+    - A realistic redesigned image of the space.
+    - A short caption describing the redesign, highlighting how it aligns with the selected preferences and suggesting improvements.
+    """
+    with contextlib.redirect_stdout(sink):
+        print(prompt)
+    contents = [prompt, types.Part.from_bytes(data=PLACE_BYTES, mime_type="image/jpeg")]
+    contents.extend(furniture_parts)
+    return contents
+
+
+async def current_request(sink) -> list:
+    lines, furniture_parts, _ = await furniture_part_cache.get_many(FURNITURE)
+    prompt = try_on_prompt(FIELDS, lines)
+    logger.debug("prompt", operation="try-on", prompt=prompt, furniture=len(furniture_parts))
+    contents = [prompt, types.Part.from_bytes(data=PLACE_BYTES, mime_type="image/jpeg")]
+    contents.extend(furniture_parts)
+    return contents
+
+
+async def measure(build, sink) -> tuple[float, float, int]:
+    for _ in range(50):
+        await build(sink)
+
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    for _ in range(REQUESTS):
+        await build(sink)
+    cpu_us = (time.process_time() - cpu_started) / REQUESTS * 1_000_000
+    wall_us = (time.perf_counter() - wall_started) / REQUESTS * 1_000_000
+
+    tracemalloc.start()
+    allocated = 0
+    for _ in range(ALLOCATION_SAMPLES):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        await build(sink)
+        allocated += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return cpu_us, wall_us, allocated // ALLOCATION_SAMPLES
+
+
+async def run():
+    for url, data in FURNITURE_BYTES.items():
+        await cache_image(url, data)
+    print(f"{FURNITURE_COUNT} furniture images ({sum(map(len, FURNITURE_BYTES.values())) // 1024} KB), {REQUESTS} requests")
+    with open(os.devnull, "w") as sink:
+        results = {}
+        for label, build in [("legacy", legacy_request), ("current", current_request)]:
+            results[label] = await measure(build, sink)
+            cpu_us, wall_us, peak = results[label]
+            print(f"{label:<8} cpu {cpu_us:>7.1f}us  wall {wall_us:>7.1f}us  peak allocation {peak / 1024:>7.1f} KB per request")
+    (legacy_cpu, _, legacy_peak), (current_cpu, _, current_peak) = results["legacy"], results["current"]
+    print(f"cpu saved {legacy_cpu - current_cpu:.1f}us per request ({1 - current_cpu / legacy_cpu:.0%}), "
+          f"allocation saved {(legacy_peak - current_peak) / 1024:.1f} KB ({1 - current_peak / legacy_peak:.0%})")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,78 @@
+"""Measure the per-request overhead of the generation rate limiter.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_rate_limit
+
+Calls ``RateLimiter.check`` with the in-memory store for requests from many distinct
+clients, keyed both by address and by API key, on the allowed path and on the rejected
+path (which raises a 429 from a client's already drained bucket). The budget is well under a millisecond per request.
+"""
+import asyncio
+import time
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from utils.rate_limit import MemoryBucketStore, RateLimiter
+
+CLIENTS = 10_000
+CHECKS = 200_000
+
+
+def make_request(i: int, api_key: bool) -> Request:
+    headers = [(b"content-length", b"2500000")]
+    if api_key:
+        headers.append((b"x-api-key", f"key-{i}".encode()))
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/api/try-on",
+        "headers": headers,
+        "client": (f"10.0.{i // 256 % 256}.{i % 256}", 50000),
+    })
+
+
+async def measure(limiter: RateLimiter, requests: list[Request]) -> tuple[list[float], int]:
+    samples = []
+    rejected = 0
+    for i in range(CHECKS):
+        request = requests[i % len(requests)]
+        started = time.perf_counter()
+        try:
+            await limiter.check(request, images=4)
+        except HTTPException:
+            rejected += 1
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    samples.sort()
+    return samples, rejected
+
+
+async def drain(limiter: RateLimiter, requests: list[Request]):
+    """Empty every client's bucket, so each check is refused on the 429 path."""
+    for request in requests:
+        await limiter.store.take(limiter.client_key(request), limiter.capacity, limiter.capacity, limiter.refill_per_second)
+
+
+async def run():
+    for label, api_key, capacity, drained in [
+        ("by address, allowed", False, 1e12, False),
+        ("by API key, allowed", True, 1e12, False),
+        # A request costs less than the capacity, so it is refused by the empty bucket, not the 413
+        ("by address, rejected", False, 20.0, True),
+    ]:
+        requests = [make_request(i, api_key) for i in range(CLIENTS)]
+        limiter = RateLimiter(MemoryBucketStore(CLIENTS), capacity=capacity, refill_per_minute=0.001, enabled=True)
+        if drained:
+            await drain(limiter, requests)
+        samples, rejected = await measure(limiter, requests)
+        stats = limiter.stats()
+        assert stats["too_large"] == 0
+        assert stats["limited"] == (CHECKS if drained else 0)
+        mean = sum(samples) / len(samples)
+        p99 = samples[int(0.99 * len(samples))]
+        print(f"{label:<22} mean {mean:>6.2f}us  p50 {samples[len(samples) // 2]:>6.2f}us  "
+              f"p99 {p99:>6.2f}us  max {samples[-1]:>8.2f}us  ({rejected} rejected, {stats['limited']} limited)")
+
+if __name__ == "__main__":
+    asyncio.run(run())
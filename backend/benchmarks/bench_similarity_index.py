@@ -0,0 +1,86 @@
+"""Measure build time and query latency of the perceptual-hash similarity index.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_similarity_index
+
+Fills a ``SimilarityIndex`` with 100k synthetic entries spread over 20 categories, as the
+loader would from the table, then times top-10 queries with and without a category filter
+and with a near-duplicate ``max_distance``. Every query hash is a copy of a stored entry
+with a few bits flipped, and the benchmark checks that entry comes back first.
+"""
+import asyncio
+import os
+import time
+
+import numpy as np
+
+# The index module creates the app's instances on import; nothing here talks to Supabase
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench")
+
+from utils.image_pipeline import HISTOGRAM_BINS
+from utils.similarity_index import SimilarityIndex, to_signed64
+
+ITEMS = 100_000
+CATEGORIES = 20
+QUERIES = 2_000
+FLIPPED_BITS = 3
+
+
+def make_rows(rng: np.random.Generator) -> list[dict]:
+    hashes = rng.integers(0, 2 ** 64, ITEMS, dtype=np.uint64)
+    histograms = rng.dirichlet(np.ones(HISTOGRAM_BINS), ITEMS).astype(np.float32)
+    return [
+        {
+            "id": f"item-{i}",
+            "category": f"category-{i % CATEGORIES}",
+            "phash": to_signed64(int(hashes[i])),
+            "color_hist": histograms[i].tolist(),
+        }
+        for i in range(ITEMS)
+    ]
+
+
+def near_duplicate(rng: np.random.Generator, phash: int) -> int:
+    for bit in rng.choice(64, FLIPPED_BITS, replace=False):
+        phash ^= 1 << int(bit)
+    return phash
+
+
+async def run():
+    rng = np.random.default_rng(7)
+    rows = make_rows(rng)
+
+    async def loader():
+        for row in rows:
+            yield row
+
+    index = SimilarityIndex("bench", loader, group_column="category")
+    started = time.perf_counter()
+    await index.ready()
+    print(f"built {len(index)} entries in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    targets = rng.choice(ITEMS, QUERIES)
+    for label, use_category, max_distance in [
+        ("all items", False, None),
+        ("one category", True, None),
+        ("all items, max_distance=10", False, 10),
+    ]:
+        samples = []
+        misses = 0
+        for i in targets.tolist():
+            row = rows[i]
+            phash = near_duplicate(rng, int(index.get(row["id"])[0]))
+            category = row["category"] if use_category else None
+            started = time.perf_counter()
+            matches = index.query(phash, row["color_hist"], k=10, max_distance=max_distance, group=category)
+            samples.append((time.perf_counter() - started) * 1000)
+            misses += not matches or matches[0][0] != row["id"]
+        samples.sort()
+        print(f"{label:<28} p50 {samples[len(samples) // 2]:.3f}ms  p99 {samples[int(0.99 * len(samples))]:.3f}ms  "
+              f"max {samples[-1]:.3f}ms  ({misses} of {QUERIES} planted matches not ranked first)")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
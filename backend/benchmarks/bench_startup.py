@@ -0,0 +1,119 @@
+"""Measure how long a worker takes to import the app and finish startup, against a budget.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_startup [--runs 5] [--budget-ms 2500]
+
+Each run is a fresh interpreter. ``python -X importtime -c "import main"`` gives the import
+time of ``main`` and the slowest top-level imports. A second interpreter imports the app and
+runs its lifespan startup with the stub backend and placeholder Supabase settings, then
+reads the client registry to check that no network client was created on the way.
+
+Exits with status 1 when the median import time is over ``--budget-ms`` (default
+``STARTUP_IMPORT_BUDGET_MS``) or a client was created before the first request.
+``tests/test_startup.py`` asserts the same budget under pytest.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "2500"))
+
+STARTUP_PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def startup():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter(), main.clients.created()
+
+ready, created = asyncio.run(startup())
+print(json.dumps({"import_ms": (imported - started) * 1000, "ready_ms": (ready - started) * 1000, "clients": created}))
+"""
+
+
+def probe_env() -> dict:
+    """The environment of the measured interpreters: stub backend, placeholder Supabase, no exporter."""
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": env.get("SUPABASE_URL") or "http://127.0.0.1:1",
+        "SUPABASE_SERVICE_ROLE_KEY": env.get("SUPABASE_SERVICE_ROLE_KEY") or "bench",
+        "GENERATION_BACKEND": "stub",
+        "JOB_DB_PATH": os.path.join(tempfile.mkdtemp(prefix="bench-startup-"), "jobs.sqlite3"),
+        "TRACING_EXPORT": "",
+    })
+    return env
+
+
+def import_times(env: dict) -> tuple[float, list[tuple[float, str]]]:
+    """Import time of ``main`` in ms, and ``(cumulative ms, module)`` of its direct imports."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    total = 0.0
+    top_level = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        ms = int(cumulative) / 1000
+        if name.strip() == "main":
+            total = ms
+        elif depth == 1:
+            top_level.append((ms, name.strip()))
+    return total, sorted(top_level, reverse=True)
+
+
+def startup(env: dict) -> dict:
+    result = subprocess.run([sys.executable, "-c", STARTUP_PROBE], env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_IMPORT_BUDGET_MS)
+    args = parser.parse_args()
+
+    env = probe_env()
+    imports, ready, created = [], [], set()
+    slowest = []
+    for _ in range(args.runs):
+        total, top_level = import_times(env)
+        imports.append(total)
+        slowest = top_level
+        probe = startup(env)
+        ready.append(probe["ready_ms"])
+        created.update(probe["clients"])
+
+    import_ms = statistics.median(imports)
+    print(f"import main     median {import_ms:7.1f} ms  (min {min(imports):.1f}, max {max(imports):.1f}) over {args.runs} runs")
+    print(f"startup ready   median {statistics.median(ready):7.1f} ms  (import + lifespan startup)")
+    print("slowest imports of main (last run):")
+    for ms, name in slowest[:10]:
+        print(f"  {ms:7.1f} ms  {name}")
+
+    failed = False
+    if import_ms > args.budget_ms:
+        print(f"FAIL: import time {import_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if created:
+        print(f"FAIL: clients created before the first request: {', '.join(sorted(created))}")
+        failed = True
+    if not failed:
+        print(f"OK: within the {args.budget_ms:.0f} ms budget, no clients created at startup")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Load test the furniture endpoints against a local PostgREST/Storage stand-in.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_supabase_load
+
+The stand-in answers every PostgREST and Storage call after a fixed latency. Requests are
+driven through the ASGI app at increasing concurrency, once with the old handlers (the
+synchronous client called inside ``async def``) and once with the async repository layer.
+Blocking calls serialize the event loop, so only the repository layer should scale.
+"""
+import asyncio
+import os
+import time
+import uuid
+
+import httpx
+
+from benchmarks.supabase_stub import PNG_BYTES, start_stub_supabase
+
+LATENCY_SECONDS = 0.02
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+LIST_REQUESTS = 100
+UPLOAD_REQUESTS = 50
+
+
+def build_apps():
+    from fastapi import FastAPI, File, Form, UploadFile
+    from supabase import create_client
+
+    from config.supabase_client import SUPABASE_SERVICE_ROLE_KEY, SUPABASE_URL
+    from routers import furniture
+
+    sync_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    blocking_app = FastAPI()
+
+    @blocking_app.get("/api/furniture/list")
+    async def blocking_list(category: str = None):
+        response = sync_client.table("furniture_items").select("*").eq("category", category).execute()
+        return {"furniture": response.data}
+
+    @blocking_app.post("/api/furniture/upload")
+    async def blocking_upload(furniture_image: UploadFile = File(...), name: str = Form(...), category: str = Form(...)):
+        data = await furniture_image.read()
+        path = f"furniture/{uuid.uuid4()}.png"
+        sync_client.storage.from_("furniture-images").upload(path=path, file=data, file_options={"content-type": "image/png"})
+        public_url = sync_client.storage.from_("furniture-images").get_public_url(path)
+        response = sync_client.table("furniture_items").insert({"name": name, "category": category, "image_url": public_url}).execute()
+        return {"id": response.data[0]["id"]}
+
+    repository_app = FastAPI()
+    repository_app.include_router(furniture.router, prefix="/api")
+    return blocking_app, repository_app
+
+
+async def drive(app, concurrency: int, total: int, make_request) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        counter = iter(range(total))
+
+        async def worker():
+            for i in counter:
+                response = await make_request(client, i)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return total / (time.perf_counter() - start)
+
+
+def list_request(client, i):
+    # A distinct category per request keeps the query cache and single-flight out of the measurement
+    return client.get("/api/furniture/list", params={"category": f"bench-{i}"})
+
+
+def upload_request(client, i):
+    return client.post(
+        "/api/furniture/upload",
+        data={"name": f"Chair {i}", "category": "chair"},
+        files={"furniture_image": ("chair.png", PNG_BYTES, "image/png")},
+    )
+
+
+async def run(blocking_app, repository_app):
+    from config.supabase_client import close_supabase
+
+    for label, make_request, total in [("GET /api/furniture/list", list_request, LIST_REQUESTS),
+                                       ("POST /api/furniture/upload", upload_request, UPLOAD_REQUESTS)]:
+        print(f"\n{label} ({total} requests, {LATENCY_SECONDS * 1000:.0f}ms per Supabase call)")
+        print(f"{'concurrency':>11} {'blocking client':>17} {'async repository':>18}")
+        for concurrency in CONCURRENCY_LEVELS:
+            blocking = await drive(blocking_app, concurrency, total, make_request)
+            repository = await drive(repository_app, concurrency, total, make_request)
+            print(f"{concurrency:>11} {blocking:>13.1f} r/s {repository:>14.1f} r/s")
+    await close_supabase()
+
+
+def main():
+    server = start_stub_supabase(LATENCY_SECONDS)
+    os.environ["QUERY_CACHE_FURNITURE_TTL_SECONDS"] = "0"
+    os.environ["QUERY_CACHE_STALE_SECONDS"] = "0"
+
+    try:
+        asyncio.run(run(*build_apps()))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
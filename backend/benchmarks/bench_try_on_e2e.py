@@ -0,0 +1,143 @@
+"""Drive ``POST /api/try-on`` end to end against the stub model backend and the Supabase stand-in.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_try_on_e2e
+
+Nothing leaves the machine: generations go to ``StubBackend`` and every database, Storage
+and furniture image call to the local stand-in. Each request uploads a distinct room image
+with three furniture ids, so the result cache never answers, and runs the whole path: image
+normalization, furniture lookup and fetch, generation, both uploads and the row insert.
+The ``STUB_*`` and ``GENERATION_MAX_*`` variables can be set to try other mixes; the
+defaults fix the seed so repeated runs see the same delays and failures.
+"""
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+import httpx
+from PIL import Image
+
+from benchmarks.supabase_stub import start_stub_supabase
+
+SUPABASE_LATENCY_SECONDS = 0.02
+CONCURRENCY_LEVELS = [1, 4, 16, 32]
+REQUESTS_PER_WORKER = 4
+MIN_REQUESTS = 16
+FURNITURE_IDS = ",".join(str(uuid.uuid4()) for _ in range(3))
+
+ENV_DEFAULTS = {
+    "GENERATION_BACKEND": "stub",
+    "STUB_LATENCY_SECONDS": "0.5",
+    "STUB_LATENCY_JITTER_SECONDS": "0.25",
+    "STUB_FAILURE_RATE": "0.05",
+    "STUB_NO_IMAGE_RATE": "0",
+    "STUB_SEED": "bench",
+    # Every benchmark request comes from the same client
+    "RATE_LIMIT_ENABLED": "false",
+}
+
+
+def room_image(i: int) -> bytes:
+    image = Image.new("RGB", (1600, 1200), ((i * 37) % 256, (i * 91) % 256, (i * 53) % 256))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+
+
+async def drive(app, concurrency: int, images: list[bytes]) -> tuple[float, list[float], Counter]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        counter = iter(range(len(images)))
+        latencies = []
+        statuses = Counter()
+
+        async def worker():
+            for i in counter:
+                started = time.perf_counter()
+                response = await client.post(
+                    "/api/try-on",
+                    data={
+                        "design_type": "Interior",
+                        "room_type": "Living Room",
+                        "style": "Modern",
+                        "background_color": "white",
+                        "foreground_color": "oak",
+                        "furniture_ids": FURNITURE_IDS,
+                    },
+                    files={"place_image": (f"room-{i}.jpg", images[i], "image/jpeg")},
+                )
+                statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return len(images) / (time.perf_counter() - start), sorted(latencies), statuses
+
+
+async def run():
+    from main import app
+    from config.supabase_client import close_supabase
+    from utils.generation_backend import close_generation_backend, get_generation_backend
+    from utils.generation_output import generation_latency
+    from utils.image_fetcher import close_http_client
+
+    backend = get_generation_backend().routes[0].backend
+    print(
+        f"Stub backend: {backend.latency * 1000:.0f}ms + up to {backend.jitter * 1000:.0f}ms jitter, "
+        f"{backend.failure_rate:.0%} failures, {backend.no_image_rate:.0%} text-only; "
+        f"Supabase stand-in {SUPABASE_LATENCY_SECONDS * 1000:.0f}ms per call"
+    )
+    print(f"{'concurrency':>11} {'requests':>9} {'throughput':>12} {'p50':>9} {'p95':>9} {'p99':>9}  statuses")
+
+    offset = 0
+    for concurrency in CONCURRENCY_LEVELS:
+        total = max(MIN_REQUESTS, concurrency * REQUESTS_PER_WORKER)
+        images = [room_image(offset + i) for i in range(total)]
+        offset += total
+        # The handlers log every prompt, response and simulated failure; keep the table readable
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            throughput, latencies, statuses = await drive(app, concurrency, images)
+        summary = " ".join(f"{status}x{count}" for status, count in sorted(statuses.items()))
+        print(
+            f"{concurrency:>11} {total:>9} {throughput:>8.2f} r/s "
+            f"{percentile(latencies, 0.5):>7.0f}ms {percentile(latencies, 0.95):>7.0f}ms "
+            f"{percentile(latencies, 0.99):>7.0f}ms  {summary}"
+        )
+
+    print("\nGeneration latency including queue wait (GET /api/system/generation-latency):")
+    for operation, stats in generation_latency.snapshot().items():
+        print(f"  {operation}: {stats['calls']} calls, total {stats['total']}")
+
+    await close_http_client()
+    await close_generation_backend()
+    await close_supabase()
+
+
+def main():
+    server = start_stub_supabase(SUPABASE_LATENCY_SECONDS)
+    for name, value in ENV_DEFAULTS.items():
+        os.environ.setdefault(name, value)
+    os.environ.setdefault("JOB_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench-jobs.sqlite3"))
+
+    try:
+        asyncio.run(run())
+    finally:
+        from utils.image_pipeline import shutdown_image_pipeline
+
+        shutdown_image_pipeline()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
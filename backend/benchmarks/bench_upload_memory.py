@@ -0,0 +1,118 @@
+"""Benchmark peak Python memory per upload request, old buffering vs chunked validation.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_upload_memory
+
+A multipart body is streamed into a minimal ASGI app in 64 KB messages (nothing is built
+up front), once through an endpoint that does ``await file.read()`` and checks the size
+afterwards, and once through ``read_upload`` behind ``RequestBodyLimitMiddleware``.
+Peak memory is measured with tracemalloc, so it covers everything the request allocates.
+"""
+import asyncio
+import tracemalloc
+
+from fastapi import FastAPI, File, HTTPException, UploadFile
+
+from utils.uploads import MAX_IMAGE_SIZE_BYTES, RequestBodyLimitMiddleware, read_upload
+
+BOUNDARY = "benchboundary"
+MESSAGE_SIZE = 64 * 1024
+SIZES_MB = [1, 8, 50, 200]
+
+buffering_app = FastAPI()
+streaming_app = FastAPI()
+
+
+@buffering_app.post("/upload")
+async def buffered_upload(image: UploadFile = File(...)):
+    data = await image.read()
+    if len(data) > MAX_IMAGE_SIZE_BYTES:
+        raise HTTPException(status_code=400, detail="Image exceeds 10MB size limit")
+    return {"size": len(data)}
+
+
+@streaming_app.post("/upload")
+async def streamed_upload(image: UploadFile = File(...)):
+    upload = await read_upload(image, "image")
+    return {"size": upload.size}
+
+
+def body_messages(size: int, send_length: bool):
+    head = (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="image"; filename="room.png"\r\n'
+        "Content-Type: image/png\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+    total = len(head) + size + len(tail)
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if send_length:
+        headers.append((b"content-length", str(total).encode()))
+
+    async def messages():
+        yield head + b"\x89PNG\r\n\x1a\n"
+        remaining = size - 8
+        chunk = b"\x00" * MESSAGE_SIZE
+        while remaining > 0:
+            yield chunk[:min(MESSAGE_SIZE, remaining)]
+            remaining -= MESSAGE_SIZE
+        yield tail
+
+    return headers, messages()
+
+
+async def run_request(app, size: int, send_length: bool) -> tuple[int, int]:
+    headers, messages = body_messages(size, send_length)
+    status = None
+
+    async def receive():
+        try:
+            return {"type": "http.request", "body": await messages.__anext__(), "more_body": True}
+        except StopAsyncIteration:
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/upload",
+        "raw_path": b"/upload",
+        "query_string": b"",
+        "root_path": "",
+        "headers": headers,
+        "client": ("127.0.0.1", 1234),
+        "server": ("127.0.0.1", 80),
+    }
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    await app(scope, receive, send)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return status, peak
+
+
+def main():
+    limited_app = RequestBodyLimitMiddleware(streaming_app, max_body_bytes=2 * MAX_IMAGE_SIZE_BYTES)
+    print(f"{'upload':>8} {'mode':<32} {'status':>6} {'peak memory':>12}")
+    for size_mb in SIZES_MB:
+        size = size_mb * 1024 * 1024
+        for label, app, send_length in [
+            ("read() then check", buffering_app, True),
+            ("chunked, Content-Length", limited_app, True),
+            ("chunked, no Content-Length", limited_app, False),
+        ]:
+            status, peak = asyncio.run(run_request(app, size, send_length))
+            print(f"{size_mb:>6}MB {label:<32} {status:>6} {peak / (1024 * 1024):>10.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
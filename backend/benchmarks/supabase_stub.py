@@ -0,0 +1,117 @@
+"""A local PostgREST/Storage stand-in shared by the benchmarks.
+
+Every call is answered after a fixed latency. Table reads return ``furniture_items`` or
+``room_designs`` rows (only the requested ids for ``id=in.(...)`` and ``id=eq.`` filters)
+whose image URLs point back at the stand-in, inserts echo their rows with fresh ids,
+Storage uploads are acknowledged and public object URLs serve a small PNG.
+"""
+import io
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from PIL import Image
+
+
+def _png(size: int = 256) -> bytes:
+    buffer = io.BytesIO()
+    Image.linear_gradient("L").resize((size, size)).convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+PNG_BYTES = _png()
+IN_FILTER = re.compile(r"id=in\.\(([^)]*)\)")
+EQ_FILTER = re.compile(r"id=eq\.([^&]+)")
+
+
+class StubSupabaseHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Without TCP_NODELAY, delayed ACKs add ~40ms to every call and swamp the simulated latency
+    disable_nagle_algorithm = True
+
+    def _send(self, body: bytes, content_type: str):
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply(self, payload):
+        self._send(json.dumps(payload).encode(), "application/json")
+
+    def _furniture_row(self, furniture_id: str, i: int) -> dict:
+        host, port = self.server.server_address
+        return {
+            "id": furniture_id, "name": f"Chair {i}", "category": "chair",
+            "image_url": f"http://{host}:{port}/storage/v1/object/public/furniture-images/furniture/chair-{i % 4}.png",
+            "phash": i * 0x0101010101, "color_hist": None, "created_at": "2026-01-01T00:00:00+00:00",
+        }
+
+    def _room_design_row(self, design_id: str, i: int) -> dict:
+        host, port = self.server.server_address
+        base = f"http://{host}:{port}/storage/v1/object/public/room-images/room-designs"
+        return {
+            "id": design_id, "design_type": "Interior", "room_type": "Living Room", "style": "Modern",
+            "background_color": "white", "foreground_color": "oak", "instructions": "",
+            "original_image_url": f"{base}/originals/original-{i % 4}.png",
+            "generated_image_url": f"{base}/generated/generated-{i % 4}.png",
+            "generated_phash": i * 0x0101010101, "generated_color_hist": None,
+            "description": "A stored design", "created_at": "2026-01-01T00:00:00+00:00",
+        }
+
+    def do_GET(self):
+        if self.path.startswith("/storage/v1/object/public/"):
+            self._send(PNG_BYTES, "image/png")
+            return
+        path = unquote(self.path)
+        if match := IN_FILTER.search(path):
+            ids = [i.strip('"') for i in match.group(1).split(",")]
+        elif match := EQ_FILTER.search(path):
+            ids = [match.group(1)]
+        else:
+            ids = [str(uuid.uuid4()) for _ in range(20)]
+        make_row = self._room_design_row if path.startswith("/rest/v1/room_designs") else self._furniture_row
+        rows = [make_row(row_id, i) for i, row_id in enumerate(ids)]
+        if "vnd.pgrst.object" in self.headers.get("Accept", ""):
+            self._reply(rows[0])
+        else:
+            self._reply(rows)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/storage/"):
+            self._reply({"Key": self.path, "Id": str(uuid.uuid4())})
+            return
+        rows = json.loads(body or b"{}")
+        rows = rows if isinstance(rows, list) else [rows]
+        self._reply([{**row, "id": str(uuid.uuid4())} for row in rows])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubSupabaseServer(ThreadingHTTPServer):
+    request_queue_size = 256
+    daemon_threads = True
+
+    def __init__(self, latency: float):
+        super().__init__(("127.0.0.1", 0), StubSupabaseHandler)
+        self.latency = latency
+
+
+def start_stub_supabase(latency: float) -> StubSupabaseServer:
+    """Serve the stand-in on a free port and point ``SUPABASE_URL`` at it.
+
+    Call before the app modules are imported; they read the Supabase settings at import time.
+    """
+    server = StubSupabaseServer(latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["SUPABASE_SERVICE_ROLE_KEY"] = "bench"
+    return server
@@ -0,0 +1,92 @@
+import os
+import threading
+import traceback
+from typing import Any, Awaitable, Callable, Optional
+
+
+class ClientRegistry:
+    """The process-wide network clients (Supabase, image downloads, the model backend), each
+    created on first use and closed together at shutdown.
+
+    Nothing connects at import, so the production server can import the app once and fork
+    its workers from it. A client that was created before a fork anyway is forgotten in the
+    child, without closing the parent's connections, and rebuilt there on first use. The
+    app lifespan checks every client's configuration at startup and closes the clients that
+    were created, newest first, at shutdown.
+
+    The registry itself exists from import, not from the lifespan: modules register their
+    clients as they are imported, and scripts, which have no lifespan, use the same clients.
+    """
+
+    def __init__(self):
+        self._factories: dict[str, tuple[Callable[[], Any], Optional[Callable[[Any], Awaitable[None]]], Optional[Callable[[], None]]]] = {}
+        self._clients: dict[str, Any] = {}
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forget_all)
+
+    def register(
+        self,
+        name: str,
+        create: Callable[[], Any],
+        close: Optional[Callable[[Any], Awaitable[None]]] = None,
+        check: Optional[Callable[[], None]] = None,
+    ):
+        """Declare a client; ``check`` raises ``ValueError`` when its settings are missing or invalid."""
+        self._factories[name] = (create, close, check)
+
+    def get(self, name: str) -> Any:
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                create, _, _ = self._factories[name]
+                client = self._clients[name] = create()
+            return client
+
+    def peek(self, name: str) -> Optional[Any]:
+        """The client if it was created already, without creating it."""
+        return self._clients.get(name)
+
+    def check_config(self):
+        """Validate every registered client's settings without creating any, so a misconfigured
+        server fails at startup rather than on its first request."""
+        errors = []
+        for name, (_, _, check) in self._factories.items():
+            if check is None:
+                continue
+            try:
+                check()
+            except ValueError as e:
+                errors.append(f"{name}: {e}")
+        if errors:
+            raise ValueError("; ".join(errors))
+
+    async def close(self, name: str):
+        with self._lock:
+            client = self._clients.pop(name, None)
+        if client is None:
+            return
+        _, close, _ = self._factories[name]
+        if close is not None:
+            await close(client)
+
+    async def aclose(self):
+        for name in reversed(list(self._clients)):
+            try:
+                await self.close(name)
+            except Exception as e:
+                print(f"Failed to close {name} client: {e}")
+                traceback.print_exc()
+
+    def created(self) -> list[str]:
+        return list(self._clients)
+
+    def _forget_all(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+
+
+clients = ClientRegistry()
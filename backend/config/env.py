@@ -0,0 +1,19 @@
+import threading
+
+from dotenv import load_dotenv
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_env():
+    """Load ``backend/.env`` into the environment once per process.
+
+    Modules read their settings with ``os.getenv`` at import, so entry points call this
+    before importing anything else; later calls do nothing.
+    """
+    global _loaded
+    with _lock:
+        if not _loaded:
+            load_dotenv()
+            _loaded = True
@@ -1,13 +1,63 @@
 import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
 
-load_dotenv()
+import httpx
+from supabase import AsyncClient, AsyncClientOptions
+
+from config.clients import clients
+from config.env import load_env
+
+load_env()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") 
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10"))
+SUPABASE_CONNECT_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_CONNECT_TIMEOUT_SECONDS", "5"))
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "50"))
+SUPABASE_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SUPABASE_MAX_KEEPALIVE_CONNECTIONS", "20"))
+SUPABASE_CONNECT_RETRIES = int(os.getenv("SUPABASE_CONNECT_RETRIES", "2"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+
+
+def _check_config():
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        raise ValueError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in .env")
+
+
+def _create_client() -> AsyncClient:
+    _check_config()
+    http_client = httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(
+            http2=SUPABASE_HTTP2,
+            retries=SUPABASE_CONNECT_RETRIES,
+            limits=httpx.Limits(
+                max_connections=SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        ),
+        timeout=httpx.Timeout(SUPABASE_TIMEOUT_SECONDS, connect=SUPABASE_CONNECT_TIMEOUT_SECONDS),
+        follow_redirects=True,
+    )
+    return AsyncClient(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, AsyncClientOptions(httpx_client=http_client))
+
+
+async def _close_client(client: AsyncClient):
+    await client.options.httpx_client.aclose()
+
+
+clients.register("supabase", _create_client, _close_client, _check_config)
+
+
+def get_supabase() -> AsyncClient:
+    """Return the process-wide async Supabase client, creating it on first use.
+
+    PostgREST and Storage share one pooled httpx client, so requests reuse keep-alive
+    connections instead of blocking the event loop on a synchronous round trip. Failed
+    connection attempts are retried by the transport; nothing is retried once a request
+    has been sent.
+    """
+    return clients.get("supabase")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in .env")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+async def close_supabase():
+    await clients.close("supabase")
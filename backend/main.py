@@ -1,8 +1,39 @@
+from config.env import load_env
+
+# Before anything else is imported, since modules read their settings at import
+load_env()
+
 from fastapi import FastAPI
-from routers import tryon, furniture, room_designs, furniture_placement
+from routers import tryon, furniture, room_designs, furniture_placement, images, jobs, system, metrics, health
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from config.clients import clients
+from utils.image_pipeline import shutdown_image_pipeline
+from utils.uploads import RequestBodyLimitMiddleware
+from utils.tracing import TracingMiddleware, span_exporter
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fail at startup, not on the first request, when a client is misconfigured. The clients
+    # themselves are created on first use, so a worker starts serving without any network setup
+    clients.check_config()
+    app.state.clients = clients
+    await jobs.job_workers.start()
+    span_exporter.start()
+    health.set_ready(True)
+    yield
+    health.set_ready(False)
+    await jobs.job_workers.stop()
+    await span_exporter.stop()
+    await clients.aclose()
+    shutdown_image_pipeline()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
+
+# Reject oversized bodies before multipart parsing; added first so CORS headers still wrap the 413
+app.add_middleware(RequestBodyLimitMiddleware)
 
 # Allow frontend to connect
 app.add_middleware(
@@ -13,7 +44,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so the request span and metrics cover everything below, including rejected bodies
+app.add_middleware(TracingMiddleware)
+
 app.include_router(tryon.router, prefix="/api")
 app.include_router(furniture.router, prefix="/api")
 app.include_router(room_designs.router, prefix="/api")
 app.include_router(furniture_placement.router, prefix="/api")
+app.include_router(images.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
+app.include_router(system.router, prefix="/api")
+app.include_router(metrics.router)
+app.include_router(health.router)
@@ -1,13 +1,25 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
-from config.supabase_client import supabase
+from utils.image_cache import invalidate_cached_image
+from utils.image_pipeline import FILE_EXTENSIONS, ImageDecodeError, fingerprint_image
+from utils.image_derivatives import derivative_columns, store_derivatives, with_thumbnail_fallback
+from utils.uploads import read_upload
+from utils.pagination import select_columns, page_results
+from utils.repositories import furniture_repo, furniture_images
+from utils.prompts import furniture_part_cache
+from utils.tracing import span, traced
+from utils.similarity_index import furniture_index, fingerprint_or_none, hash_columns, similarity_k, rank_rows
+from utils.batch import BatchItem, read_batch, completed_in_batches, ndjson_response, parse_batch_ids, BATCH_UPLOAD_CONCURRENCY
+from utils.storage_gc import remove_images
+from typing import List
+import asyncio
+import os
 import uuid
 import traceback
 
 router = APIRouter()
 
-ALLOWED_MIME_TYPES = {"image/jpeg", "image/png", "image/webp", "image/heic", "image/heif"}
-MAX_IMAGE_SIZE_MB = 10
+FURNITURE_FIELDS = ["id", "user_id", "name", "category", "image_url", "thumbnail_url", "preview_url", "created_at", "updated_at"]
 
 @router.post("/furniture/upload")
 async def upload_furniture(
@@ -16,78 +28,263 @@ async def upload_furniture(
     category: str = Form(...),
 ):
     try:
-        if furniture_image.content_type not in ALLOWED_MIME_TYPES:
-            raise HTTPException(status_code=400, detail=f"Unsupported file type: {furniture_image.content_type}")
+        upload = await read_upload(furniture_image, "furniture_image")
 
-        furniture_bytes = await furniture_image.read()
-        if len(furniture_bytes) / (1024*1024) > MAX_IMAGE_SIZE_MB:
-            raise HTTPException(status_code=400, detail="Image exceeds 10MB size limit")
-
-        ext = furniture_image.filename.split(".")[-1]
+        ext = FILE_EXTENSIONS[upload.mime_type]
         unique_filename = f"{uuid.uuid4()}.{ext}"
         storage_path = f"furniture/{unique_filename}"
 
-        upload_response = supabase.storage.from_("furniture-images").upload(
-            path=storage_path,
-            file=furniture_bytes,
-            file_options={"content-type": furniture_image.content_type}
-        )
-        if hasattr(upload_response, "error") and upload_response.error:
-            raise HTTPException(status_code=500, detail=f"Storage upload failed: {upload_response.error}")
-
-        public_url = supabase.storage.from_("furniture-images").get_public_url(storage_path)
+        with span("furniture.store", bytes=upload.size):
+            public_url, derivatives, fingerprint = await asyncio.gather(
+                furniture_images.upload(storage_path, upload.data, upload.mime_type),
+                store_derivatives(furniture_images, storage_path, upload.data),
+                fingerprint_or_none(upload.data, storage_path),
+            )
 
-        db_response = supabase.table("furniture_items").insert({
+        furniture = await furniture_repo.create({
             "name": name,
             "category": category,
             "image_url": public_url,
+            **derivative_columns("", derivatives),
+            **hash_columns("", fingerprint),
             "user_id": None
-        }).execute()
+        })
 
-        if not db_response.data:
+        if not furniture:
             raise HTTPException(status_code=500, detail="Failed to save furniture to database")
+        furniture_index.add_row(furniture)
 
         return JSONResponse({
-            "id": db_response.data[0]["id"],
+            "id": furniture["id"],
             "name": name,
             "category": category,
             "image_url": public_url,
+            **derivative_columns("", derivatives),
             "message": "Furniture uploaded successfully"
         })
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Upload error: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+@router.post("/furniture/upload/batch")
+async def upload_furniture_batch(
+    category: str = Form(...),
+    furniture_images_files: List[UploadFile] = File(None, alias="furniture_images"),
+    archive: UploadFile = File(None),
+):
+    """Upload many furniture images (files and/or a zip) and stream one NDJSON result per item.
+
+    Each item is named after its file. Storage uploads run in parallel and the rows are
+    inserted into ``furniture_items`` in bulk.
+    """
+    try:
+        items = await read_batch(furniture_images_files, archive, "furniture_image")
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Batch upload error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    return ndjson_response(_furniture_batch_results(items, category))
+
+
+@traced("furniture.store")
+async def _store_furniture_image(item: BatchItem) -> tuple[str, dict, tuple]:
+    """Upload one batch image and its derivatives while hashing it; returns the public URL,
+    the derivative URLs and the fingerprint (``None`` if hashing failed)."""
+    ext = FILE_EXTENSIONS[item.upload.mime_type]
+    path = f"furniture/{uuid.uuid4()}.{ext}"
+    return await asyncio.gather(
+        furniture_images.upload(path, item.upload.data, item.upload.mime_type),
+        store_derivatives(furniture_images, path, item.upload.data),
+        fingerprint_or_none(item.upload.data, path),
+    )
+
+
+async def _furniture_batch_results(items: List[BatchItem], category: str):
+    for item in items:
+        if item.error:
+            yield item.error_line(item.error)
+
+    valid = [item for item in items if not item.error]
+    async for batch in completed_in_batches(valid, _store_furniture_image, BATCH_UPLOAD_CONCURRENCY):
+        stored = []
+        for item, urls, error in batch:
+            if error:
+                print(f"Batch upload of {item.filename} failed: {error}")
+                yield item.error_line("Storage upload failed")
+            else:
+                stored.append((item, urls))
+        if not stored:
+            continue
+
+        rows = [
+            {
+                "name": os.path.splitext(os.path.basename(item.filename))[0] or f"Furniture {item.index + 1}",
+                "category": category,
+                "image_url": public_url,
+                **derivative_columns("", derivatives),
+                **hash_columns("", fingerprint),
+                "user_id": None,
+            }
+            for item, (public_url, derivatives, fingerprint) in stored
+        ]
+        try:
+            created = await furniture_repo.create_many(rows)
+        except Exception as e:
+            print(f"Bulk furniture insert failed: {e}")
+            traceback.print_exc()
+            await remove_images(furniture_images, [urls[0] for _, urls in stored])
+            for item, _ in stored:
+                yield item.error_line("Failed to save furniture to database")
+            continue
+
+        for (item, _), furniture in zip(stored, created):
+            furniture_index.add_row(furniture)
+            yield item.ok_line(
+                id=furniture["id"],
+                name=furniture["name"],
+                category=furniture["category"],
+                image_url=furniture["image_url"],
+                thumbnail_url=furniture.get("thumbnail_url"),
+                preview_url=furniture.get("preview_url"),
+            )
+
+
 @router.get("/furniture/list")
-async def list_furniture(category: str = None):
+async def list_furniture(category: str = None, limit: int = 50, cursor: str = None, fields: str = None):
     try:
-        query = supabase.table("furniture_items").select("*").order("created_at", desc=True)
-        if category:
-            query = query.eq("category", category)
-        response = query.execute()
-        return JSONResponse({"furniture": response.data or []})
+        columns = select_columns(fields, FURNITURE_FIELDS, FURNITURE_FIELDS)
+        rows = await furniture_repo.list_page(columns, category, cursor, limit)
+        furniture, next_cursor = page_results(rows, limit)
+        furniture = [with_thumbnail_fallback(dict(row), "", "image_url") for row in furniture]
+        return JSONResponse({"furniture": furniture, "next_cursor": next_cursor})
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"List error: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+async def _similar_furniture(phash: int, histogram, k: int, max_distance: int, category: str, exclude: str = None) -> JSONResponse:
+    await furniture_index.ready()
+    with span("similarity.query", index="furniture", entries=len(furniture_index)):
+        matches = furniture_index.query(phash, histogram, similarity_k(k), max_distance, category, exclude)
+    rows = await rank_rows(matches, furniture_repo.get_many)
+    fields = FURNITURE_FIELDS + ["hash_distance", "color_distance"]
+    furniture = [with_thumbnail_fallback({field: row.get(field) for field in fields}, "", "image_url") for row in rows]
+    return JSONResponse({"furniture": furniture})
+
+
+@router.get("/furniture/similar")
+async def similar_furniture(furniture_id: str, k: int = 10, max_distance: int = None, category: str = None):
+    """Furniture whose images look most like ``furniture_id``'s, closest first.
+
+    Ranked by perceptual-hash Hamming distance (0-64; up to ~10 is a near duplicate), with
+    color histogram distance breaking ties. ``category`` restricts the matches.
+    """
+    try:
+        await furniture_index.ready()
+        entry = furniture_index.get(furniture_id)
+        if entry is None:
+            rows = await furniture_repo.get_many([furniture_id])
+            if not rows:
+                raise HTTPException(status_code=404, detail="Furniture not found")
+            if rows[0].get("phash") is None:
+                raise HTTPException(status_code=409, detail="Furniture image has not been hashed yet")
+            entry = (rows[0]["phash"], rows[0].get("color_hist"))
+        phash, histogram = entry
+        return await _similar_furniture(phash, histogram, k, max_distance, category, exclude=furniture_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Similar furniture error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.post("/furniture/similar")
+async def similar_furniture_to_image(
+    image: UploadFile = File(...),
+    k: int = Form(10),
+    max_distance: int = Form(None),
+    category: str = Form(None),
+):
+    """Furniture whose images look most like an uploaded photo, closest first."""
+    try:
+        upload = await read_upload(image, "image")
+        (phash, histogram), _ = await asyncio.gather(fingerprint_image(upload.data), furniture_index.ready())
+        return await _similar_furniture(phash, histogram, k, max_distance, category)
+    except HTTPException:
+        raise
+    except ImageDecodeError:
+        raise HTTPException(status_code=400, detail="Could not decode the image")
+    except Exception as e:
+        print(f"Similar furniture error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
 @router.delete("/furniture/{furniture_id}")
 async def delete_furniture(furniture_id: str):
     try:
-        res = supabase.table("furniture_items").select("image_url").eq("id", furniture_id).execute()
-        if not res.data:
+        image_url = await furniture_repo.get_image_url(furniture_id)
+        if not image_url:
             raise HTTPException(status_code=404, detail="Furniture not found")
 
-        storage_path = res.data[0]["image_url"].split("/furniture-images/")[-1]
-        supabase.storage.from_("furniture-images").remove([storage_path])
-        supabase.table("furniture_items").delete().eq("id", furniture_id).execute()
+        await furniture_repo.delete(furniture_id)
+        await _forget_furniture([{"id": furniture_id, "image_url": image_url}])
 
         return JSONResponse({"message": "Furniture deleted successfully"})
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Delete error: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.post("/furniture/delete/batch")
+async def delete_furniture_batch(ids: str = Form(...)):
+    """Delete up to ``BATCH_MAX_ITEMS`` comma-separated furniture ids with one database and one Storage call."""
+    try:
+        ids_list = parse_batch_ids(ids)
+        # A stale cache entry would misreport what was deleted and leave images behind
+        rows = await furniture_repo.get_many(ids_list, cached=False)
+        found = {row["id"] for row in rows}
+        if rows:
+            await furniture_repo.delete_many(list(found))
+        removed = await _forget_furniture(rows)
+
+        return JSONResponse({
+            "deleted": [furniture_id for furniture_id in ids_list if furniture_id in found],
+            "not_found": [furniture_id for furniture_id in ids_list if furniture_id not in found],
+            "storage_objects_removed": removed,
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Batch delete error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+async def _forget_furniture(rows: list[dict]) -> int:
+    """Remove deleted furniture's images and in-memory entries; returns the Storage objects removed.
+
+    Rows are deleted first, so a failed removal leaves orphaned objects for the storage GC
+    rather than rows pointing at missing images.
+    """
+    removed = await remove_images(furniture_images, [row["image_url"] for row in rows])
+    for row in rows:
+        furniture_index.remove(row["id"])
+        furniture_part_cache.discard(row["id"])
+        await invalidate_cached_image(row["image_url"])
+    return removed
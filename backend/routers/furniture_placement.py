@@ -1,187 +1,334 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
 from fastapi.responses import JSONResponse
-from dotenv import load_dotenv
-import os
-from google import genai
 from google.genai import types
 import traceback
-import base64
-from config.supabase_client import supabase
-import requests
-
-load_dotenv()
+import asyncio
+import hashlib
+import uuid
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from utils.repositories import room_design_repo, placement_repo, room_images
+from utils.generation_executor import GenerationQueueFull, queue_full_http_exception
+from utils.generation_backend import get_generation_backend
+from utils.rate_limit import generation_rate_limiter
+from utils.generation_output import generate, stream_generation, sse_event, sse_response
+from utils.image_fetcher import fetch_image
+from utils.image_cache import cache_image
+from utils.image_response import image_field
+from utils.image_pipeline import FILE_EXTENSIONS, normalize_image, ImageDecodeError
+from utils.uploads import read_upload
+from utils.prompts import furniture_placement_prompt
+from utils.structured_log import get_logger
+from utils.tracing import traced
 
 router = APIRouter()
+logger = get_logger("furniture_placement")
+
+NO_DESCRIPTION = "No description available."
+
+
+@dataclass
+class PlacementPlan:
+    """What a placement request needs generated, decided before calling the model.
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("Missing GEMINI_API_KEY in .env")
+    ``base`` is the stored placement the result is built on (``None`` for the bare room
+    design) and ``contents`` the model input holding only the furniture ``base`` lacks.
+    When ``base`` already holds exactly the requested furniture, ``contents`` is ``None``
+    and the stored result is returned as is.
+    """
+    room_design_id: str
+    base: Optional[dict]
+    furniture_hashes: list[str]
+    added_hashes: list[str]
+    contents: Optional[list]
+
+    @property
+    def reused(self) -> bool:
+        return self.contents is None
 
-client = genai.Client(api_key=GEMINI_API_KEY)
 
 @router.post("/furniture-placement")
 async def place_furniture(
+    request: Request,
     room_design_id: str = Form(...),
     furniture_images: list[UploadFile] = File(...),
+    base_placement_id: Optional[str] = Form(None),
+    inline: bool = False,
 ):
     try:
-        MAX_IMAGE_SIZE_MB = 10
-        ALLOWED_MIME_TYPES = {
-            "image/jpeg",
-            "image/png",
-            "image/webp",
-            "image/heic",
-            "image/heif",
-        }
-
-        # Fetch the room design from database
-        room_design_response = supabase.table("room_designs").select("*").eq("id", room_design_id).maybeSingle().execute()
-
-        if not room_design_response.data:
-            raise HTTPException(status_code=404, detail="Room design not found")
-
-        room_design = room_design_response.data
-
-        # Fetch the generated room image
-        try:
-            room_image_response = requests.get(room_design["generated_image_url"], timeout=10)
-            if room_image_response.status_code != 200:
-                raise HTTPException(status_code=500, detail="Failed to fetch room design image")
-            room_image_bytes = room_image_response.content
-        except Exception as fetch_err:
-            print(f"Failed to fetch room image: {fetch_err}")
-            raise HTTPException(status_code=500, detail="Failed to fetch room design image")
-
-        # Process furniture images
-        furniture_parts = []
-        furniture_descriptions = []
+        furniture_files = []
 
         for idx, furniture_img in enumerate(furniture_images):
-            if furniture_img.content_type not in ALLOWED_MIME_TYPES:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Unsupported file type for furniture image {idx + 1}: {furniture_img.content_type}"
-                )
-
-            furniture_bytes = await furniture_img.read()
-            size_in_mb = len(furniture_bytes) / (1024 * 1024)
-
-            if size_in_mb > MAX_IMAGE_SIZE_MB:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Furniture image {idx + 1} exceeds 10MB size limit"
-                )
-
-            furniture_parts.append(
-                types.Part.from_bytes(
-                    data=furniture_bytes,
-                    mime_type=furniture_img.content_type,
-                )
-            )
-            furniture_descriptions.append(f"Furniture item {idx + 1}")
-
-        # Build prompt for AI
-        prompt = f"""
-        You are a professional AI interior designer specialized in furniture placement.
-
-        ### Task:
-        You are provided with:
-        1. A room design image (the base room)
-        2. {len(furniture_images)} furniture/object image(s) that need to be placed in this room
-
-        ### Room Context:
-        - Design Type: {room_design['design_type']}
-        - Room Type: {room_design['room_type']}
-        - Style: {room_design['style']}
-
-        ### Objective:
-        1. Naturally integrate ALL the provided furniture/object images into the room design
-        2. Place each furniture item in an appropriate location based on its type and the room layout
-        3. Ensure proper scaling so furniture looks proportional to the room
-        4. Maintain realistic perspective and shadows
-        5. Make sure the furniture blends seamlessly with the existing design aesthetic
-        6. Consider practical placement (e.g., sofa against wall, table in center, lamps near seating)
-        7. Preserve the original room's lighting, colors, and overall atmosphere
-
-        ### Important:
-        - The furniture should look like it naturally belongs in the room
-        - Maintain photorealistic quality
-        - Don't change the room structure, only add the furniture
-        - Ensure proper depth perception and spatial relationships
-
-        Return:
-        - A photorealistic image of the room WITH all the furniture items placed naturally
-        - A brief description of where each piece was placed and why
-        """
-
-        print(prompt)
-
-        # Build content parts for Gemini
-        contents = [
-            prompt,
-            types.Part.from_bytes(
-                data=room_image_bytes,
-                mime_type="image/jpeg",
-            )
-        ]
+            upload = await read_upload(furniture_img, f"Furniture image {idx + 1}")
+            furniture_files.append((upload.data, upload.mime_type))
+        # The stored room image is sent along with the furniture
+        await generation_rate_limiter.check(request, images=1 + len(furniture_images))
 
-        contents.extend(furniture_parts)
-
-        # Call Gemini API
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-preview-image-generation",
-            contents=contents,
-            config=types.GenerateContentConfig(
-                response_modalities=['TEXT', 'IMAGE']
-            )
-        )
-
-        print(response)
-
-        # Extract image and text from response
-        image_data = None
-        text_response = "No description available."
-
-        if response.candidates and len(response.candidates) > 0:
-            parts = response.candidates[0].content.parts
-
-            if parts:
-                print("Number of parts in response:", len(parts))
-
-                for part in parts:
-                    if hasattr(part, "inline_data") and part.inline_data:
-                        image_data = part.inline_data.data
-                        image_mime_type = getattr(part.inline_data, "mime_type", "image/png")
-                        print("Image data received, length:", len(image_data))
-                        print("MIME type:", image_mime_type)
-
-                    elif hasattr(part, "text") and part.text:
-                        text_response = part.text
-                        preview = (text_response[:100] + "...") if len(text_response) > 100 else text_response
-                        print("Text response received:", preview)
-            else:
-                print("No parts found in the response candidate.")
-        else:
-            print("No candidates found in the API response.")
-
-        image_url = None
-        if image_data:
-            image_base64 = base64.b64encode(image_data).decode("utf-8")
-            image_url = f"data:{image_mime_type};base64,{image_base64}"
-        else:
-            image_url = None
+        content, image_data, image_mime_type = await run_furniture_placement(room_design_id, furniture_files, base_placement_id)
 
         return JSONResponse(
             content={
-                "image": image_url,
-                "text": text_response,
-                "room_design_id": room_design_id
+                **content,
+                "image": image_field(request, content["image_id"], image_data, image_mime_type, inline),
             }
         )
 
+    except GenerationQueueFull as e:
+        raise queue_full_http_exception(e)
     except HTTPException:
         raise
     except Exception as e:
         print(f"Error in /api/furniture-placement endpoint: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.post("/furniture-placement/stream")
+async def place_furniture_stream(
+    request: Request,
+    room_design_id: str = Form(...),
+    furniture_images: list[UploadFile] = File(...),
+    base_placement_id: Optional[str] = Form(None),
+    inline: bool = False,
+):
+    """Server-sent events variant of ``/furniture-placement``; same events as ``/try-on/stream``.
+
+    A request answered by a stored placement gets a single ``done`` event.
+    """
+    try:
+        furniture_files = []
+        for idx, furniture_img in enumerate(furniture_images):
+            upload = await read_upload(furniture_img, f"Furniture image {idx + 1}")
+            furniture_files.append((upload.data, upload.mime_type))
+        await generation_rate_limiter.check(request, images=1 + len(furniture_images))
+
+        plan = await _prepare_furniture_placement(room_design_id, furniture_files, base_placement_id)
+        if plan.reused:
+            content, image_data, image_mime_type = await _reused_placement(plan)
+            done = {**content, "image": image_field(request, content["image_id"], image_data, image_mime_type, inline)}
+            return sse_response(iter([sse_event("done", done)]))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in /api/furniture-placement/stream endpoint: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    async def events():
+        try:
+            stream = stream_generation(
+                "furniture-placement",
+                get_generation_backend().generate_content_stream,
+                NO_DESCRIPTION,
+                contents=plan.contents,
+            )
+            image_id = None
+            timings = None
+            async for event, value in stream:
+                if event == "text":
+                    yield sse_event("text", {"text": value})
+                elif event == "image":
+                    image_data, image_mime_type = value
+                    image_id = await cache_image(None, image_data)
+                    yield sse_event("image", {"image_id": image_id, "image": image_field(request, image_id, image_data, image_mime_type, inline)})
+                elif event == "timings":
+                    timings = value
+                elif event == "done":
+                    placement = None
+                    if value.image_data:
+                        # Same content hash, so image_id doesn't change once the Storage URL is attached
+                        placement, image_id = await _store_placement(plan, value.text, value.image_data, value.image_mime_type)
+                    content = _placement_content(plan, placement, value.text, image_id)
+                    done = {**content, "image": image_field(request, image_id, value.image_data, value.image_mime_type, inline), "timings": timings}
+                    yield sse_event("done", done)
+        except GenerationQueueFull as e:
+            yield sse_event("error", {"detail": "Too many generations in progress, please retry later", "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"Error in /api/furniture-placement/stream endpoint: {e}")
+            traceback.print_exc()
+            yield sse_event("error", {"detail": "Internal Server Error"})
+
+    return sse_response(events())
+
+
+@router.get("/room-designs/{design_id}/placements")
+async def list_placements(design_id: str):
+    """Stored furniture placements of a design, largest furniture set first; their ids can be passed as ``base_placement_id``."""
+    try:
+        placements = await placement_repo.list_for_design(
+            design_id, "id, base_placement_id, version, furniture_count, image_url, description, created_at"
+        )
+        return JSONResponse({"placements": placements})
+    except Exception as e:
+        print(f"Error listing furniture placements: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+def furniture_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@traced("furniture_placement.prepare")
+async def _prepare_furniture_placement(
+    room_design_id: str,
+    furniture_files: List[Tuple[bytes, str]],
+    base_placement_id: Optional[str] = None,
+) -> PlacementPlan:
+    """Pick the stored version to start from and build the model ``contents`` for the rest.
+
+    The requested furniture is the uploaded images plus, with ``base_placement_id``, every
+    item already in that placement. Furniture is identified by the SHA-256 of its uploaded
+    bytes. The closest stored version is the one of this design with the most furniture
+    that contains nothing outside the request and every item that wasn't uploaded again
+    (those are only available as part of a placement image). Only the uploaded images
+    missing from it are normalized and sent, with its image as the room.
+    """
+    room_design = await room_design_repo.get(room_design_id)
+
+    if not room_design:
+        raise HTTPException(status_code=404, detail="Room design not found")
+
+    uploaded = {}
+    for furniture_bytes, furniture_mime_type in furniture_files:
+        uploaded.setdefault(furniture_hash(furniture_bytes), (furniture_bytes, furniture_mime_type))
+    requested = set(uploaded)
+
+    base_placement = None
+    if base_placement_id:
+        base_placement = await placement_repo.get(base_placement_id)
+        if not base_placement or base_placement["room_design_id"] != room_design_id:
+            raise HTTPException(status_code=404, detail="Base placement not found for this room design")
+        requested.update(base_placement["furniture_hashes"])
+
+    furniture_hashes = sorted(requested)
+    required = sorted(requested - set(uploaded))
+    base = await placement_repo.closest(room_design_id, furniture_hashes, required) or base_placement
+    placed = set(base["furniture_hashes"]) if base else set()
+    added = [digest for digest in uploaded if digest not in placed]
+
+    if base and not added:
+        return PlacementPlan(room_design_id, base, furniture_hashes, [], None)
+
+    # Start from the closest stored version, or the bare generated room
+    room_image = await fetch_image(base["image_url"] if base else room_design["generated_image_url"])
+    if not room_image.ok:
+        print(f"Failed to fetch room image: {room_image.error}")
+        raise HTTPException(status_code=500, detail="Failed to fetch room design image")
+
+    # Downscale and re-encode the room and every new furniture image in parallel before they go to the model
+    try:
+        normalized = await asyncio.gather(
+            normalize_image(room_image.data),
+            *[normalize_image(uploaded[digest][0]) for digest in added],
+        )
+    except ImageDecodeError:
+        raise HTTPException(status_code=400, detail="Could not decode one of the furniture images")
+    room_image_bytes, room_image_mime_type, _ = normalized[0]
+
+    furniture_parts = [
+        types.Part.from_bytes(data=furniture_bytes, mime_type=furniture_mime_type)
+        for furniture_bytes, furniture_mime_type, _ in normalized[1:]
+    ]
+
+    prompt = furniture_placement_prompt(room_design, len(added), len(placed))
+    logger.debug(
+        "prompt", operation="furniture-placement", prompt=prompt,
+        furniture=len(furniture_parts), placed=len(placed), base_placement_id=base["id"] if base else None,
+    )
+
+    # Build content parts for Gemini
+    contents = [
+        prompt,
+        types.Part.from_bytes(
+            data=room_image_bytes,
+            mime_type=room_image_mime_type,
+        )
+    ]
+
+    contents.extend(furniture_parts)
+    return PlacementPlan(room_design_id, base, furniture_hashes, added, contents)
+
+
+@traced("furniture_placement.persist")
+async def _store_placement(
+    plan: PlacementPlan, description: Optional[str], image_data: bytes, image_mime_type: str
+) -> Tuple[Optional[dict], str]:
+    """Upload a generated placement and insert its ``furniture_placements`` row.
+
+    Returns the row (``None`` if storing failed; the result is still served from the local
+    image cache) and the image id.
+    """
+    image_url = None
+    placement = None
+    try:
+        path = f"room-designs/placements/placement_{uuid.uuid4()}.{FILE_EXTENSIONS.get(image_mime_type, 'png')}"
+        image_url = await room_images.upload(path, image_data, image_mime_type, upsert=True)
+        placement = await placement_repo.create({
+            "room_design_id": plan.room_design_id,
+            "base_placement_id": plan.base["id"] if plan.base else None,
+            "version": plan.base["version"] + 1 if plan.base else 1,
+            "furniture_hashes": plan.furniture_hashes,
+            "added_hashes": plan.added_hashes,
+            "furniture_count": len(plan.furniture_hashes),
+            "image_url": image_url,
+            "description": description,
+        })
+    except Exception as e:
+        print(f"Failed to store furniture placement: {e}")
+    # With the Storage URL attached, /api/images/{image_id} can refetch the bytes after eviction
+    image_id = await cache_image(image_url, image_data)
+    return placement, image_id
+
+
+async def _reused_placement(plan: PlacementPlan) -> Tuple[dict, bytes, str]:
+    """The response content, image bytes and MIME type of the stored placement a plan reuses."""
+    image = await fetch_image(plan.base["image_url"])
+    if not image.ok:
+        print(f"Failed to fetch placement image: {image.error}")
+        raise HTTPException(status_code=500, detail="Failed to fetch furniture placement image")
+    image_id = await cache_image(plan.base["image_url"], image.data)
+    content = _placement_content(plan, plan.base, plan.base["description"] or NO_DESCRIPTION, image_id)
+    return content, image.data, image.mime_type
+
+
+def _placement_content(plan: PlacementPlan, placement: Optional[dict], text: Optional[str], image_id: Optional[str]) -> dict:
+    return {
+        "image_id": image_id,
+        "text": text,
+        "room_design_id": plan.room_design_id,
+        "placement_id": placement["id"] if placement else None,
+        "base_placement_id": placement["base_placement_id"] if placement else (plan.base["id"] if plan.base else None),
+        "version": placement["version"] if placement else None,
+        "furniture_count": len(plan.furniture_hashes),
+        "furniture_sent": len(plan.added_hashes),
+        "reused": plan.reused,
+    }
+
+
+async def run_furniture_placement(
+    room_design_id: str,
+    furniture_files: List[Tuple[bytes, str]],
+    base_placement_id: Optional[str] = None,
+):
+    """Place already validated ``(bytes, mime_type)`` furniture images into a stored room design.
+
+    Shared by the synchronous endpoint and the job workers. Returns the JSON content (without
+    the ``image`` field), the result image bytes and their MIME type.
+    """
+    plan = await _prepare_furniture_placement(room_design_id, furniture_files, base_placement_id)
+
+    if plan.reused:
+        return await _reused_placement(plan)
+
+    output = await generate(
+        "furniture-placement",
+        get_generation_backend().generate_content,
+        NO_DESCRIPTION,
+        contents=plan.contents,
+    )
+
+    placement, image_id = None, None
+    if output.image_data:
+        placement, image_id = await _store_placement(plan, output.text, output.image_data, output.image_mime_type)
+    return _placement_content(plan, placement, output.text, image_id), output.image_data, output.image_mime_type
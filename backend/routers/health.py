@@ -0,0 +1,42 @@
+import os
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from config.clients import clients
+from utils.generation_executor import generation_executor
+
+router = APIRouter()
+
+_state = {"ready": False, "started_at": None}
+
+
+def set_ready(ready: bool):
+    """Flipped by the app lifespan: on once startup finished, off as soon as shutdown begins."""
+    _state["ready"] = ready
+    if ready:
+        _state["started_at"] = time.time()
+
+
+@router.get("/healthz")
+async def liveness():
+    """Answers as long as the worker's event loop does; never calls Supabase or the model."""
+    return JSONResponse({"status": "ok", "pid": os.getpid()})
+
+
+@router.get("/readyz")
+async def readiness():
+    """``200`` once this worker finished starting up and until it starts shutting down, else ``503``.
+
+    Only in-process state is read, so a Supabase or model outage doesn't take every worker
+    out of the load balancer at once; those show up as errors on the requests themselves.
+    """
+    if not _state["ready"]:
+        return JSONResponse({"status": "not ready", "pid": os.getpid()}, status_code=503)
+    return JSONResponse({
+        "status": "ready",
+        "pid": os.getpid(),
+        "uptime_seconds": round(time.time() - _state["started_at"], 1),
+        "clients": clients.created(),
+        "generation": {"in_flight": generation_executor.in_flight, "waiting": generation_executor.waiting},
+    })
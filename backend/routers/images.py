@@ -0,0 +1,43 @@
+from fastapi import APIRouter, HTTPException, Request
+from utils.image_cache import get_cached_content, get_source_url
+from utils.image_fetcher import fetch_image, sniff_image_mime_type
+from utils.image_response import binary_image_response, not_modified_response
+import hashlib
+import re
+import traceback
+
+router = APIRouter()
+
+IMAGE_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+
+@router.get("/images/{image_id}", name="get_image")
+async def get_image(image_id: str, request: Request):
+    """Serve a generated or stored image by its content hash."""
+    if not IMAGE_ID_RE.match(image_id):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    not_modified = not_modified_response(request, image_id)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        data = await get_cached_content(image_id)
+
+        if data is None:
+            # Evicted from the local cache; fall back to the Storage object it came from.
+            source_url = await get_source_url(image_id)
+            if source_url:
+                fetched = await fetch_image(source_url)
+                if fetched.ok and hashlib.sha256(fetched.data).hexdigest() == image_id:
+                    data = fetched.data
+
+        if data is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+
+        return binary_image_response(request, data, image_id, sniff_image_mime_type(data))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Image error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
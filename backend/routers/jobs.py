@@ -0,0 +1,177 @@
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, Header
+from fastapi.responses import JSONResponse
+from typing import Optional
+from routers.tryon import run_try_on, parse_furniture_ids
+from routers.furniture_placement import run_furniture_placement
+from utils.job_queue import job_queue, JobWorkerPool, JobPermanentError, JOB_WORKERS, TERMINAL_STATUSES
+from utils.design_persistence import PERSIST_DESIGN_JOB, run_persist_design_job
+from utils.uploads import read_upload
+from utils.rate_limit import generation_rate_limiter
+from utils.generation_output import sse_event, sse_response
+import asyncio
+import traceback
+
+router = APIRouter()
+
+JOB_EVENTS_POLL_SECONDS = 0.5
+JOB_EVENTS_MAX_SECONDS = 600
+
+
+async def _read_image(upload: UploadFile, label: str) -> tuple[bytes, str, Optional[str]]:
+    validated = await read_upload(upload, label)
+    return validated.data, validated.mime_type, validated.filename
+
+
+async def _run_try_on_job(params: dict, files: list) -> dict:
+    place_bytes, place_mime_type, _ = files[0]
+    try:
+        content, _, _ = await run_try_on(place_bytes, place_mime_type, **params)
+    except HTTPException as e:
+        if e.status_code < 500:
+            raise JobPermanentError(e.detail)
+        raise
+    return content
+
+
+async def _run_furniture_placement_job(params: dict, files: list) -> dict:
+    try:
+        content, _, _ = await run_furniture_placement(
+            params["room_design_id"],
+            [(data, mime_type) for data, mime_type, _ in files],
+            params.get("base_placement_id"),
+        )
+    except HTTPException as e:
+        if e.status_code < 500:
+            raise JobPermanentError(e.detail)
+        raise
+    return content
+
+
+job_workers = JobWorkerPool(
+    job_queue,
+    {
+        "try-on": _run_try_on_job,
+        "furniture-placement": _run_furniture_placement_job,
+        PERSIST_DESIGN_JOB: run_persist_design_job,
+    },
+    JOB_WORKERS,
+)
+
+
+def _job_response(request: Request, job: dict) -> dict:
+    result = job["result"]
+    if result and result.get("image_id"):
+        result = {**result, "image": str(request.url_for("get_image", image_id=result["image_id"]))}
+
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "max_attempts": job["max_attempts"],
+        "result": result,
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "status_url": str(request.url_for("get_job", job_id=job["id"])),
+        "events_url": str(request.url_for("stream_job_events", job_id=job["id"])),
+    }
+
+
+async def _submit(request: Request, kind: str, params: dict, files: list, idempotency_key: Optional[str]) -> JSONResponse:
+    job, created = await asyncio.to_thread(job_queue.enqueue, kind, params, files, idempotency_key)
+    if created:
+        job_workers.notify()
+    return JSONResponse(_job_response(request, job), status_code=202 if created else 200)
+
+
+@router.post("/jobs/try-on")
+async def submit_try_on_job(
+    request: Request,
+    place_image: UploadFile = File(...),
+    design_type: str = Form(...),
+    room_type: str = Form(...),
+    style: str = Form(...),
+    background_color: str = Form(...),
+    foreground_color: str = Form(...),
+    instructions: str = Form(""),
+    furniture_ids: str = Form(""),
+    idempotency_key: Optional[str] = Header(None),
+):
+    try:
+        place_file = await _read_image(place_image, "place_image")
+        # Jobs wait in the queue instead of being shed, but still count against the client's budget
+        await generation_rate_limiter.check(request, images=1 + len(parse_furniture_ids(furniture_ids)), shed=False)
+        params = {
+            "design_type": design_type,
+            "room_type": room_type,
+            "style": style,
+            "background_color": background_color,
+            "foreground_color": foreground_color,
+            "instructions": instructions,
+            "furniture_ids": furniture_ids,
+        }
+        return await _submit(request, "try-on", params, [place_file], idempotency_key)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Job submit error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.post("/jobs/furniture-placement")
+async def submit_furniture_placement_job(
+    request: Request,
+    room_design_id: str = Form(...),
+    furniture_images: list[UploadFile] = File(...),
+    base_placement_id: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    try:
+        files = [
+            await _read_image(furniture_img, f"furniture image {idx + 1}")
+            for idx, furniture_img in enumerate(furniture_images)
+        ]
+        await generation_rate_limiter.check(request, images=1 + len(furniture_images), shed=False)
+        params = {"room_design_id": room_design_id, "base_placement_id": base_placement_id}
+        return await _submit(request, "furniture-placement", params, files, idempotency_key)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Job submit error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.get("/jobs/{job_id}", name="get_job")
+async def get_job(job_id: str, request: Request):
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(_job_response(request, job))
+
+
+@router.get("/jobs/{job_id}/events", name="stream_job_events")
+async def stream_job_events(job_id: str, request: Request):
+    """Server-sent events with the job state each time it changes, until it finishes."""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        current = job
+        last_state = None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + JOB_EVENTS_MAX_SECONDS
+        while True:
+            state = (current["status"], current["attempts"], current["updated_at"])
+            if state != last_state:
+                last_state = state
+                yield sse_event("status", _job_response(request, current))
+            if current["status"] in TERMINAL_STATUSES or loop.time() > deadline or await request.is_disconnected():
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+            current = await asyncio.to_thread(job_queue.get, job_id) or current
+
+    return sse_response(events())
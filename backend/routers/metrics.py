@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from utils.metrics import metrics
+from utils.generation_executor import generation_executor
+
+router = APIRouter()
+
+metrics.gauge("generation_in_flight", "Model calls running now.", lambda: generation_executor.in_flight)
+metrics.gauge("generation_queue_depth", "Model calls waiting for a slot.", lambda: generation_executor.waiting)
+
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    """Request, stage and payload-size histograms of this process in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
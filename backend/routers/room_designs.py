@@ -1,28 +1,115 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
-from config.supabase_client import supabase
+from utils.image_cache import invalidate_cached_image
+from utils.result_cache import result_cache
+from utils.pagination import select_columns, page_results
+from utils.repositories import room_design_repo, placement_repo, room_images
+from utils.image_derivatives import with_thumbnail_fallback
+from utils.image_pipeline import ImageDecodeError, fingerprint_image
+from utils.tracing import span
+from utils.similarity_index import design_index, similarity_k, rank_rows
+from utils.uploads import read_upload
+from utils.batch import parse_batch_ids
+from utils.storage_gc import remove_images
+import asyncio
 import traceback
 
 router = APIRouter()
 
+ROOM_DESIGN_FIELDS = [
+    "id", "user_id", "original_image_url", "generated_image_url",
+    "original_thumbnail_url", "original_preview_url", "generated_thumbnail_url", "generated_preview_url",
+    "design_type", "room_type", "style", "background_color", "foreground_color", "instructions", "description", "created_at",
+]
+# The long AI description is left out of list pages unless asked for with fields=
+ROOM_DESIGN_LIST_FIELDS = [field for field in ROOM_DESIGN_FIELDS if field != "description"]
+
 @router.get("/room-designs/list")
-async def list_room_designs(limit: int = 50):
+async def list_room_designs(limit: int = 50, cursor: str = None, fields: str = None):
     try:
-        response = supabase.table("room_designs").select("*").order("created_at", desc=True).limit(limit).execute()
-        return JSONResponse({"designs": response.data or []})
+        columns = select_columns(fields, ROOM_DESIGN_FIELDS, ROOM_DESIGN_LIST_FIELDS)
+        rows = await room_design_repo.list_page(columns, cursor, limit)
+        designs, next_cursor = page_results(rows, limit)
+        designs = [_list_row(row) for row in designs]
+        return JSONResponse({"designs": designs, "next_cursor": next_cursor})
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"List error: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+def _list_row(row: dict) -> dict:
+    return with_thumbnail_fallback(with_thumbnail_fallback(dict(row), "original_", "original_image_url"), "generated_", "generated_image_url")
+
+
+async def _similar_designs(phash: int, histogram, k: int, max_distance: int, room_type: str, exclude: str = None) -> JSONResponse:
+    await design_index.ready()
+    with span("similarity.query", index="room_designs", entries=len(design_index)):
+        matches = design_index.query(phash, histogram, similarity_k(k), max_distance, room_type, exclude)
+    columns = ", ".join(ROOM_DESIGN_LIST_FIELDS)
+    rows = await rank_rows(matches, lambda ids: room_design_repo.get_many(ids, columns))
+    return JSONResponse({"designs": [_list_row(row) for row in rows]})
+
+
+# Declared before /room-designs/{design_id} so "similar" is not taken for an id
+@router.get("/room-designs/similar")
+async def similar_room_designs(design_id: str, k: int = 10, max_distance: int = None, room_type: str = None):
+    """Designs whose generated images look most like ``design_id``'s, closest first.
+
+    Ranked by perceptual-hash Hamming distance (0-64) with color histogram distance breaking
+    ties; ``room_type`` restricts the matches.
+    """
+    try:
+        await design_index.ready()
+        entry = design_index.get(design_id)
+        if entry is None:
+            design = await room_design_repo.get(design_id, "id, generated_phash, generated_color_hist")
+            if not design:
+                raise HTTPException(status_code=404, detail="Room design not found")
+            if design.get("generated_phash") is None:
+                raise HTTPException(status_code=409, detail="Room design image has not been hashed yet")
+            entry = (design["generated_phash"], design.get("generated_color_hist"))
+        phash, histogram = entry
+        return await _similar_designs(phash, histogram, k, max_distance, room_type, exclude=design_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Similar designs error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.post("/room-designs/similar")
+async def similar_room_designs_to_image(
+    image: UploadFile = File(...),
+    k: int = Form(10),
+    max_distance: int = Form(None),
+    room_type: str = Form(None),
+):
+    """Designs whose generated images look most like an uploaded photo, closest first."""
+    try:
+        upload = await read_upload(image, "image")
+        (phash, histogram), _ = await asyncio.gather(fingerprint_image(upload.data), design_index.ready())
+        return await _similar_designs(phash, histogram, k, max_distance, room_type)
+    except HTTPException:
+        raise
+    except ImageDecodeError:
+        raise HTTPException(status_code=400, detail="Could not decode the image")
+    except Exception as e:
+        print(f"Similar designs error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
 @router.get("/room-designs/{design_id}")
 async def get_room_design(design_id: str):
     try:
-        response = supabase.table("room_designs").select("*").eq("id", design_id).maybeSingle().execute()
-        if not response.data:
+        design = await room_design_repo.get(design_id)
+        if not design:
             raise HTTPException(status_code=404, detail="Room design not found")
-        return JSONResponse({"design": response.data})
+        return JSONResponse({"design": design})
     except HTTPException:
         raise
     except Exception as e:
@@ -34,26 +121,14 @@ async def get_room_design(design_id: str):
 @router.delete("/room-designs/{design_id}")
 async def delete_room_design(design_id: str):
     try:
-        res = supabase.table("room_designs").select("original_image_url, generated_image_url").eq("id", design_id).maybeSingle().execute()
-        if not res.data:
+        design = await room_design_repo.get(design_id, "id, original_image_url, generated_image_url")
+        if not design:
             raise HTTPException(status_code=404, detail="Room design not found")
 
-        # Delete from storage
-        try:
-            if res.data["original_image_url"]:
-                original_path = res.data["original_image_url"].split("/room-images/")[-1]
-                supabase.storage.from_("room-images").remove([original_path])
-        except Exception as storage_err:
-            print(f"Failed to delete original image: {storage_err}")
-
-        try:
-            if res.data["generated_image_url"]:
-                generated_path = res.data["generated_image_url"].split("/room-images/")[-1]
-                supabase.storage.from_("room-images").remove([generated_path])
-        except Exception as storage_err:
-            print(f"Failed to delete generated image: {storage_err}")
-
-        supabase.table("room_designs").delete().eq("id", design_id).execute()
+        # Placement rows go with the design (ON DELETE CASCADE), their images don't
+        placements = await placement_repo.list_for_design(design_id, "image_url")
+        await room_design_repo.delete(design_id)
+        await _forget_designs([design], placements)
 
         return JSONResponse({"message": "Room design deleted successfully"})
     except HTTPException:
@@ -62,3 +137,48 @@ async def delete_room_design(design_id: str):
         print(f"Delete error: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.post("/room-designs/delete/batch")
+async def delete_room_designs_batch(ids: str = Form(...)):
+    """Delete up to ``BATCH_MAX_ITEMS`` comma-separated design ids, with their furniture placements,
+    in one database and one Storage call."""
+    try:
+        ids_list = parse_batch_ids(ids)
+        designs = await room_design_repo.get_many(ids_list, "id, original_image_url, generated_image_url")
+        found = {design["id"] for design in designs}
+        removed = 0
+        if designs:
+            placements = await placement_repo.list_for_designs(list(found), "image_url")
+            await room_design_repo.delete_many(list(found))
+            removed = await _forget_designs(designs, placements)
+
+        return JSONResponse({
+            "deleted": [design_id for design_id in ids_list if design_id in found],
+            "not_found": [design_id for design_id in ids_list if design_id not in found],
+            "storage_objects_removed": removed,
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Batch delete error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+async def _forget_designs(designs: list[dict], placements: list[dict]) -> int:
+    """Remove deleted designs' images (with their variants and placement images) in one Storage
+    call and drop them from memory; returns the Storage objects removed.
+
+    Rows are deleted first, so a failed removal leaves orphaned objects for the storage GC
+    rather than rows pointing at missing images.
+    """
+    urls = [design[column] for design in designs for column in ("original_image_url", "generated_image_url")]
+    urls += [placement["image_url"] for placement in placements]
+    removed = await remove_images(room_images, urls)
+    for design in designs:
+        design_index.remove(design["id"])
+        result_cache.discard_design(design["id"])
+    for url in urls:
+        await invalidate_cached_image(url)
+    return removed
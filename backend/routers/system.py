@@ -0,0 +1,87 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from utils.job_queue import job_queue
+from utils.generation_executor import generation_executor
+from utils.generation_backend import get_generation_backend
+from utils.generation_output import generation_latency
+from utils.image_cache import image_cache
+from utils.result_cache import result_cache
+from utils.query_cache import query_cache
+from utils.rate_limit import generation_rate_limiter
+from utils.image_pipeline import pipeline_stats
+from utils.similarity_index import furniture_index, design_index
+from utils.prompts import furniture_part_cache
+from utils.tracing import span_exporter
+import asyncio
+
+router = APIRouter()
+
+@router.get("/system/generation-queue")
+async def generation_queue_stats():
+    return JSONResponse({"generation": generation_executor.stats()})
+
+
+@router.get("/system/generation-latency")
+async def generation_latency_stats():
+    backend = get_generation_backend()
+    return JSONResponse({
+        "backend": backend.name,
+        "model": backend.model,
+        "generation_latency": generation_latency.snapshot(),
+    })
+
+
+@router.get("/system/generation-routes")
+async def generation_route_stats():
+    return JSONResponse({"generation_routes": get_generation_backend().stats()})
+
+
+@router.get("/system/rate-limit")
+async def rate_limit_stats():
+    return JSONResponse({"rate_limit": generation_rate_limiter.stats()})
+
+
+@router.get("/system/image-cache")
+async def image_cache_stats():
+    return JSONResponse({"image_cache": image_cache.stats()})
+
+
+@router.get("/system/result-cache")
+async def result_cache_stats():
+    return JSONResponse({"result_cache": result_cache.stats()})
+
+
+@router.get("/system/query-cache")
+async def query_cache_stats():
+    return JSONResponse({"query_cache": query_cache.stats()})
+
+
+@router.get("/system/furniture-parts")
+async def furniture_part_cache_stats():
+    return JSONResponse({"furniture_parts": furniture_part_cache.stats()})
+
+
+@router.get("/system/tracing")
+async def tracing_stats():
+    return JSONResponse({"tracing": span_exporter.stats()})
+
+
+@router.get("/system/jobs")
+async def job_stats():
+    return JSONResponse({"jobs": await asyncio.to_thread(job_queue.stats)})
+
+
+@router.post("/system/jobs/requeue-failed")
+async def requeue_failed_jobs(kind: str = None):
+    """Replay failed jobs, e.g. the room designs whose background persistence ran out of attempts."""
+    return JSONResponse({"requeued": await asyncio.to_thread(job_queue.requeue_failed, kind)})
+
+
+@router.get("/system/image-pipeline")
+async def image_pipeline_stats():
+    return JSONResponse({"image_pipeline": pipeline_stats.snapshot()})
+
+
+@router.get("/system/similarity-index")
+async def similarity_index_stats():
+    return JSONResponse({"similarity_index": {"furniture": furniture_index.stats(), "room_designs": design_index.stats()}})
@@ -1,29 +1,33 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
 from fastapi.responses import JSONResponse
-from utils.base64_helpers import array_buffer_to_base64
-from dotenv import load_dotenv
-import os
-from google import genai
 from google.genai import types
 import traceback
-import base64
 from typing import List
-from config.supabase_client import supabase
-import requests
-import uuid
-
-load_dotenv()
+from utils.generation_executor import GenerationQueueFull, queue_full_http_exception
+from utils.image_fetcher import fetch_image
+from utils.result_cache import result_cache, generation_cache_key
+from utils.image_cache import cache_image
+from utils.image_response import image_field
+from utils.image_pipeline import normalize_image, ImageDecodeError
+from utils.uploads import read_upload
+from utils.repositories import furniture_repo, room_design_repo
+from utils.design_persistence import persist_design, enqueue_persist_design, insert_designs, PERSIST_SYNC, PERSIST_BACKGROUND, PERSIST_DEFERRED
+from utils.batch import BatchItem, read_batch, completed_in_batches, ndjson_response, BATCH_TRY_ON_CONCURRENCY
+from utils.generation_backend import get_generation_backend
+from utils.rate_limit import generation_rate_limiter
+from utils.generation_output import GenerationOutput, generate, stream_generation, sse_event, sse_response
+from utils.prompts import try_on_prompt, furniture_part_cache
+from utils.structured_log import get_logger
+from utils.tracing import traced
+import asyncio
 
 router = APIRouter()
+logger = get_logger("try_on")
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("Missing GEMINI_API_KEY in .env")
-
-client = genai.Client(api_key=GEMINI_API_KEY)
 
 @router.post("/try-on")
 async def try_on(
+    request: Request,
     place_image: UploadFile = File(...),
     design_type: str = Form(...),
     room_type: str = Form(...),
@@ -32,212 +36,443 @@ async def try_on(
     foreground_color: str = Form(...),
     instructions: str = Form(""),
     furniture_ids: str = Form(""),
+    inline: bool = False,
+    background_persist: bool = False,
+):
+    try:
+        place_upload = await read_upload(place_image, "place_image")
+        await generation_rate_limiter.check(request, images=1 + len(parse_furniture_ids(furniture_ids)))
+
+        content, image_data, image_mime_type = await run_try_on(
+            place_upload.data,
+            place_upload.mime_type,
+            design_type,
+            room_type,
+            style,
+            background_color,
+            foreground_color,
+            instructions,
+            furniture_ids,
+            PERSIST_BACKGROUND if background_persist else PERSIST_SYNC,
+        )
 
+        return JSONResponse(
+            content={
+                **content,
+                "image": image_field(request, content["image_id"], image_data, image_mime_type, inline),
+            }
+        )
+
+    except GenerationQueueFull as e:
+        raise queue_full_http_exception(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in /api/try-on endpoint: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.post("/try-on/stream")
+async def try_on_stream(
+    request: Request,
+    place_image: UploadFile = File(...),
+    design_type: str = Form(...),
+    room_type: str = Form(...),
+    style: str = Form(...),
+    background_color: str = Form(...),
+    foreground_color: str = Form(...),
+    instructions: str = Form(""),
+    furniture_ids: str = Form(""),
+    inline: bool = False,
 ):
+    """Server-sent events variant of ``/try-on`` that forwards the model output as it arrives.
+
+    Events: ``text`` (a description delta), ``image`` (as soon as the image part arrives),
+    ``done`` (the same content as ``/try-on`` once stored, plus model ``timings``) and
+    ``error``. Input errors are still returned as plain HTTP errors before the stream starts.
+    """
     try:
-        
-        MAX_IMAGE_SIZE_MB = 10
-        ALLOWED_MIME_TYPES = {
-            "image/jpeg",
-            "image/png",
-            "image/webp",
-            "image/heic",
-            "image/heif",
+        ids_list = parse_furniture_ids(furniture_ids)
+        place_upload = await read_upload(place_image, "place_image")
+        await generation_rate_limiter.check(request, images=1 + len(ids_list))
+        fields = {
+            "design_type": design_type,
+            "room_type": room_type,
+            "style": style,
+            "background_color": background_color,
+            "foreground_color": foreground_color,
+            "instructions": instructions,
         }
+        cache_key = generation_cache_key(place_upload.data, ids_list, **fields)
 
-        if place_image.content_type not in ALLOWED_MIME_TYPES:
-            raise HTTPException(
-                status_code=400, detail=f"Unsupported file type for place_image: {place_image.content_type}"
-            )
-
-        place_bytes = await place_image.read()
-
-        size_in_mb_for_place_image = len(place_bytes) / (1024 * 1024)
-        if size_in_mb_for_place_image > MAX_IMAGE_SIZE_MB:
-            raise HTTPException(status_code=400, detail="Image exceeds 10MB size limit for place_image")
-
-
-        place_b64 = array_buffer_to_base64(place_bytes)
-
-        furniture_info = ""
-        furniture_parts = []
-
-        if furniture_ids:
-            ids_list = [fid.strip() for fid in furniture_ids.split(",") if fid.strip()]
-
-            if ids_list:
-                furniture_response = supabase.table("furniture_items").select("*").in_("id", ids_list).execute()
-
-                if furniture_response.data:
-                    furniture_info = "\n\n### User's Furniture to Include:\n"
-
-                    for idx, furniture in enumerate(furniture_response.data):
-                        furniture_info += f"{idx + 1}. **{furniture['name']}** (Category: {furniture['category']})\n"
-
-                        try:
-                            img_response = requests.get(furniture['image_url'], timeout=10)
-                            if img_response.status_code == 200:
-                                furniture_parts.append(
-                                    types.Part.from_bytes(
-                                        data=img_response.content,
-                                        mime_type="image/jpeg"
-                                    )
-                                )
-                        except Exception as img_err:
-                            print(f"Failed to fetch furniture image: {img_err}")
-
-        prompt = f"""
-        You are a professional AI interior and exterior designer.
-        Your task is to redesign a user's uploaded space.
-
-        ### User Input
-        - **Design Type:** {design_type}
-        - **Room Type:** {room_type}
-        - **Style:** {style}
-        - **Background Color Preference:** {background_color}
-        - **Foreground Color Preference:** {foreground_color}
-        - **Instructions:** {instructions}
-        {furniture_info}
-
-        ### Objective:
-        1. Apply the chosen design style (e.g., {style}) to the uploaded {room_type}.
-        2. Enhance the space visually while respecting the structure of the original layout.
-        3. Harmonize background/foreground color preferences subtly in the decor.
-        4. Produce a **photo-realistic redesign image** and a **short textual description**.
-        5. You don't need change any structure of the room, just the design.
-        6. The design should be realistic and practical for the user.
-        7. The design should be aligned with the user's preferences and instructions.
-        8. Also return the cost and time required for the redesign.
-        9. Return the cost of design and the the in depth description of the design.
-        10. Return all colors of the design in hex format.
-        11. Return cost of the design in USD.
-        12. **IMPORTANT**: If user furniture images are provided, naturally integrate them into the redesigned space. Place them appropriately based on their category and the room layout. Make sure they blend seamlessly with the overall design aesthetic.
-
-        Return:
-        - A realistic redesigned image of the space.
-        - A short caption describing the redesign, highlighting how it aligns with the selected preferences and suggesting improvements.
-        """
-               
-   
-        
-        print(prompt)
-
-        contents=[
-            prompt,
-            types.Part.from_bytes(
-                data=place_bytes,
-                mime_type= place_image.content_type,
-            )
-        ]
+        cached = await _cached_try_on_response(cache_key)
+        if cached:
+            content, image_data, image_mime_type = cached
+            done = {**content, "image": image_field(request, content["image_id"], image_data, image_mime_type, inline)}
+            return sse_response(iter([sse_event("done", done)]))
 
-        contents.extend(furniture_parts)
+        place_bytes, place_mime_type, contents, failed_furniture = await _prepare_try_on(place_upload.data, ids_list, **fields)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in /api/try-on/stream endpoint: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
 
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-preview-image-generation",
-            contents=contents,
-            config=types.GenerateContentConfig(
-            response_modalities=['TEXT', 'IMAGE']
+    async def events():
+        try:
+            stream = stream_generation(
+                "try-on",
+                get_generation_backend().generate_content_stream,
+                "No Description available.",
+                contents=contents,
             )
-        )
-
+            timings = None
+            async for event, value in stream:
+                if event == "text":
+                    yield sse_event("text", {"text": value})
+                elif event == "image":
+                    image_data, image_mime_type = value
+                    image_id = await cache_image(None, image_data)
+                    yield sse_event("image", {"image_id": image_id, "image": image_field(request, image_id, image_data, image_mime_type, inline)})
+                elif event == "timings":
+                    timings = value
+                elif event == "done":
+                    content, image_data, image_mime_type = await _finish_try_on(
+                        cache_key, value, place_bytes, place_mime_type, fields, failed_furniture, PERSIST_SYNC
+                    )
+                    done = {**content, "image": image_field(request, content["image_id"], image_data, image_mime_type, inline), "timings": timings}
+                    yield sse_event("done", done)
+        except GenerationQueueFull as e:
+            yield sse_event("error", {"detail": "Too many generations in progress, please retry later", "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"Error in /api/try-on/stream endpoint: {e}")
+            traceback.print_exc()
+            yield sse_event("error", {"detail": "Internal Server Error"})
+
+    return sse_response(events())
+
+
+@router.post("/try-on/batch")
+async def try_on_batch(
+    request: Request,
+    place_images: List[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    design_type: str = Form(...),
+    room_type: str = Form(...),
+    style: str = Form(...),
+    background_color: str = Form(...),
+    foreground_color: str = Form(...),
+    instructions: str = Form(""),
+    furniture_ids: str = Form(""),
+):
+    """Redesign many room images (files and/or a zip) with the same settings.
 
-        print(response)
-        
-        image_data = None
-        text_response = "No Description available."
-        if response.candidates and len(response.candidates) > 0:
-            parts = response.candidates[0].content.parts
-
-            if parts:
-                print("Number of parts in response:", len(parts))
-
-                for part in parts:
-                    if hasattr(part, "inline_data") and part.inline_data:
-                        image_data = part.inline_data.data
-                        image_mime_type = getattr(part.inline_data, "mime_type", "image/png")
-                        print("Image data received, length:", len(image_data))
-                        print("MIME type:", image_mime_type)
-
-                    elif hasattr(part, "text") and part.text:
-                        text_response = part.text
-                        preview = (text_response[:100] + "...") if len(text_response) > 100 else text_response
-                        print("Text response received:", preview)
-            else:
-                print("No parts found in the response candidate.")
-        else:
-            print("No candidates found in the API response.")
-
-        image_url = None
-        generated_image_storage_url = None
-        original_image_storage_url = None
+    One NDJSON line is streamed per image as it finishes. Generations run with bounded
+    parallelism on top of the shared generation queue, and the ``room_designs`` rows are
+    inserted in bulk. Each image is charged to the client's rate limit when it starts; images
+    past the budget get an error line with ``retry_after``.
+    """
+    try:
+        items = await read_batch(place_images, archive, "place_image")
+        furniture_count = len(parse_furniture_ids(furniture_ids))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in /api/try-on/batch endpoint: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Internal Server Error")
 
-        if image_data:
-            image_base64 = base64.b64encode(image_data).decode("utf-8")
-            image_url = f"data:{image_mime_type};base64,{image_base64}"
+    async def generate(item: BatchItem):
+        # Charged per image as it is processed: a batch may cost more than one bucket holds,
+        # and the images past the client's budget are reported as rate limited
+        await generation_rate_limiter.check(request, images=1 + furniture_count, input_bytes=len(item.upload.data))
+        return await run_try_on(
+            item.upload.data,
+            item.upload.mime_type,
+            design_type,
+            room_type,
+            style,
+            background_color,
+            foreground_color,
+            instructions,
+            furniture_ids,
+            PERSIST_DEFERRED,
+        )
 
-            # Store original image to Supabase storage
+    return ndjson_response(_try_on_batch_results(request, items, generate))
+
+
+def _batch_error_line(item: BatchItem, error: Exception) -> dict:
+    if isinstance(error, GenerationQueueFull):
+        return item.error_line("Generation queue is full", retry_after=error.retry_after)
+    if isinstance(error, HTTPException) and error.status_code == 429:
+        return item.error_line(error.detail, retry_after=int(error.headers["Retry-After"]))
+    if isinstance(error, HTTPException):
+        return item.error_line(error.detail)
+    print(f"Batch try-on of {item.filename} failed: {error}")
+    traceback.print_exception(error)
+    return item.error_line("Internal Server Error")
+
+
+async def _try_on_batch_results(request: Request, items: List[BatchItem], generate):
+    for item in items:
+        if item.error:
+            yield item.error_line(item.error)
+
+    valid = [item for item in items if not item.error]
+    async for batch in completed_in_batches(valid, generate, BATCH_TRY_ON_CONCURRENCY):
+        lines = []
+        pending = []
+        for item, result, error in batch:
+            if error:
+                lines.append(_batch_error_line(item, error))
+                continue
+            content, image_data, image_mime_type = result
+            line = item.ok_line(**content, image=image_field(request, content["image_id"], image_data, image_mime_type, False))
+            pending_design = line.pop("pending_design", None)
+            if pending_design:
+                pending.append((line, pending_design))
+            lines.append(line)
+
+        if pending:
             try:
-                original_ext = place_image.filename.split(".")[-1] if place_image.filename else "jpg"
-                original_filename = f"original_{uuid.uuid4()}.{original_ext}"
-                original_path = f"room-designs/originals/{original_filename}"
-
-                supabase.storage.from_("room-images").upload(
-                    path=original_path,
-                    file=place_bytes,
-                    file_options={"content-type": place_image.content_type}
-                )
-                original_image_storage_url = supabase.storage.from_("room-images").get_public_url(original_path)
-            except Exception as storage_err:
-                print(f"Failed to store original image: {storage_err}")
-
-            # Store generated image to Supabase storage
-            try:
-                generated_filename = f"generated_{uuid.uuid4()}.png"
-                generated_path = f"room-designs/generated/{generated_filename}"
-
-                supabase.storage.from_("room-images").upload(
-                    path=generated_path,
-                    file=image_data,
-                    file_options={"content-type": image_mime_type}
-                )
-                generated_image_storage_url = supabase.storage.from_("room-images").get_public_url(generated_path)
-            except Exception as storage_err:
-                print(f"Failed to store generated image: {storage_err}")
-        else:
-            image_url = None
-
-        # Save to database if we have both URLs
-        design_id = None
-        if original_image_storage_url and generated_image_storage_url:
-            try:
-                db_response = supabase.table("room_designs").insert({
-                    "original_image_url": original_image_storage_url,
-                    "generated_image_url": generated_image_storage_url,
-                    "design_type": design_type,
-                    "room_type": room_type,
-                    "style": style,
-                    "background_color": background_color,
-                    "foreground_color": foreground_color,
-                    "instructions": instructions,
-                    "description": text_response
-                }).execute()
-
-                if db_response.data:
-                    design_id = db_response.data[0]["id"]
+                design_ids = await insert_designs([(design["cache_key"], design["row"]) for _, design in pending])
+                for line, design in pending:
+                    line["design_id"] = design_ids.get(design["cache_key"])
             except Exception as db_err:
-                print(f"Failed to save to database: {db_err}")
+                print(f"Failed to save batch designs to database: {db_err}")
+
+        for line in lines:
+            yield line
+
+
+async def run_try_on(
+    place_bytes: bytes,
+    place_mime_type: str,
+    design_type: str,
+    room_type: str,
+    style: str,
+    background_color: str,
+    foreground_color: str,
+    instructions: str,
+    furniture_ids: str,
+    persist_mode: str = PERSIST_SYNC,
+):
+    """Redesign an already validated room image, reusing a stored result for identical input.
+
+    Shared by the synchronous endpoint and the job workers. Returns the JSON content (without
+    the ``image`` field), the generated image bytes and their MIME type.
+    """
+    ids_list = parse_furniture_ids(furniture_ids)
+    cache_key = generation_cache_key(
+        place_bytes,
+        ids_list,
+        design_type=design_type,
+        room_type=room_type,
+        style=style,
+        background_color=background_color,
+        foreground_color=foreground_color,
+        instructions=instructions,
+    )
+
+    result = await _cached_try_on_response(cache_key)
+    if result is None:
+        # Identical requests running at the same time share a single generation (per persist mode,
+        # since only a sync leader's result carries a design id).
+        result = await result_cache.single_flight(
+            cache_key if persist_mode == PERSIST_SYNC else f"{cache_key}:{persist_mode}",
+            lambda: _generate_try_on(
+                cache_key,
+                place_bytes,
+                place_mime_type,
+                ids_list,
+                design_type,
+                room_type,
+                style,
+                background_color,
+                foreground_color,
+                instructions,
+                persist_mode,
+            ),
+        )
+    return result
+
+
+def parse_furniture_ids(furniture_ids: str) -> List[str]:
+    return [fid.strip() for fid in furniture_ids.split(",") if fid.strip()]
+
+
+async def _cached_try_on_response(cache_key: str):
+    design_id = result_cache.get(cache_key)
+    if not design_id:
+        return None
+
+    design = await room_design_repo.get(design_id)
+    if not design:
+        result_cache.discard(cache_key)
+        return None
+
+    generated_image = await fetch_image(design["generated_image_url"])
+    if not generated_image.ok:
+        print(f"Failed to fetch cached design image: {generated_image.error}")
+        result_cache.discard(cache_key)
+        return None
+
+    image_id = await cache_image(design["generated_image_url"], generated_image.data)
+    content = {
+        "image_id": image_id,
+        "text": design["description"],
+        "design_id": design_id,
+        "generated_image_url": design["generated_image_url"],
+        "original_image_url": design["original_image_url"],
+        "persist_job_id": None,
+        "failed_furniture": [],
+        "cached": True
+    }
+    return content, generated_image.data, generated_image.mime_type
+
+
+@traced("try_on.prepare")
+async def _prepare_try_on(
+    place_bytes: bytes,
+    ids_list: List[str],
+    design_type: str,
+    room_type: str,
+    style: str,
+    background_color: str,
+    foreground_color: str,
+    instructions: str,
+):
+    """Normalize the room image, load the requested furniture and build the model request.
 
-        return JSONResponse(
-        content={
-            "image": image_url,
-            "text": text_response,
-            "design_id": design_id,
-            "generated_image_url": generated_image_storage_url
-        }
+    Returns the normalized image bytes and MIME type, the ``contents`` for the model and the
+    furniture whose images could not be fetched.
+    """
+    try:
+        place_bytes, place_mime_type, _ = await normalize_image(place_bytes)
+    except ImageDecodeError:
+        raise HTTPException(status_code=400, detail="Could not decode place_image")
+
+    furniture_lines = []
+    furniture_parts = []
+    failed_furniture = []
+
+    if ids_list:
+        furniture_items = await furniture_repo.get_many(ids_list)
+        if furniture_items:
+            furniture_lines, furniture_parts, failed_furniture = await furniture_part_cache.get_many(furniture_items)
+            for failed in failed_furniture:
+                logger.warning("furniture_image_fetch_failed", furniture_id=failed["id"], error=failed["error"])
+
+    prompt = try_on_prompt(
+        {
+            "design_type": design_type,
+            "room_type": room_type,
+            "style": style,
+            "background_color": background_color,
+            "foreground_color": foreground_color,
+            "instructions": instructions,
+        },
+        furniture_lines,
+    )
+    logger.debug("prompt", operation="try-on", prompt=prompt, furniture=len(furniture_parts))
+
+    contents = [
+        prompt,
+        types.Part.from_bytes(
+            data=place_bytes,
+            mime_type=place_mime_type,
         )
+    ]
 
-    except Exception as e:
-        print(f"Error in /api/try-on endpoint: {e}")
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail="Internal Server Error")
-    
+    contents.extend(furniture_parts)
+    return place_bytes, place_mime_type, contents, failed_furniture
+
+
+@traced("try_on.finish")
+async def _finish_try_on(
+    cache_key: str,
+    output: GenerationOutput,
+    place_bytes: bytes,
+    place_mime_type: str,
+    fields: dict,
+    failed_furniture: list,
+    persist_mode: str,
+):
+    """Persist a finished generation according to ``persist_mode`` and build the response content."""
+    image_data, image_mime_type, text_response = output.image_data, output.image_mime_type, output.text
+    image_id = None
+    persist_job_id = None
+    pending_design = None
+    if persist_mode == PERSIST_BACKGROUND:
+        # Respond with the image now; a job worker uploads both images and inserts the row.
+        # Without a generated image there is nothing to persist
+        if image_data:
+            image_id = await cache_image(None, image_data)
+            job = await asyncio.to_thread(
+                enqueue_persist_design, cache_key, fields, text_response, place_bytes, place_mime_type, image_data, image_mime_type
+            )
+            persist_job_id = job["id"]
+        persisted = {"design_id": None, "original_image_url": None, "generated_image_url": None}
+    else:
+        persisted = await persist_design(
+            cache_key, fields, text_response, place_bytes, place_mime_type, image_data, image_mime_type,
+            insert=persist_mode != PERSIST_DEFERRED,
+        )
+        if persisted.get("row"):
+            pending_design = {"cache_key": cache_key, "row": persisted["row"]}
+        if image_data:
+            # Keep the bytes locally so /api/images/{image_id} can serve them without a Storage round trip
+            image_id = await cache_image(persisted["generated_image_url"], image_data)
+
+    content = {
+        "image_id": image_id,
+        "text": text_response,
+        "design_id": persisted["design_id"],
+        "generated_image_url": persisted["generated_image_url"],
+        "original_image_url": persisted["original_image_url"],
+        "persist_job_id": persist_job_id,
+        "failed_furniture": failed_furniture,
+        "cached": False
+    }
+    if pending_design:
+        # Inserted in bulk by the caller, which removes this key before responding
+        content["pending_design"] = pending_design
+    return content, image_data, image_mime_type
+
+
+async def _generate_try_on(
+    cache_key: str,
+    place_bytes: bytes,
+    place_mime_type: str,
+    ids_list: List[str],
+    design_type: str,
+    room_type: str,
+    style: str,
+    background_color: str,
+    foreground_color: str,
+    instructions: str,
+    persist_mode: str,
+):
+    place_bytes, place_mime_type, contents, failed_furniture = await _prepare_try_on(
+        place_bytes, ids_list, design_type, room_type, style, background_color, foreground_color, instructions
+    )
+
+    output = await generate(
+        "try-on",
+        get_generation_backend().generate_content,
+        "No Description available.",
+        contents=contents,
+    )
+
+    fields = {
+        "design_type": design_type,
+        "room_type": room_type,
+        "style": style,
+        "background_color": background_color,
+        "foreground_color": foreground_color,
+        "instructions": instructions,
+    }
+    return await _finish_try_on(cache_key, output, place_bytes, place_mime_type, fields, failed_furniture, persist_mode)
@@ -0,0 +1,96 @@
+"""Compute the perceptual hashes of images stored before similarity search existed.
+
+Run from the backend folder once the ``add_image_hashes`` migration is applied:
+
+    python -m scripts.backfill_image_hashes [--table furniture|room_designs|all]
+                                            [--concurrency 16] [--batch-size 200] [--dry-run]
+
+Rows without a hash are read in id order, ``--batch-size`` at a time. Within a batch up to
+``--concurrency`` rows are in flight at once, each downloading its image, hashing it in the
+image process pool and writing the hash back, so downloads, hashing and writes overlap.
+Rows whose image cannot be fetched or decoded are reported and left NULL; running the script
+again retries them. Running servers pick the new hashes up on their next index refresh.
+"""
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass
+
+# Imported first: it loads .env before the other modules read their settings
+from config.supabase_client import close_supabase
+from utils.image_fetcher import close_http_client, get_http_client
+from utils.image_pipeline import fingerprint_image, shutdown_image_pipeline
+from utils.repositories import furniture_repo, room_design_repo, scan
+from utils.similarity_index import hash_columns
+
+
+@dataclass
+class Target:
+    repo: object
+    image_column: str
+    prefix: str
+
+
+TARGETS = {
+    "furniture": Target(furniture_repo, "image_url", ""),
+    "room_designs": Target(room_design_repo, "generated_image_url", "generated_"),
+}
+
+
+async def hash_row(target: Target, row: dict, dry_run: bool, semaphore: asyncio.Semaphore) -> bool:
+    async with semaphore:
+        url = row.get(target.image_column)
+        if not url:
+            return False
+        try:
+            # Fetched directly rather than through fetch_image so a full backfill does not
+            # churn the image cache that running servers share
+            response = await get_http_client().get(url)
+            response.raise_for_status()
+            fingerprint = await fingerprint_image(response.content)
+            if not dry_run:
+                await target.repo.update(row["id"], hash_columns(target.prefix, fingerprint))
+            return True
+        except Exception as e:
+            print(f"{row['id']}: {type(e).__name__}: {e}")
+            return False
+
+
+async def backfill(name: str, concurrency: int, batch_size: int, dry_run: bool):
+    target = TARGETS[name]
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    hashed = failed = 0
+    async for page in scan(
+        target.repo.table,
+        f"id, {target.image_column}",
+        lambda query: query.is_(f"{target.prefix}phash", "null"),
+        page_size=batch_size,
+    ):
+        results = await asyncio.gather(*[hash_row(target, row, dry_run, semaphore) for row in page])
+        hashed += sum(results)
+        failed += len(results) - sum(results)
+        elapsed = time.perf_counter() - started
+        print(f"{name}: {hashed} hashed, {failed} failed ({hashed / elapsed:.1f} rows/s)")
+    print(f"{name}: done in {time.perf_counter() - started:.1f}s{' (dry run, nothing written)' if dry_run else ''}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--table", choices=[*TARGETS, "all"], default="all")
+    parser.add_argument("--concurrency", type=int, default=16, help="rows fetched and hashed at once")
+    parser.add_argument("--batch-size", type=int, default=200, help="rows read per page")
+    parser.add_argument("--dry-run", action="store_true", help="hash the images without writing the hashes")
+    args = parser.parse_args()
+
+    try:
+        for name in TARGETS if args.table == "all" else [args.table]:
+            await backfill(name, args.concurrency, args.batch_size, args.dry_run)
+    finally:
+        await close_http_client()
+        await close_supabase()
+        shutdown_image_pipeline()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
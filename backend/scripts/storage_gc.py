@@ -0,0 +1,39 @@
+"""Remove the Storage images that no database row references.
+
+Run from the backend folder, e.g. nightly from cron:
+
+    python -m scripts.storage_gc [--dry-run] [--min-age-hours 24] [--deletes-per-second 50]
+
+Each image folder is listed in name order and merged with the URLs of the rows that own it,
+read in the same order, so memory stays constant. Orphans (images whose upload succeeded but
+whose row insert failed, or whose removal failed after a delete) are removed in paced
+batches together with their thumbnail and preview variants. The sweep deletes data, so it
+is only run from here by an operator, not exposed over the API.
+"""
+import argparse
+import asyncio
+import json
+
+# Imported first: it loads .env before the other modules read their settings
+from config.supabase_client import close_supabase
+from utils.image_pipeline import shutdown_image_pipeline
+from utils.storage_gc import STORAGE_GC_DELETES_PER_SECOND, STORAGE_GC_MIN_AGE_HOURS, collect_garbage
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="report the orphans without removing them")
+    parser.add_argument("--min-age-hours", type=float, default=STORAGE_GC_MIN_AGE_HOURS, help="keep objects newer than this")
+    parser.add_argument("--deletes-per-second", type=float, default=STORAGE_GC_DELETES_PER_SECOND, help="0 removes without pacing")
+    args = parser.parse_args()
+
+    try:
+        report = await collect_garbage(args.dry_run, args.min_age_hours, args.deletes_per_second)
+        print(json.dumps(report, indent=2))
+    finally:
+        await close_supabase()
+        shutdown_image_pipeline()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
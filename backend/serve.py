@@ -0,0 +1,125 @@
+"""Production entry point: several worker processes serving ``main:app``.
+
+Run from the backend folder:
+
+    python serve.py [--workers 4] [--host 0.0.0.0] [--port 8000]
+
+With gunicorn installed (``pip install gunicorn``) the app is imported once in the master
+process and the workers are forked from it, so they share the imported modules instead of
+each importing them again. Clients are created lazily in each worker (see
+``config/clients.py``). Without gunicorn, or with ``WEB_SERVER=uvicorn``, uvicorn's own
+process manager starts the workers, and each one imports the app.
+
+Either way the workers run uvloop and httptools when they are installed (``pip install
+uvloop httptools``, both part of ``uvicorn[standard]``), and fall back to asyncio and h11.
+Use ``uvicorn main:app --reload`` for development.
+"""
+import argparse
+import importlib.util
+import os
+
+from config.env import load_env
+
+load_env()
+
+WEB_SERVER = os.getenv("WEB_SERVER", "auto").lower()
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", "8000"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(min(4, os.cpu_count() or 1))))
+WEB_KEEPALIVE_SECONDS = int(os.getenv("WEB_KEEPALIVE_SECONDS", "5"))
+# In-flight requests (generations take tens of seconds) get this long to finish on shutdown
+WEB_GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("WEB_GRACEFUL_TIMEOUT_SECONDS", "60"))
+# gunicorn only: a worker whose event loop doesn't check in for this long is restarted
+WEB_WORKER_TIMEOUT_SECONDS = int(os.getenv("WEB_WORKER_TIMEOUT_SECONDS", "120"))
+# gunicorn only: restart each worker after about this many requests (0 never), to bound memory growth
+WEB_MAX_REQUESTS = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+WEB_FORWARDED_ALLOW_IPS = os.getenv("WEB_FORWARDED_ALLOW_IPS", "127.0.0.1")
+WEB_LOG_LEVEL = os.getenv("WEB_LOG_LEVEL", "info")
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def event_loop_and_parser() -> tuple[str, str]:
+    return "uvloop" if _installed("uvloop") else "asyncio", "httptools" if _installed("httptools") else "h11"
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    # uvicorn-worker replaces the deprecated uvicorn.workers module when it is installed
+    worker_module = "uvicorn_worker" if _installed("uvicorn_worker") else "uvicorn.workers"
+    options = {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": f"{worker_module}.UvicornWorker",
+        "preload_app": True,
+        "keepalive": WEB_KEEPALIVE_SECONDS,
+        "graceful_timeout": WEB_GRACEFUL_TIMEOUT_SECONDS,
+        "timeout": WEB_WORKER_TIMEOUT_SECONDS,
+        "max_requests": WEB_MAX_REQUESTS,
+        "max_requests_jitter": WEB_MAX_REQUESTS // 10,
+        "forwarded_allow_ips": WEB_FORWARDED_ALLOW_IPS,
+        "loglevel": WEB_LOG_LEVEL,
+        "accesslog": "-",
+    }
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+            return app
+
+    Server().run()
+
+
+def run_uvicorn(args):
+    import uvicorn
+
+    loop, http = event_loop_and_parser()
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        timeout_keep_alive=WEB_KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=WEB_GRACEFUL_TIMEOUT_SECONDS,
+        proxy_headers=True,
+        forwarded_allow_ips=WEB_FORWARDED_ALLOW_IPS,
+        log_level=WEB_LOG_LEVEL,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=["auto", "gunicorn", "uvicorn"], default=WEB_SERVER)
+    parser.add_argument("--host", default=WEB_HOST)
+    parser.add_argument("--port", type=int, default=WEB_PORT)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS)
+    args = parser.parse_args()
+
+    server = args.server
+    if server == "auto":
+        server = "gunicorn" if _installed("gunicorn") else "uvicorn"
+    loop, http = event_loop_and_parser()
+    print(f"Serving on {args.host}:{args.port} with {args.workers} {server} worker(s), {loop} event loop, {http} parser")
+    rate_limited = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    if args.workers > 1 and rate_limited and os.getenv("RATE_LIMIT_STORE", "memory").lower() != "redis":
+        print(
+            f"Warning: each of the {args.workers} workers keeps its own rate limit buckets, so clients get "
+            f"up to {args.workers}x RATE_LIMIT_CAPACITY; set RATE_LIMIT_STORE=redis to share them"
+        )
+    if server == "gunicorn":
+        run_gunicorn(args)
+    else:
+        run_uvicorn(args)
+
+
+if __name__ == "__main__":
+    main()
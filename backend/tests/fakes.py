@@ -0,0 +1,14 @@
+from typing import Optional
+
+
+class RecordingQuery:
+    """Stands in for a PostgREST query builder and records the calls made on it."""
+
+    def __init__(self, calls: Optional[list] = None):
+        self.calls = calls if calls is not None else []
+
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return record
@@ -0,0 +1,18 @@
+import asyncio
+
+from utils import design_persistence
+from utils.design_persistence import persist_design
+
+
+def test_nothing_is_stored_without_a_generated_image(monkeypatch):
+    uploads = []
+
+    async def upload(path, data, mime_type, upsert=False):
+        uploads.append(path)
+        return f"https://storage/room-images/{path}"
+
+    monkeypatch.setattr(design_persistence.room_images, "upload", upload)
+
+    persisted = asyncio.run(persist_design("key", {}, "no image", b"room", "image/png", None, None))
+    assert persisted == {"design_id": None, "original_image_url": None, "generated_image_url": None}
+    assert uploads == []
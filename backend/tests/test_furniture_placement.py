@@ -0,0 +1,145 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from routers import furniture_placement
+from routers.furniture_placement import _prepare_furniture_placement, furniture_hash
+from tests.fakes import RecordingQuery
+from utils import repositories
+
+DESIGN = {
+    "id": "design-1",
+    "generated_image_url": "https://storage/room-images/room-designs/generated/room.png",
+    "design_type": "interior",
+    "room_type": "bedroom",
+    "style": "modern",
+}
+CHAIR, LAMP, SOFA = b"chair", b"lamp", b"sofa"
+
+
+def placement(placement_id: str, *items: bytes, design_id: str = "design-1") -> dict:
+    hashes = sorted(furniture_hash(item) for item in items)
+    return {
+        "id": placement_id,
+        "room_design_id": design_id,
+        "furniture_hashes": hashes,
+        "version": len(items),
+        "image_url": f"https://storage/room-images/room-designs/placements/{placement_id}.png",
+        "description": "placed",
+    }
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """Placement lookups answered from ``store["closest"]``, recording the sets asked for."""
+    state = {"closest": None, "placements": {}, "asked": [], "fetched": []}
+
+    async def get_design(design_id, columns="*"):
+        return DESIGN if design_id == DESIGN["id"] else None
+
+    async def closest(room_design_id, allowed, required):
+        state["asked"].append((allowed, required))
+        return state["closest"]
+
+    async def get_placement(placement_id):
+        return state["placements"].get(placement_id)
+
+    async def fetch_image(url):
+        state["fetched"].append(url)
+        return SimpleNamespace(ok=True, data=b"room", mime_type="image/png", error=None)
+
+    async def normalize_image(data):
+        return data, "image/jpeg", {}
+
+    monkeypatch.setattr(furniture_placement.room_design_repo, "get", get_design)
+    monkeypatch.setattr(furniture_placement.placement_repo, "closest", closest)
+    monkeypatch.setattr(furniture_placement.placement_repo, "get", get_placement)
+    monkeypatch.setattr(furniture_placement, "fetch_image", fetch_image)
+    monkeypatch.setattr(furniture_placement, "normalize_image", normalize_image)
+    return state
+
+
+def prepare(uploads: list[bytes], base_placement_id=None):
+    files = [(data, "image/png") for data in uploads]
+    return asyncio.run(_prepare_furniture_placement(DESIGN["id"], files, base_placement_id))
+
+
+def test_closest_asks_for_the_largest_stored_subset_of_the_request(monkeypatch):
+    calls = []
+    monkeypatch.setattr(repositories, "get_supabase", lambda: SimpleNamespace(table=lambda name: RecordingQuery(calls)))
+
+    async def execute_read(query):
+        return SimpleNamespace(data=[{"id": "p1"}])
+
+    monkeypatch.setattr(repositories, "execute_read", execute_read)
+
+    row = asyncio.run(repositories.placement_repo.closest("design-1", ["a", "b", "c"], ["c"]))
+    assert row == {"id": "p1"}
+    assert calls == [
+        ("select", ("*",), {}),
+        ("eq", ("room_design_id", "design-1"), {}),
+        ("contained_by", ("furniture_hashes", ["a", "b", "c"]), {}),
+        ("contains", ("furniture_hashes", ["c"]), {}),
+        ("order", ("furniture_count",), {"desc": True}),
+        ("order", ("created_at",), {"desc": True}),
+        ("limit", (1,), {}),
+    ]
+
+
+def test_closest_without_required_items_has_no_contains_filter(monkeypatch):
+    calls = []
+    monkeypatch.setattr(repositories, "get_supabase", lambda: SimpleNamespace(table=lambda name: RecordingQuery(calls)))
+
+    async def execute_read(query):
+        return SimpleNamespace(data=[])
+
+    monkeypatch.setattr(repositories, "execute_read", execute_read)
+
+    assert asyncio.run(repositories.placement_repo.closest("design-1", ["a"], [])) is None
+    assert "contains" not in [name for name, _, _ in calls]
+
+
+def test_first_placement_sends_every_item_on_the_generated_room(store):
+    plan = prepare([CHAIR, LAMP, CHAIR])
+    assert store["asked"] == [(sorted([furniture_hash(CHAIR), furniture_hash(LAMP)]), [])]
+    assert plan.base is None
+    assert plan.added_hashes == [furniture_hash(CHAIR), furniture_hash(LAMP)]
+    assert store["fetched"] == [DESIGN["generated_image_url"]]
+    # The prompt, the room and one part per distinct item
+    assert len(plan.contents) == 4
+
+
+def test_only_items_missing_from_the_closest_version_are_sent(store):
+    store["closest"] = placement("p1", CHAIR)
+    plan = prepare([CHAIR, LAMP])
+    assert plan.base["id"] == "p1"
+    assert plan.added_hashes == [furniture_hash(LAMP)]
+    assert store["fetched"] == [store["closest"]["image_url"]]
+    assert len(plan.contents) == 3
+
+
+def test_exact_stored_set_is_reused_without_a_model_call(store):
+    store["closest"] = placement("p2", CHAIR, LAMP)
+    plan = prepare([LAMP, CHAIR])
+    assert plan.reused
+    assert plan.added_hashes == []
+    assert store["fetched"] == []
+
+
+def test_base_placement_items_are_required_and_kept(store):
+    store["placements"]["p1"] = placement("p1", CHAIR)
+    plan = prepare([SOFA], base_placement_id="p1")
+    assert store["asked"] == [(sorted([furniture_hash(CHAIR), furniture_hash(SOFA)]), [furniture_hash(CHAIR)])]
+    # No closer version stored: build on the base itself
+    assert plan.base["id"] == "p1"
+    assert plan.furniture_hashes == sorted([furniture_hash(CHAIR), furniture_hash(SOFA)])
+    assert plan.added_hashes == [furniture_hash(SOFA)]
+
+
+def test_base_placement_of_another_design_is_a_404(store):
+    store["placements"]["p9"] = placement("p9", CHAIR, design_id="design-2")
+    with pytest.raises(HTTPException) as error:
+        prepare([SOFA], base_placement_id="p9")
+    assert error.value.status_code == 404
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+from utils import generation_router as router_module
+from utils.generation_backend import GenerationBackend
+from utils.generation_executor import GenerationExecutor
+from utils.generation_router import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ModelRouter
+
+
+class SleepyBackend(GenerationBackend):
+    """Answers with its own model name after ``latency`` seconds."""
+
+    def __init__(self, model: str, latency: float):
+        self.model = model
+        self.latency = latency
+        self.calls = 0
+
+    async def generate_content(self, contents: list):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.model
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(router_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failures=3, cooldown=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_lets_one_probe_through_after_the_cooldown(clock):
+    breaker = CircuitBreaker(failures=1, cooldown=30)
+    breaker.record_failure()
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_failed_probe_restarts_the_cooldown(clock):
+    breaker = CircuitBreaker(failures=1, cooldown=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+    clock[0] += 29
+    assert not breaker.allow()
+
+
+def test_cancelled_probe_is_given_back(clock):
+    breaker = CircuitBreaker(failures=1, cooldown=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def hedging_router(executor: GenerationExecutor, hedge_budget: float = 1.0) -> ModelRouter:
+    router = ModelRouter(
+        [SleepyBackend("slow", 0.2), SleepyBackend("fast", 0.0)],
+        deadline=5,
+        hedge_budget=hedge_budget,
+        executor=executor,
+    )
+    # Enough history for the primary's hedge delay to be 10ms
+    router.routes[0].latencies.extend([0.01] * router_module.GENERATION_HEDGE_MIN_SAMPLES)
+    return router
+
+
+async def generate_in_slot(executor: GenerationExecutor, router: ModelRouter):
+    async with executor.slot():
+        return await router.generate_content([])
+
+
+def test_slow_call_is_hedged_in_a_free_slot():
+    executor = GenerationExecutor(max_concurrency=2, max_queue=0, retry_after=1)
+    router = hedging_router(executor)
+    assert asyncio.run(generate_in_slot(executor, router)) == "fast"
+    assert router.hedges == 1 and router.hedge_wins == 1
+    assert executor.in_flight == 0
+
+
+def test_hedge_is_skipped_when_every_slot_is_taken():
+    executor = GenerationExecutor(max_concurrency=1, max_queue=0, retry_after=1)
+    router = hedging_router(executor)
+    assert asyncio.run(generate_in_slot(executor, router)) == "slow"
+    assert router.hedges == 0 and router.hedges_skipped == 1
+    assert router.routes[1].backend.calls == 0
+
+
+def test_skipped_hedge_leaves_a_half_open_breakers_probe_unused():
+    executor = GenerationExecutor(max_concurrency=1, max_queue=0, retry_after=1)
+    router = hedging_router(executor)
+    breaker = router.routes[1].breaker
+    breaker.state = HALF_OPEN
+    assert asyncio.run(generate_in_slot(executor, router)) == "slow"
+    assert router.hedges_skipped == 1
+    assert not breaker.probing
+    assert breaker.allow()
+
+
+def test_slot_is_given_back_when_no_model_can_hedge():
+    executor = GenerationExecutor(max_concurrency=2, max_queue=0, retry_after=1)
+    router = hedging_router(executor)
+    # Opened just now, so it stays open for the whole call
+    router.routes[1].breaker.failures = 1
+    router.routes[1].breaker.record_failure()
+    assert asyncio.run(generate_in_slot(executor, router)) == "slow"
+    assert router.hedges == 0 and router.hedges_skipped == 0
+    assert executor.in_flight == 0
+    assert not executor._semaphore.locked()
+
+
+def test_hedges_stay_within_the_budget():
+    executor = GenerationExecutor(max_concurrency=4, max_queue=0, retry_after=1)
+    router = hedging_router(executor, hedge_budget=0.25)
+
+    async def run():
+        for _ in range(8):
+            # Keep the hedge delay fixed, whatever the unhedged calls added to the window
+            router.routes[0].latencies.clear()
+            router.routes[0].latencies.extend([0.01] * router_module.GENERATION_HEDGE_MIN_SAMPLES)
+            await generate_in_slot(executor, router)
+
+    asyncio.run(run())
+    assert router.calls == 8
+    assert router.hedges == 2
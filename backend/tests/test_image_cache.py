@@ -0,0 +1,47 @@
+from utils.image_cache import ImageCache
+
+URL = "https://host/storage/v1/object/public/room-images/room-designs/generated/room.png"
+
+
+def test_workers_sharing_a_directory_see_each_others_images(tmp_path):
+    writer = ImageCache(memory_budget=1 << 20, disk_budget=1 << 20, disk_dir=str(tmp_path))
+    reader = ImageCache(memory_budget=1 << 20, disk_budget=1 << 20, disk_dir=str(tmp_path))
+    digest = writer.put(URL, b"image bytes")
+
+    assert reader.get_content(digest) == b"image bytes"
+    assert reader.source_url(digest) == URL
+    assert reader.get(URL) == b"image bytes"
+
+
+def test_source_url_outlives_the_evicted_blob(tmp_path):
+    cache = ImageCache(memory_budget=0, disk_budget=16, disk_dir=str(tmp_path))
+    first = cache.put(URL, b"0123456789")
+    cache.put(URL + "?v=2", b"abcdefghij")
+
+    other = ImageCache(memory_budget=0, disk_budget=16, disk_dir=str(tmp_path))
+    assert other.get_content(first) is None
+    assert other.source_url(first) == URL
+
+
+def test_invalidate_on_another_worker_removes_the_shared_image(tmp_path):
+    writer = ImageCache(memory_budget=1 << 20, disk_budget=1 << 20, disk_dir=str(tmp_path))
+    digest = writer.put(URL, b"image bytes")
+    assert writer.get_content(digest) == b"image bytes"
+
+    ImageCache(memory_budget=1 << 20, disk_budget=1 << 20, disk_dir=str(tmp_path)).invalidate(URL)
+
+    fresh = ImageCache(memory_budget=1 << 20, disk_budget=1 << 20, disk_dir=str(tmp_path))
+    assert fresh.get_content(digest) is None
+    assert fresh.source_url(digest) is None
+    # The writer stops serving its in-memory copy too
+    assert writer.get_content(digest) is None
+
+
+def test_url_and_source_entries_are_bounded(tmp_path):
+    cache = ImageCache(memory_budget=0, disk_budget=1 << 20, disk_dir=str(tmp_path), index_entries=10)
+    for i in range(25):
+        cache.put(f"{URL}?v={i}", f"image {i}".encode())
+
+    assert len(list((tmp_path / "urls").iterdir())) <= 10
+    assert len(list((tmp_path / "sources").iterdir())) <= 10
+    assert cache.get(f"{URL}?v=24") == b"image 24"
@@ -0,0 +1,22 @@
+from utils import job_queue as job_queue_module
+from utils.job_queue import JobQueue
+
+
+def test_finished_jobs_are_pruned_with_their_files(tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    files = [(b"room", "image/png", None)]
+    succeeded, _ = queue.enqueue("try-on", {}, files)
+    failed, _ = queue.enqueue("try-on", {}, files)
+    queued, _ = queue.enqueue("try-on", {}, files)
+    queue.complete(succeeded["id"], {})
+    queue.fail(failed["id"], "model down")
+
+    assert queue.prune_finished(older_than_seconds=60) == 0
+
+    now = job_queue_module.time.time()
+    monkeypatch.setattr(job_queue_module.time, "time", lambda: now + 61)
+    assert queue.prune_finished(older_than_seconds=60) == 2
+    assert queue.get(succeeded["id"]) is None and queue.get(failed["id"]) is None
+    assert queue.load_files(failed["id"]) == []
+    assert queue.get(queued["id"])["status"] == "queued"
+    assert queue.load_files(queued["id"]) == files
@@ -0,0 +1,59 @@
+import pytest
+from fastapi import HTTPException
+
+from tests.fakes import RecordingQuery
+from utils.pagination import MAX_PAGE_SIZE, apply_keyset, decode_cursor, encode_cursor, page_results, select_columns
+
+
+def test_cursor_round_trip():
+    row = {"created_at": "2026-10-17T12:00:00.123456+00:00", "id": "5f0c6f0e-5d7b-4a8a-9a55-2a1d2c0f4e11"}
+    assert decode_cursor(encode_cursor(row)) == (row["created_at"], row["id"])
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", encode_cursor({"created_at": 1, "id": "x"}), encode_cursor({"created_at": 'a"b', "id": "x"})])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_first_page_orders_newest_first_and_fetches_one_extra_row():
+    query = apply_keyset(RecordingQuery(), None, 20)
+    assert query.calls == [
+        ("order", ("created_at",), {"desc": True}),
+        ("order", ("id",), {"desc": True}),
+        ("limit", (21,), {}),
+    ]
+
+
+def test_next_page_breaks_created_at_ties_by_id():
+    cursor = encode_cursor({"created_at": "2026-10-17T12:00:00+00:00", "id": "b"})
+    name, args, _ = apply_keyset(RecordingQuery(), cursor, 20).calls[0]
+    assert name == "or_"
+    assert args == ('created_at.lt."2026-10-17T12:00:00+00:00",and(created_at.eq."2026-10-17T12:00:00+00:00",id.lt."b")',)
+
+
+@pytest.mark.parametrize("limit", [0, MAX_PAGE_SIZE + 1])
+def test_limit_out_of_range_is_a_400(limit):
+    with pytest.raises(HTTPException):
+        apply_keyset(RecordingQuery(), None, limit)
+
+
+def test_pages_of_rows_with_equal_created_at_continue_after_the_last_id():
+    rows = [{"created_at": "2026-10-17T12:00:00+00:00", "id": row_id} for row_id in ["e", "d", "c", "b", "a"]]
+
+    page, cursor = page_results(rows[:3], 2)
+    assert [row["id"] for row in page] == ["e", "d"]
+    assert decode_cursor(cursor) == ("2026-10-17T12:00:00+00:00", "d")
+
+    created_at, last_id = decode_cursor(cursor)
+    remaining = [row for row in rows if row["created_at"] < created_at or (row["created_at"] == created_at and row["id"] < last_id)]
+    page, cursor = page_results(remaining, 3)
+    assert [row["id"] for row in page] == ["c", "b", "a"]
+    assert cursor is None
+
+
+def test_projection_always_includes_the_keyset_columns():
+    assert select_columns("name", ["name", "price"], ["name"]) == "name,created_at,id"
+    with pytest.raises(HTTPException):
+        select_columns("name,secret", ["name"], ["name"])
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from utils import result_cache as result_cache_module
+from utils.result_cache import ResultCache, generation_cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = ResultCache(ttl_seconds=60, max_entries=10)
+    cache.set("key", "design-1")
+    clock[0] += 59
+    assert cache.get("key") == "design-1"
+    clock[0] += 2
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(ttl_seconds=60, max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("a") == "1"
+    assert cache.get("b") is None
+    assert cache.get("c") == "3"
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResultCache(ttl_seconds=0, max_entries=10)
+    cache.set("a", "1")
+    assert cache.get("a") is None
+
+
+def test_discard_design_drops_every_key_pointing_at_it():
+    cache = ResultCache(ttl_seconds=60, max_entries=10)
+    cache.set("a", "design-1")
+    cache.set("b", "design-1")
+    cache.set("c", "design-2")
+    cache.discard_design("design-1")
+    assert cache.get("a") is None and cache.get("b") is None
+    assert cache.get("c") == "design-2"
+
+
+def test_single_flight_runs_concurrent_calls_once():
+    cache = ResultCache(ttl_seconds=60, max_entries=10)
+    calls = 0
+
+    async def generate():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(cache.single_flight("key", generate) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["result"] * 5
+    assert calls == 1
+    assert cache.stats()["coalesced"] == 4
+    assert cache.stats()["in_flight"] == 0
+
+
+def test_single_flight_shares_the_leaders_error_and_then_retries():
+    cache = ResultCache(ttl_seconds=60, max_entries=10)
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("model down")
+
+    async def run():
+        return await asyncio.gather(*(cache.single_flight("key", failing) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert calls == 1
+
+    asyncio.run(run())
+    assert calls == 2
+
+
+def test_follower_takes_over_when_the_leader_is_cancelled():
+    cache = ResultCache(ttl_seconds=60, max_entries=10)
+    calls = 0
+
+    async def generate():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    async def run():
+        leader = asyncio.create_task(cache.single_flight("key", generate))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.single_flight("key", generate))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(run()) == 2
+
+
+def test_cache_key_ignores_whitespace_case_and_furniture_order():
+    first = generation_cache_key(b"img", ["b", "a"], style="Modern  Minimal", room_type="Bedroom")
+    second = generation_cache_key(b"img", ["a", "b", "a"], room_type=" bedroom", style="modern minimal")
+    assert first == second
+    assert generation_cache_key(b"other", ["a", "b"], style="modern minimal", room_type="bedroom") != first
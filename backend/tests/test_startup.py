@@ -0,0 +1,14 @@
+import statistics
+
+from benchmarks.bench_startup import STARTUP_IMPORT_BUDGET_MS, import_times, probe_env, startup
+
+
+def test_import_time_within_budget():
+    env = probe_env()
+    runs = [import_times(env)[0] for _ in range(3)]
+    assert statistics.median(runs) <= STARTUP_IMPORT_BUDGET_MS
+
+
+def test_startup_creates_no_clients():
+    probe = startup(probe_env())
+    assert probe["clients"] == []
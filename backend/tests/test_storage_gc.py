@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from utils import storage_gc
+from utils.storage_gc import GCFolder, StorageOrderError, _collect_folder, _ordered, orphaned_objects, owner_key
+
+
+async def stream(*items):
+    for item in items:
+        yield item
+
+
+def orphans(objects: list, referenced: list, label: str = "bucket/folder") -> list:
+    async def collect():
+        merged = orphaned_objects(_ordered(stream(*objects), label), _ordered(stream(*referenced), "table.column"))
+        return [item async for item in merged]
+
+    return asyncio.run(collect())
+
+
+def test_unreferenced_objects_are_orphans():
+    objects = [("a", "folder/a.png"), ("b", "folder/b.png"), ("c", "folder/c.png"), ("d", "folder/d.png")]
+    referenced = [("b",), ("d",)]
+    assert orphans(objects, referenced) == [("a", "folder/a.png"), ("c", "folder/c.png")]
+
+
+def test_variants_share_their_images_key():
+    objects = [("generated_1", "g/generated_1.png"), ("generated_1", "g/generated_1_thumbnail.webp"), ("generated_2", "g/generated_2_preview.webp")]
+    assert orphans(objects, [("generated_1",)]) == [("generated_2", "g/generated_2_preview.webp")]
+
+
+def test_references_without_objects_are_skipped():
+    assert orphans([("c", "folder/c.png")], [("a",), ("b",), ("c",), ("z",)]) == []
+
+
+def test_everything_is_orphaned_without_references():
+    objects = [("a", "folder/a.png"), ("b", "folder/b.png")]
+    assert orphans(objects, []) == objects
+
+
+def test_unsorted_object_listing_stops_the_merge():
+    with pytest.raises(StorageOrderError):
+        orphans([("b", "folder/b.png"), ("a", "folder/a.png")], [])
+
+
+def test_unsorted_references_stop_the_merge():
+    with pytest.raises(StorageOrderError):
+        orphans([("a", "folder/a.png"), ("c", "folder/c.png")], [("b",), ("a",)])
+
+
+def test_equal_keys_are_in_order():
+    assert orphans([("a", "folder/a.png")], [("a",), ("a",)]) == []
+
+
+@pytest.mark.parametrize("name, key", [
+    ("generated_abc.png", "generated_abc"),
+    ("generated_abc_thumbnail.webp", "generated_abc"),
+    ("generated_abc_preview.avif", "generated_abc"),
+    ("furniture_thumbnail_shelf.jpg", "furniture_thumbnail_shelf"),
+])
+def test_owner_key(name, key):
+    assert owner_key(name) == key
+
+
+class FakeStore:
+    """A Storage folder listed by name with offset paging, like ``ImageStore``."""
+
+    bucket = "room-images"
+
+    def __init__(self, names: list[str]):
+        self.names = sorted(names)
+        self.removed = []
+
+    def path_from_url(self, url: str) -> str:
+        return url.split(f"/{self.bucket}/")[-1]
+
+    async def remove(self, paths: list[str]):
+        for path in paths:
+            self.names.remove(path.split("/")[-1])
+        self.removed.extend(paths)
+
+    async def list(self, folder: str, offset: int, limit: int) -> list[dict]:
+        return [{"id": name, "name": name, "metadata": {"size": 10}} for name in self.names[offset:offset + limit]]
+
+
+def test_sweep_removes_orphans_across_pages_while_deleting(monkeypatch):
+    store = FakeStore(["a.png", "b.png", "c.png", "d.png", "e.png", "f.png", "g.png"])
+    referenced = ["b.png", "e.png"]
+
+    async def scan(table, columns, filters=None, key="id"):
+        yield [{"generated_image_url": f"https://host/room-images/generated/{name}"} for name in referenced]
+
+    monkeypatch.setattr(storage_gc, "scan", scan)
+    monkeypatch.setattr(storage_gc, "STORAGE_GC_PAGE_SIZE", 2)
+    monkeypatch.setattr(storage_gc, "STORAGE_GC_BATCH_SIZE", 1)
+
+    target = GCFolder(store, "generated", "room_designs", "generated_image_url")
+    report = asyncio.run(_collect_folder(target, dry_run=False, min_age_seconds=0, deletes_per_second=0))
+
+    assert store.names == ["b.png", "e.png"]
+    assert report["scanned"] == 7
+    assert report["removed"] == 5
+    assert report["bytes_reclaimed"] == 50
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import json
+import os
+import zipfile
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+
+from utils.image_fetcher import sniff_image_mime_type
+from utils.uploads import (
+    ALLOWED_MIME_TYPES,
+    MAX_IMAGE_SIZE_BYTES,
+    MAX_IMAGE_SIZE_MB,
+    MAX_REQUEST_BODY_BYTES,
+    UPLOAD_CHUNK_SIZE,
+    ValidatedUpload,
+    read_upload,
+)
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "8"))
+BATCH_TRY_ON_CONCURRENCY = int(os.getenv("BATCH_TRY_ON_CONCURRENCY", "2"))
+BATCH_INSERT_SIZE = int(os.getenv("BATCH_INSERT_SIZE", "50"))
+BATCH_FLUSH_SECONDS = float(os.getenv("BATCH_FLUSH_SECONDS", "1"))
+
+
+@dataclass
+class BatchItem:
+    index: int
+    filename: str
+    upload: Optional[ValidatedUpload] = None
+    error: Optional[str] = None
+
+    def error_line(self, error: str, **extra) -> dict:
+        return {"index": self.index, "filename": self.filename, "status": "error", "error": error, **extra}
+
+    def ok_line(self, **content) -> dict:
+        return {"index": self.index, "filename": self.filename, "status": "ok", **content}
+
+
+def _read_archive(archive, first_index: int, max_items: int) -> list[BatchItem]:
+    """Extract and validate the images in a zip archive; runs in a worker thread.
+
+    Entries are read in chunks and checked against the per-image and total size limits as
+    they decompress, so a zip bomb is rejected without being inflated.
+    """
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="archive is not a valid zip file")
+
+    with zf:
+        entries = [
+            info for info in zf.infolist()
+            if not info.is_dir()
+            and not os.path.basename(info.filename).startswith(".")
+            and not info.filename.startswith("__MACOSX/")
+        ]
+        if len(entries) > max_items:
+            raise HTTPException(status_code=400, detail=f"Batch exceeds {BATCH_MAX_ITEMS} images")
+
+        items = []
+        total = 0
+        for offset, info in enumerate(entries):
+            item = BatchItem(index=first_index + offset, filename=info.filename)
+            items.append(item)
+            if info.file_size > MAX_IMAGE_SIZE_BYTES:
+                item.error = f"{info.filename} exceeds {MAX_IMAGE_SIZE_MB}MB size limit"
+                continue
+
+            digest = hashlib.sha256()
+            chunks = []
+            size = 0
+            mime_type = None
+            with zf.open(info) as entry:
+                while chunk := entry.read(UPLOAD_CHUNK_SIZE):
+                    if mime_type is None:
+                        mime_type = sniff_image_mime_type(chunk, default="")
+                        if mime_type not in ALLOWED_MIME_TYPES:
+                            item.error = f"{info.filename} is not a supported image"
+                            break
+                    size += len(chunk)
+                    total += len(chunk)
+                    if size > MAX_IMAGE_SIZE_BYTES:
+                        item.error = f"{info.filename} exceeds {MAX_IMAGE_SIZE_MB}MB size limit"
+                        break
+                    if total > MAX_REQUEST_BODY_BYTES:
+                        raise HTTPException(status_code=413, detail="archive contents exceed the request size limit")
+                    digest.update(chunk)
+                    chunks.append(chunk)
+            if item.error:
+                continue
+            if mime_type is None:
+                item.error = f"{info.filename} is empty"
+                continue
+            item.upload = ValidatedUpload(data=b"".join(chunks), mime_type=mime_type, sha256=digest.hexdigest(), filename=info.filename)
+        return items
+
+
+async def read_batch(files: Optional[list[UploadFile]], archive: Optional[UploadFile], label: str) -> list[BatchItem]:
+    """Validate every image of a batch request, from the multipart files and/or a zip archive.
+
+    Invalid images become items with an ``error`` (reported in the result stream) rather than
+    failing the whole batch; a malformed archive or an oversized batch is a 400.
+    """
+    files = files or []
+    if len(files) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {BATCH_MAX_ITEMS} images")
+
+    items = []
+    for index, upload in enumerate(files):
+        item = BatchItem(index=index, filename=upload.filename or f"{label} {index + 1}")
+        try:
+            item.upload = await read_upload(upload, f"{label} {index + 1}")
+        except HTTPException as e:
+            item.error = e.detail
+        items.append(item)
+
+    if archive is not None:
+        items.extend(await asyncio.to_thread(_read_archive, archive.file, len(items), BATCH_MAX_ITEMS - len(items)))
+
+    if not items:
+        raise HTTPException(status_code=400, detail="No images provided")
+    return items
+
+
+def parse_batch_ids(ids: str) -> list[str]:
+    """Comma-separated ids of a batch request, deduplicated in order; 400 if none or too many."""
+    parsed = list(dict.fromkeys(item.strip() for item in ids.split(",") if item.strip()))
+    if not parsed:
+        raise HTTPException(status_code=400, detail="No ids given")
+    if len(parsed) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {BATCH_MAX_ITEMS} ids")
+    return parsed
+
+
+async def completed_in_batches(
+    items: list,
+    fn: Callable[[Any], Awaitable[Any]],
+    concurrency: int,
+    batch_size: int = BATCH_INSERT_SIZE,
+    max_wait: float = BATCH_FLUSH_SECONDS,
+) -> AsyncIterator[list[tuple[Any, Any, Optional[Exception]]]]:
+    """Run ``fn`` over ``items`` with at most ``concurrency`` in flight, yielding finished work in batches.
+
+    Each batch holds ``(item, result, error)`` triples in completion order. A batch is handed
+    out once it reaches ``batch_size`` or its first entry has waited ``max_wait`` seconds, so
+    bulk inserts stay large when work finishes quickly without holding back slow streams.
+    Work still running when the consumer stops (e.g. the client disconnected) is cancelled.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            try:
+                return item, await fn(item), None
+            except Exception as e:
+                return item, None, e
+
+    loop = asyncio.get_running_loop()
+    tasks = {asyncio.create_task(run(item)) for item in items}
+    batch = []
+    deadline = None
+    try:
+        while tasks:
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            done, tasks = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            batch.extend(task.result() for task in done)
+            if batch and deadline is None:
+                deadline = loop.time() + max_wait
+            if batch and (len(batch) >= batch_size or loop.time() >= deadline or not tasks):
+                yield batch
+                batch = []
+                deadline = None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def ndjson_response(lines: AsyncIterator[dict]) -> StreamingResponse:
+    """Stream one JSON object per line as the results become available."""
+    async def body():
+        async for line in lines:
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(
+        body(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,198 @@
+import asyncio
+import uuid
+from typing import Optional
+
+from utils.image_cache import cache_image
+from utils.image_derivatives import derivative_columns, store_derivatives
+from utils.image_pipeline import FILE_EXTENSIONS
+from utils.job_queue import job_queue
+from utils.repositories import room_design_repo, room_images
+from utils.result_cache import result_cache
+from utils.tracing import traced
+from utils.similarity_index import design_index, fingerprint_or_none, hash_columns
+
+PERSIST_DESIGN_JOB = "persist-try-on"
+
+# How a generated design is stored: before responding, by a job worker after responding, or
+# uploaded now with the row handed back to the caller for a bulk insert (batch endpoint)
+PERSIST_SYNC = "sync"
+PERSIST_BACKGROUND = "background"
+PERSIST_DEFERRED = "deferred"
+
+
+def design_image_paths(original_mime_type: str) -> tuple[str, str]:
+    original_ext = FILE_EXTENSIONS.get(original_mime_type, "jpg")
+    return (
+        f"room-designs/originals/original_{uuid.uuid4()}.{original_ext}",
+        f"room-designs/generated/generated_{uuid.uuid4()}.png",
+    )
+
+
+async def _upload(path: str, data: bytes, mime_type: str, label: str, strict: bool) -> Optional[str]:
+    try:
+        return await room_images.upload(path, data, mime_type, upsert=True)
+    except Exception as storage_err:
+        if strict:
+            raise
+        print(f"Failed to store {label} image: {storage_err}")
+        return None
+
+
+@traced("design.persist")
+async def persist_design(
+    cache_key: str,
+    fields: dict,
+    description: Optional[str],
+    place_bytes: bytes,
+    place_mime_type: str,
+    image_data: Optional[bytes],
+    image_mime_type: Optional[str],
+    paths: Optional[tuple[str, str]] = None,
+    strict: bool = False,
+    insert: bool = True,
+) -> dict:
+    """Upload the original and generated images and their thumbnail and preview variants
+    concurrently, while hashing the generated image for similarity search, then insert the
+    ``room_designs`` row.
+
+    Nothing is stored without a generated image: there would be no row to reference the
+    original, and the storage garbage collector would delete it. With ``strict`` any failure is
+    raised so the background job is retried; otherwise failures are logged and the missing
+    URLs come back as ``None``. Uploads overwrite their paths, so a retry with the same
+    ``paths`` does not leave duplicate objects behind. Without ``insert`` the row is returned
+    under ``row`` for ``insert_designs`` instead of being inserted.
+    """
+    if image_data is None:
+        return {"design_id": None, "original_image_url": None, "generated_image_url": None}
+    original_path, generated_path = paths or design_image_paths(place_mime_type)
+
+    results = await asyncio.gather(
+        _upload(original_path, place_bytes, place_mime_type, "original", strict),
+        store_derivatives(room_images, original_path, place_bytes, strict),
+        _upload(generated_path, image_data, image_mime_type, "generated", strict),
+        store_derivatives(room_images, generated_path, image_data, strict),
+        fingerprint_or_none(image_data, generated_path),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+    original_image_url, original_derivatives, generated_image_url, generated_derivatives, fingerprint = results
+    if generated_image_url:
+        # Attach the Storage URL so /api/images/{image_id} can refetch the bytes after eviction
+        await cache_image(generated_image_url, image_data)
+
+    design_id = None
+    row = None
+    if original_image_url and generated_image_url:
+        row = {
+            "original_image_url": original_image_url,
+            "generated_image_url": generated_image_url,
+            **derivative_columns("original_", original_derivatives),
+            **derivative_columns("generated_", generated_derivatives),
+            **hash_columns("generated_", fingerprint),
+            **fields,
+            "description": description,
+        }
+    if row and not insert:
+        return {
+            "design_id": None,
+            "original_image_url": original_image_url,
+            "generated_image_url": generated_image_url,
+            "row": row,
+        }
+
+    if row:
+        try:
+            design = await room_design_repo.create(row)
+            if design:
+                design_id = design["id"]
+                design_index.add_row(design)
+        except Exception as db_err:
+            if strict:
+                raise
+            print(f"Failed to save to database: {db_err}")
+
+    if design_id:
+        result_cache.set(cache_key, design_id)
+
+    return {
+        "design_id": design_id,
+        "original_image_url": original_image_url,
+        "generated_image_url": generated_image_url,
+    }
+
+
+async def insert_designs(pending: list[tuple[str, dict]]) -> dict[str, str]:
+    """Insert the rows of ``(cache_key, row)`` pairs in one request; returns design ids by cache key.
+
+    Identical inputs share one generation (and one row), so each cache key is inserted once,
+    including across calls: keys the result cache already maps to a design reuse that id.
+    """
+    design_ids = {}
+    rows_by_key = {}
+    for cache_key, row in pending:
+        existing = result_cache.get(cache_key)
+        if existing:
+            design_ids[cache_key] = existing
+        else:
+            rows_by_key[cache_key] = row
+    if not rows_by_key:
+        return design_ids
+
+    designs = await room_design_repo.create_many(list(rows_by_key.values()))
+    for cache_key, design in zip(rows_by_key, designs):
+        design_ids[cache_key] = design["id"]
+        result_cache.set(cache_key, design["id"])
+        design_index.add_row(design)
+    return design_ids
+
+
+def enqueue_persist_design(
+    cache_key: str,
+    fields: dict,
+    description: Optional[str],
+    place_bytes: bytes,
+    place_mime_type: str,
+    image_data: Optional[bytes],
+    image_mime_type: Optional[str],
+) -> dict:
+    """Write both images to the job outbox so a worker persists them after the response went out.
+
+    Blocking (SQLite); call it with ``asyncio.to_thread``. The storage paths are chosen here
+    so every retry uploads to the same objects. Jobs that run out of attempts keep their files
+    and can be replayed with ``POST /api/system/jobs/requeue-failed``.
+    """
+    original_path, generated_path = design_image_paths(place_mime_type)
+    files = [(place_bytes, place_mime_type, None)]
+    if image_data is not None:
+        files.append((image_data, image_mime_type, None))
+    job, _ = job_queue.enqueue(
+        PERSIST_DESIGN_JOB,
+        {
+            "cache_key": cache_key,
+            "fields": fields,
+            "description": description,
+            "original_path": original_path,
+            "generated_path": generated_path,
+        },
+        files,
+    )
+    return job
+
+
+async def run_persist_design_job(params: dict, files: list) -> dict:
+    place_bytes, place_mime_type, _ = files[0]
+    image_data, image_mime_type, _ = files[1] if len(files) > 1 else (None, None, None)
+    return await persist_design(
+        params["cache_key"],
+        params["fields"],
+        params["description"],
+        place_bytes,
+        place_mime_type,
+        image_data,
+        image_mime_type,
+        paths=(params["original_path"], params["generated_path"]),
+        strict=True,
+    )
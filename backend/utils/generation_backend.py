@@ -0,0 +1,241 @@
+import asyncio
+import hashlib
+import io
+import os
+import random
+from functools import lru_cache
+from typing import AsyncIterator, Optional
+
+from google.genai import types
+from PIL import Image, ImageOps
+
+from config.clients import clients
+from config.env import load_env
+
+load_env()
+
+GENERATION_BACKEND = os.getenv("GENERATION_BACKEND", "gemini").lower()
+GENERATION_MODEL = os.getenv("GENERATION_MODEL", "gemini-2.0-flash-preview-image-generation")
+# Image models tried after GENERATION_MODEL, in order, when it fails, is slow or its breaker is open
+GENERATION_FALLBACK_MODELS = [m.strip() for m in os.getenv("GENERATION_FALLBACK_MODELS", "").split(",") if m.strip()]
+# Cheaper model asked for a description only when no image model answers; empty disables it
+GENERATION_TEXT_FALLBACK_MODEL = os.getenv("GENERATION_TEXT_FALLBACK_MODEL", "gemini-2.0-flash")
+
+STUB_LATENCY_SECONDS = float(os.getenv("STUB_LATENCY_SECONDS", "2"))
+STUB_LATENCY_JITTER_SECONDS = float(os.getenv("STUB_LATENCY_JITTER_SECONDS", "0.5"))
+STUB_FAILURE_RATE = float(os.getenv("STUB_FAILURE_RATE", "0"))
+STUB_NO_IMAGE_RATE = float(os.getenv("STUB_NO_IMAGE_RATE", "0"))
+STUB_SLOW_RATE = float(os.getenv("STUB_SLOW_RATE", "0"))
+STUB_SLOW_SECONDS = float(os.getenv("STUB_SLOW_SECONDS", "30"))
+STUB_IMAGE_SIZE_PX = int(os.getenv("STUB_IMAGE_SIZE_PX", "1024"))
+STUB_SEED = os.getenv("STUB_SEED")
+
+# Fraction of the stub latency spent before the first streamed chunk
+STUB_FIRST_CHUNK_FRACTION = 0.3
+STUB_COLORS = 16
+
+
+class GenerationBackendError(Exception):
+    """A generation call failed on the backend side (as opposed to a bad request)."""
+
+
+class GenerationBackend:
+    """Produces ``GenerateContentResponse`` objects for a list of request ``contents``.
+
+    Both methods mirror ``client.aio.models``: ``generate_content`` returns the complete
+    response, ``generate_content_stream`` is awaited for an async iterator of chunks.
+    """
+
+    name = "base"
+    model = None
+
+    async def generate_content(self, contents: list) -> types.GenerateContentResponse:
+        raise NotImplementedError
+
+    async def generate_content_stream(self, contents: list) -> AsyncIterator[types.GenerateContentResponse]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class GeminiBackend(GenerationBackend):
+    name = "gemini"
+
+    def __init__(self, client, model: str = GENERATION_MODEL, modalities: tuple[str, ...] = ('TEXT', 'IMAGE')):
+        self.model = model
+        self.client = client
+        self.config = types.GenerateContentConfig(response_modalities=list(modalities))
+
+    async def generate_content(self, contents: list) -> types.GenerateContentResponse:
+        return await self.client.aio.models.generate_content(model=self.model, contents=contents, config=self.config)
+
+    async def generate_content_stream(self, contents: list) -> AsyncIterator[types.GenerateContentResponse]:
+        return await self.client.aio.models.generate_content_stream(model=self.model, contents=contents, config=self.config)
+
+    async def close(self):
+        await self.client.aio.aclose()
+
+
+@lru_cache(maxsize=STUB_COLORS)
+def _synthetic_png(color_index: int, size: int) -> bytes:
+    """A deterministic Mandelbrot render tinted by ``color_index``; compresses like a real photo-sized PNG."""
+    hue = color_index / STUB_COLORS
+    tint = tuple(int(128 + 127 * ((hue + shift) % 1.0)) for shift in (0.0, 0.33, 0.66))
+    fractal = Image.effect_mandelbrot((size, size), (-2.0, -1.5, 1.0, 1.5), 100)
+    image = ImageOps.colorize(fractal, black=(20, 20, 20), white=tint)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _response(parts: list[types.Part]) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=parts))]
+    )
+
+
+class StubBackend(GenerationBackend):
+    """Answers locally with a synthetic image after a configurable delay, for load tests without spend.
+
+    Every call sleeps ``latency`` plus up to ``jitter`` seconds (``slow_seconds`` instead with
+    probability ``slow_rate``, to model a long tail), then fails with probability
+    ``failure_rate`` or answers text-only with probability ``no_image_rate``. The image depends
+    only on the request contents, and with a ``seed`` the sequence of delays and outcomes is
+    reproducible across runs.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        model: str = "stub",
+        latency: float = STUB_LATENCY_SECONDS,
+        jitter: float = STUB_LATENCY_JITTER_SECONDS,
+        failure_rate: float = STUB_FAILURE_RATE,
+        no_image_rate: float = STUB_NO_IMAGE_RATE,
+        slow_rate: float = STUB_SLOW_RATE,
+        slow_seconds: float = STUB_SLOW_SECONDS,
+        image_size: int = STUB_IMAGE_SIZE_PX,
+        seed: Optional[str] = STUB_SEED,
+    ):
+        self.model = model
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.no_image_rate = no_image_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.image_size = image_size
+        self.random = random.Random(seed)
+
+    def _plan(self) -> tuple[float, bool, bool]:
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if self.random.random() < self.slow_rate:
+            delay = self.slow_seconds
+        fails = self.random.random() < self.failure_rate
+        with_image = self.random.random() >= self.no_image_rate
+        return delay, fails, with_image
+
+    @staticmethod
+    def _color_index(contents: list) -> int:
+        digest = hashlib.sha256()
+        for item in contents:
+            if isinstance(item, types.Part) and item.inline_data and item.inline_data.data:
+                digest.update(item.inline_data.data)
+            else:
+                digest.update(str(item).encode())
+        return digest.digest()[0] % STUB_COLORS
+
+    async def _image_part(self, contents: list) -> types.Part:
+        data = await asyncio.to_thread(_synthetic_png, self._color_index(contents), self.image_size)
+        return types.Part.from_bytes(data=data, mime_type="image/png")
+
+    @staticmethod
+    def _text(contents: list) -> str:
+        inputs = sum(1 for item in contents if isinstance(item, types.Part))
+        return f"Stub design generated from {inputs} image(s). Estimated cost: $1,000. Estimated time: 1 week."
+
+    async def generate_content(self, contents: list) -> types.GenerateContentResponse:
+        delay, fails, with_image = self._plan()
+        await asyncio.sleep(delay)
+        if fails:
+            raise GenerationBackendError("Stub backend: simulated generation failure")
+        parts = [types.Part.from_text(text=self._text(contents))]
+        if with_image:
+            parts.append(await self._image_part(contents))
+        return _response(parts)
+
+    async def generate_content_stream(self, contents: list) -> AsyncIterator[types.GenerateContentResponse]:
+        delay, fails, with_image = self._plan()
+        words = self._text(contents).split(" ")
+        thirds = [words[i::3] for i in range(3)]
+
+        async def chunks():
+            await asyncio.sleep(delay * STUB_FIRST_CHUNK_FRACTION)
+            if fails:
+                raise GenerationBackendError("Stub backend: simulated generation failure")
+            for piece in thirds:
+                yield _response([types.Part.from_text(text=" ".join(piece) + " ")])
+                await asyncio.sleep(delay * (1 - STUB_FIRST_CHUNK_FRACTION) / len(thirds))
+            if with_image:
+                yield _response([await self._image_part(contents)])
+
+        return chunks()
+
+
+def check_generation_config(name: str = GENERATION_BACKEND):
+    if name not in ("gemini", "stub"):
+        raise ValueError(f"Unknown GENERATION_BACKEND {name!r}, expected 'gemini' or 'stub'")
+    if name == "gemini" and not os.getenv("GEMINI_API_KEY"):
+        raise ValueError("Missing GEMINI_API_KEY in .env")
+
+
+def create_generation_backend(name: str = GENERATION_BACKEND) -> GenerationBackend:
+    """Build the configured image models and text fallback behind a ``ModelRouter``."""
+    from utils.generation_router import ModelRouter
+
+    if name == "stub":
+        models = ["stub"] + GENERATION_FALLBACK_MODELS
+        image_backends = [StubBackend(model) for model in models]
+        text_fallback = StubBackend(
+            "stub-text", latency=STUB_LATENCY_SECONDS / 4, jitter=0, failure_rate=0, no_image_rate=1, slow_rate=0
+        ) if GENERATION_TEXT_FALLBACK_MODEL else None
+    elif name == "gemini":
+        from google import genai
+
+        check_generation_config(name)
+        client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        models = [GENERATION_MODEL] + GENERATION_FALLBACK_MODELS
+        image_backends = [GeminiBackend(client, model) for model in models]
+        text_fallback = GeminiBackend(
+            client, GENERATION_TEXT_FALLBACK_MODEL, modalities=('TEXT',)
+        ) if GENERATION_TEXT_FALLBACK_MODEL else None
+    else:
+        raise ValueError(f"Unknown GENERATION_BACKEND {name!r}, expected 'gemini' or 'stub'")
+    return ModelRouter(image_backends, text_fallback)
+
+
+def _create_backend() -> GenerationBackend:
+    backend = create_generation_backend()
+    print(f"Generation backend: {backend.name} ({backend.model})")
+    return backend
+
+
+async def _close_backend(backend: GenerationBackend):
+    await backend.close()
+
+
+clients.register("generation", _create_backend, _close_backend, check_generation_config)
+
+
+def get_generation_backend() -> GenerationBackend:
+    """Return the process-wide backend selected by ``GENERATION_BACKEND``, creating it on first use."""
+    return clients.get("generation")
+
+
+async def close_generation_backend():
+    await clients.close("generation")
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+
+GENERATION_MAX_CONCURRENCY = int(os.getenv("GENERATION_MAX_CONCURRENCY", "4"))
+GENERATION_MAX_QUEUE = int(os.getenv("GENERATION_MAX_QUEUE", "16"))
+GENERATION_RETRY_AFTER_SECONDS = int(os.getenv("GENERATION_RETRY_AFTER_SECONDS", "15"))
+
+
+class GenerationQueueFull(Exception):
+    """Raised when every generation slot is busy and the wait queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Generation queue is full")
+        self.retry_after = retry_after
+
+
+class GenerationExecutor:
+    """Runs model calls on the event loop with a concurrency cap and a bounded wait queue.
+
+    Callers pass coroutine functions (e.g. ``client.aio.models.generate_content``) so the
+    worker never blocks while a generation is in progress.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, retry_after: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one generation slot for the duration of the block (e.g. while consuming a stream).
+
+        Raises ``GenerationQueueFull`` right away when every slot is busy and the queue is full.
+        """
+        if self.in_flight >= self.max_concurrency and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise GenerationQueueFull(self.retry_after)
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started_at = time.perf_counter()
+        self.total_wait_seconds += started_at - queued_at
+        self.in_flight += 1
+        try:
+            yield
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.total_run_seconds += time.perf_counter() - started_at
+            self._semaphore.release()
+
+    async def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now, ahead of nobody; pair with ``release``.
+
+        For extra calls made on behalf of one that already holds a slot, like a hedge, which
+        should be skipped rather than exceed the cap or jump the queue.
+        """
+        if self._semaphore.locked():
+            return False
+        await self._semaphore.acquire()  # returns without waiting, a permit is free
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def run(self, fn, *args, **kwargs):
+        async with self.slot():
+            return await fn(*args, **kwargs)
+
+    def stats(self) -> dict:
+        finished = self.completed + self.failed
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": round(self.total_wait_seconds / finished, 4) if finished else 0.0,
+            "avg_run_seconds": round(self.total_run_seconds / finished, 4) if finished else 0.0,
+        }
+
+
+generation_executor = GenerationExecutor(
+    max_concurrency=GENERATION_MAX_CONCURRENCY,
+    max_queue=GENERATION_MAX_QUEUE,
+    retry_after=GENERATION_RETRY_AFTER_SECONDS,
+)
+
+
+def queue_full_http_exception(err: GenerationQueueFull) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many generations in progress, please retry later",
+        headers={"Retry-After": str(err.retry_after)},
+    )
@@ -0,0 +1,184 @@
+import json
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Optional, Union
+
+from fastapi.responses import StreamingResponse
+
+from utils.generation_executor import generation_executor
+from utils.structured_log import get_logger
+from utils.tracing import record_span, span
+
+LATENCY_WINDOW = 1000
+
+logger = get_logger("generation")
+
+
+@dataclass
+class GenerationOutput:
+    text: str
+    image_data: Optional[bytes] = None
+    image_mime_type: Optional[str] = None
+
+
+def _candidate_parts(response) -> list:
+    if not response.candidates:
+        return []
+    content = response.candidates[0].content
+    return (content.parts if content else None) or []
+
+
+def _image_part(part) -> Optional[tuple[bytes, str]]:
+    if getattr(part, "inline_data", None) and part.inline_data.data:
+        return part.inline_data.data, getattr(part.inline_data, "mime_type", None) or "image/png"
+    return None
+
+
+def parse_response(response, default_text: str) -> GenerationOutput:
+    """Pull the generated image and description out of a complete ``generate_content`` response."""
+    output = GenerationOutput(text=default_text)
+    if not response.candidates:
+        logger.warning("response_without_candidates")
+        return output
+
+    parts = _candidate_parts(response)
+    if not parts:
+        logger.warning("response_without_parts")
+        return output
+
+    for part in parts:
+        image = _image_part(part)
+        if image:
+            output.image_data, output.image_mime_type = image
+        elif getattr(part, "text", None):
+            output.text = part.text
+    logger.debug(
+        "response_parsed",
+        parts=len(parts),
+        image_bytes=len(output.image_data) if output.image_data else None,
+        image_mime_type=output.image_mime_type,
+        text=output.text,
+    )
+    return output
+
+
+class StreamedOutput:
+    """Accumulates ``generate_content_stream`` chunks; text arrives as deltas, the image as one part."""
+
+    def __init__(self, default_text: str):
+        self.default_text = default_text
+        self.text_chunks: list[str] = []
+        self.image_data: Optional[bytes] = None
+        self.image_mime_type: Optional[str] = None
+
+    def feed(self, chunk) -> list[tuple[str, object]]:
+        """Record a chunk and return its ``("text", str)`` / ``("image", (bytes, mime_type))`` events."""
+        events = []
+        for part in _candidate_parts(chunk):
+            image = _image_part(part)
+            if image:
+                self.image_data, self.image_mime_type = image
+                events.append(("image", image))
+            elif getattr(part, "text", None):
+                self.text_chunks.append(part.text)
+                events.append(("text", part.text))
+        return events
+
+    def result(self) -> GenerationOutput:
+        text = "".join(self.text_chunks) or self.default_text
+        logger.debug("stream_parsed", text_chars=len(text), image_bytes=len(self.image_data) if self.image_data else None)
+        return GenerationOutput(text=text, image_data=self.image_data, image_mime_type=self.image_mime_type)
+
+
+class LatencyStats:
+    """Time to first byte and total model latency per operation, over the last ``window`` calls."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._samples: dict[str, tuple[deque, deque]] = {}
+        self.calls: dict[str, int] = {}
+
+    def record(self, operation: str, ttfb_ms: float, total_ms: float):
+        ttfb, total = self._samples.setdefault(operation, (deque(maxlen=self.window), deque(maxlen=self.window)))
+        ttfb.append(ttfb_ms)
+        total.append(total_ms)
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+
+    @staticmethod
+    def _percentiles(samples: deque) -> dict:
+        ordered = sorted(samples)
+        pick = lambda q: round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 1)
+        return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+    def snapshot(self) -> dict:
+        return {
+            operation: {
+                "calls": self.calls[operation],
+                "ttfb": self._percentiles(ttfb),
+                "total": self._percentiles(total),
+            }
+            for operation, (ttfb, total) in self._samples.items()
+        }
+
+
+generation_latency = LatencyStats(LATENCY_WINDOW)
+
+
+async def generate(operation: str, generate_content, default_text: str, **request) -> GenerationOutput:
+    """Run a non-streaming generation through the executor and parse it.
+
+    Without streaming nothing reaches the caller before the whole response, so the time to
+    first byte equals the total latency.
+    """
+    started = time.perf_counter()
+    with span("model.generate", operation=operation) as model_span:
+        response = await generation_executor.run(generate_content, **request)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        output = parse_response(response, default_text)
+        model_span.set("bytes", len(output.image_data) if output.image_data else 0)
+    generation_latency.record(operation, elapsed_ms, elapsed_ms)
+    logger.info("generation", operation=operation, total_ms=round(elapsed_ms, 1))
+    return output
+
+
+async def stream_generation(operation: str, generate_content_stream, default_text: str, **request) -> AsyncIterator[tuple[str, object]]:
+    """Yield ``text`` and ``image`` events as the model streams them, then ``("done", GenerationOutput)``.
+
+    The generation slot is held until the stream is exhausted. Timings cover the model call
+    only; ``("timings", {...})`` is yielded just before ``done``.
+    """
+    async with generation_executor.slot():
+        started = time.perf_counter()
+        started_ns = time.time_ns()
+        first_chunk_at = None
+        output = StreamedOutput(default_text)
+        async for chunk in await generate_content_stream(**request):
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            for event in output.feed(chunk):
+                yield event
+        finished = time.perf_counter()
+
+    ttfb_ms = ((first_chunk_at or finished) - started) * 1000
+    total_ms = (finished - started) * 1000
+    record_span(
+        "model.stream", started_ns, started_ns + int(total_ms * 1e6),
+        operation=operation, ttfb_ms=round(ttfb_ms, 1), bytes=len(output.image_data) if output.image_data else 0,
+    )
+    generation_latency.record(f"{operation}:stream", ttfb_ms, total_ms)
+    logger.info("generation_stream", operation=operation, ttfb_ms=round(ttfb_ms, 1), total_ms=round(total_ms, 1))
+    yield "timings", {"ttfb_ms": round(ttfb_ms, 1), "total_ms": round(total_ms, 1)}
+    yield "done", output.result()
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events: Union[AsyncIterator[str], Iterable[str]]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,344 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from google.genai import errors, types
+
+from utils.generation_backend import GenerationBackend, GenerationBackendError
+from utils.generation_executor import GenerationExecutor, generation_executor
+
+GENERATION_DEADLINE_SECONDS = float(os.getenv("GENERATION_DEADLINE_SECONDS", "60"))
+GENERATION_TEXT_FALLBACK_DEADLINE_SECONDS = float(os.getenv("GENERATION_TEXT_FALLBACK_DEADLINE_SECONDS", "20"))
+GENERATION_HEDGE_PERCENTILE = float(os.getenv("GENERATION_HEDGE_PERCENTILE", "0.95"))
+GENERATION_HEDGE_MIN_SAMPLES = int(os.getenv("GENERATION_HEDGE_MIN_SAMPLES", "20"))
+GENERATION_HEDGE_BUDGET = float(os.getenv("GENERATION_HEDGE_BUDGET", "0.1"))
+GENERATION_BREAKER_FAILURES = int(os.getenv("GENERATION_BREAKER_FAILURES", "5"))
+GENERATION_BREAKER_COOLDOWN_SECONDS = float(os.getenv("GENERATION_BREAKER_COOLDOWN_SECONDS", "30"))
+
+LATENCY_WINDOW = 200
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+def is_request_error(error: Exception) -> bool:
+    """True for errors caused by the request itself, which another model would reject too.
+
+    Those are raised as-is: they say nothing about the model's health, so they neither trip
+    the breaker nor trigger a failover. Rate limits and timeouts are not request errors.
+    """
+    return isinstance(error, errors.ClientError) and error.code not in (408, 429)
+
+
+class CircuitBreaker:
+    """Opens after ``failures`` consecutive failures and lets one probe call through per ``cooldown``.
+
+    A successful probe closes the breaker again; a failed one restarts the cooldown.
+    """
+
+    def __init__(self, failures: int, cooldown: float):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.probing = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failures:
+            if self.state != OPEN:
+                self.times_opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Give back a probe that was cancelled before it could tell anything."""
+        self.probing = False
+
+
+class ModelRoute:
+    """One image model: its backend, circuit breaker and recent successful latencies."""
+
+    def __init__(self, backend: GenerationBackend):
+        self.backend = backend
+        self.breaker = CircuitBreaker(GENERATION_BREAKER_FAILURES, GENERATION_BREAKER_COOLDOWN_SECONDS)
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    @property
+    def model(self) -> str:
+        return self.backend.model
+
+    def hedge_delay(self) -> Optional[float]:
+        """The latency percentile after which a hedge fires; ``None`` until enough calls were seen."""
+        if len(self.latencies) < GENERATION_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(GENERATION_HEDGE_PERCENTILE * len(ordered)), len(ordered) - 1)]
+
+    def record_success(self, seconds: float):
+        self.latencies.append(seconds)
+        self.breaker.record_success()
+
+    def record_failure(self, timed_out: bool = False):
+        self.failures += 1
+        if timed_out:
+            self.timeouts += 1
+        self.breaker.record_failure()
+
+    def stats(self) -> dict:
+        delay = self.hedge_delay()
+        return {
+            "model": self.model,
+            "state": self.breaker.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "times_opened": self.breaker.times_opened,
+            "hedge_after_ms": round(delay * 1000, 1) if delay is not None else None,
+        }
+
+
+class ModelRouter(GenerationBackend):
+    """Routes generations over image models in priority order, with a text-only last resort.
+
+    Each call has a deadline. A call still running after the model's usual p95 latency is
+    hedged on the next available model (or the same one if it is the only model), as long as
+    hedges stay within ``hedge_budget`` of all calls and ``executor`` has a free slot for the
+    hedge (the hedged call already holds one); the first answer wins and the other call is
+    cancelled. A failed call fails over to the next model right away. Models whose
+    breaker is open are skipped. When no image model answers in time, ``text_fallback`` is
+    asked for a description only, so the caller gets a text-only result instead of an error.
+    """
+
+    def __init__(
+        self,
+        backends: list[GenerationBackend],
+        text_fallback: Optional[GenerationBackend] = None,
+        deadline: float = GENERATION_DEADLINE_SECONDS,
+        text_fallback_deadline: float = GENERATION_TEXT_FALLBACK_DEADLINE_SECONDS,
+        hedge_budget: float = GENERATION_HEDGE_BUDGET,
+        executor: GenerationExecutor = generation_executor,
+    ):
+        self.routes = [ModelRoute(backend) for backend in backends]
+        self.text_fallback = text_fallback
+        self.deadline = deadline
+        self.text_fallback_deadline = text_fallback_deadline
+        self.hedge_budget = hedge_budget
+        self.executor = executor
+        self.name = backends[0].name
+        self.model = backends[0].model
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_skipped = 0
+        self.fallbacks = 0
+
+    def _next_route(self, skip: set) -> Optional[ModelRoute]:
+        for route in self.routes:
+            if id(route) not in skip and route.breaker.allow():
+                return route
+        return None
+
+    def _may_hedge(self) -> bool:
+        return self.hedges < self.hedge_budget * self.calls
+
+    async def _call(self, route: ModelRoute, contents: list) -> types.GenerateContentResponse:
+        route.calls += 1
+        started = time.perf_counter()
+        try:
+            response = await route.backend.generate_content(contents)
+        except asyncio.CancelledError:
+            route.breaker.release()
+            raise
+        except Exception as e:
+            if is_request_error(e):
+                route.breaker.release()
+            else:
+                print(f"Model {route.model} failed: {type(e).__name__}: {e}")
+                route.record_failure()
+            raise
+        route.record_success(time.perf_counter() - started)
+        return response
+
+    async def generate_content(self, contents: list) -> types.GenerateContentResponse:
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.deadline
+        tried: set = set()
+        pending: dict[asyncio.Task, ModelRoute] = {}
+        hedge_at = None
+        hedge_task = None
+        failure = "every image model is unavailable"
+
+        def launch(route: ModelRoute) -> asyncio.Task:
+            tried.add(id(route))
+            task = asyncio.create_task(self._call(route, contents))
+            pending[task] = route
+            return task
+
+        def hedge_time(route: ModelRoute) -> Optional[float]:
+            delay = route.hedge_delay()
+            return loop.time() + delay if delay is not None else None
+
+        primary = self._next_route(tried)
+        if primary:
+            launch(primary)
+            hedge_at = hedge_time(primary)
+
+        try:
+            while pending:
+                now = loop.time()
+                if now >= deadline:
+                    failure = f"no image model answered within {self.deadline:g}s"
+                    for route in pending.values():
+                        route.record_failure(timed_out=True)
+                    break
+                wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, _ = await asyncio.wait(pending, timeout=max(wake_at - now, 0), return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    route = pending.pop(task)
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self.hedge_wins += 1
+                        return task.result()
+                    if is_request_error(task.exception()):
+                        raise task.exception()
+                    failure = f"{route.model} failed: {task.exception()}"
+                    if not pending:
+                        primary = self._next_route(tried)
+                        if primary:
+                            launch(primary)
+                            if hedge_task is None:
+                                hedge_at = hedge_time(primary)
+
+                if hedge_at is not None and loop.time() >= hedge_at:
+                    hedge_at = None
+                    # The slot comes first: picking a route takes a half-open breaker's only probe
+                    if self._may_hedge() and not await self.executor.try_acquire():
+                        self.hedges_skipped += 1
+                    elif self._may_hedge():
+                        # The only model can hedge against itself; its breaker was already consulted
+                        hedge = self._next_route(tried) or (primary if len(self.routes) == 1 and primary in pending.values() else None)
+                        if hedge is None:
+                            self.executor.release()
+                        else:
+                            self.hedges += 1
+                            print(f"Hedging slow {primary.model} call on {hedge.model}")
+                            hedge_task = launch(hedge)
+                            # A done callback runs even if the task is cancelled before it starts
+                            hedge_task.add_done_callback(lambda _: self.executor.release())
+        finally:
+            for task in pending:
+                task.cancel()
+
+        return await self._text_only(contents, failure)
+
+    async def _text_only(self, contents: list, reason: str) -> types.GenerateContentResponse:
+        if self.text_fallback is None:
+            raise GenerationBackendError(f"Image generation unavailable: {reason}")
+        self.fallbacks += 1
+        print(f"Image generation unavailable ({reason}), falling back to a text-only description")
+        return await asyncio.wait_for(self.text_fallback.generate_content(contents), self.text_fallback_deadline)
+
+    async def generate_content_stream(self, contents: list) -> AsyncIterator[types.GenerateContentResponse]:
+        """Open a stream on the first available model that sends its first chunk in time.
+
+        Failover (and the text-only fallback) only happens before the first chunk; once output
+        has reached the caller a failure is raised. Streams are not hedged.
+        """
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        tried: set = set()
+        failure = "every image model is unavailable"
+
+        while route := self._next_route(tried):
+            tried.add(id(route))
+            route.calls += 1
+            started = time.perf_counter()
+            iterator = None
+            try:
+                stream = await asyncio.wait_for(route.backend.generate_content_stream(contents), max(deadline - loop.time(), 0))
+                iterator = aiter(stream)
+                first = await asyncio.wait_for(anext(iterator), max(deadline - loop.time(), 0))
+            except StopAsyncIteration:
+                route.record_success(time.perf_counter() - started)
+                return self._relay(route, None, None, started, deadline)
+            except Exception as e:
+                if iterator is not None and hasattr(iterator, "aclose"):
+                    await iterator.aclose()
+                if is_request_error(e):
+                    route.breaker.release()
+                    raise
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                failure = f"{route.model} {'timed out' if timed_out else f'failed: {e}'}"
+                print(f"Model {route.model} stream failed before its first chunk: {type(e).__name__}: {e}")
+                route.record_failure(timed_out=timed_out)
+                if loop.time() >= deadline:
+                    break
+                continue
+            return self._relay(route, first, iterator, started, deadline)
+
+        if self.text_fallback is None:
+            raise GenerationBackendError(f"Image generation unavailable: {failure}")
+        self.fallbacks += 1
+        print(f"Image generation unavailable ({failure}), falling back to a text-only description")
+        return await asyncio.wait_for(self.text_fallback.generate_content_stream(contents), self.text_fallback_deadline)
+
+    async def _relay(self, route: ModelRoute, first, iterator, started: float, deadline: float):
+        loop = asyncio.get_running_loop()
+        if first is None:
+            return
+        yield first
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(anext(iterator), max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        except Exception as e:
+            route.record_failure(timed_out=isinstance(e, asyncio.TimeoutError))
+            raise
+        route.record_success(time.perf_counter() - started)
+
+    async def close(self):
+        for backend in [route.backend for route in self.routes] + [self.text_fallback]:
+            if backend is not None:
+                await backend.close()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedges_skipped": self.hedges_skipped,
+            "text_fallbacks": self.fallbacks,
+            "routes": [route.stats() for route in self.routes],
+        }
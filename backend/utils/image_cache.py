@@ -0,0 +1,320 @@
+import asyncio
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from utils.tracing import current_span, traced
+
+IMAGE_CACHE_MEMORY_BYTES = int(os.getenv("IMAGE_CACHE_MEMORY_MB", "128")) * 1024 * 1024
+IMAGE_CACHE_DISK_BYTES = int(os.getenv("IMAGE_CACHE_DISK_MB", "1024")) * 1024 * 1024
+# URL and source entries kept on disk per directory; they outlive their blobs, so they need their own bound
+IMAGE_CACHE_INDEX_ENTRIES = int(os.getenv("IMAGE_CACHE_INDEX_ENTRIES", "200000"))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "home-designer-image-cache"))
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """Two-tier cache for immutable Storage images, keyed by URL and by content hash.
+
+    URLs map to the SHA-256 of their content, and the bytes are stored once per digest, so
+    the same picture referenced by several URLs only takes space once. The memory tier is an
+    LRU bounded by ``memory_budget`` bytes; the disk tier keeps raw blobs (readable with mmap)
+    under ``disk_dir`` and evicts least recently used files once ``disk_budget`` is exceeded.
+
+    Several worker processes may share ``disk_dir``: blobs, URL digests and the source URL of
+    each digest are looked up on disk when this process hasn't seen them, so an image cached
+    by one worker can be served by any other, and removing one removes it for all of them.
+    The URL and source entries are pruned oldest first beyond ``index_entries`` each.
+    """
+
+    def __init__(self, memory_budget: int, disk_budget: int, disk_dir: str, index_entries: int = IMAGE_CACHE_INDEX_ENTRIES):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.blob_dir = os.path.join(disk_dir, "blobs")
+        self.url_dir = os.path.join(disk_dir, "urls")
+        self.source_dir = os.path.join(disk_dir, "sources")
+        self.index_entries = index_entries
+        self._index_writes = 0
+        self._lock = threading.Lock()
+        self._urls: dict[str, str] = {}
+        self._sources: dict[str, str] = {}
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+        self.invalidations = 0
+        self._disk_enabled = disk_budget > 0
+        if self._disk_enabled:
+            self._load_disk_index()
+
+    def _load_disk_index(self):
+        try:
+            os.makedirs(self.blob_dir, exist_ok=True)
+            os.makedirs(self.url_dir, exist_ok=True)
+            os.makedirs(self.source_dir, exist_ok=True)
+            entries = []
+            for entry in os.scandir(self.blob_dir):
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+            for _, digest, size in sorted(entries):
+                self._disk[digest] = size
+                self._disk_bytes += size
+            self._prune_index()
+        except OSError as e:
+            print(f"Disabling image disk cache: {e}")
+            self._disk_enabled = False
+
+    def get(self, url: str) -> Optional[bytes]:
+        with self._lock:
+            digest = self._urls.get(url)
+            if digest is None and self._disk_enabled:
+                digest = self._read_url_digest(url)
+                if digest is not None:
+                    self._urls[url] = digest
+            if digest is None:
+                self.misses += 1
+                return None
+
+            data = self._get_content_locked(digest)
+            if data is None:
+                self._urls.pop(url, None)
+            else:
+                self._sources.setdefault(digest, url)
+            return data
+
+    def get_content(self, digest: str) -> Optional[bytes]:
+        with self._lock:
+            return self._get_content_locked(digest)
+
+    def source_url(self, digest: str) -> Optional[str]:
+        """Return a Storage URL known to hold ``digest``, for refetching after eviction."""
+        with self._lock:
+            source = self._sources.get(digest)
+            if source is None and self._disk_enabled:
+                source = self._read_text(os.path.join(self.source_dir, digest))
+                if source is not None:
+                    self._sources[digest] = source
+            return source
+
+    def put(self, url: Optional[str], data: bytes) -> str:
+        """Store ``data`` under its content hash, optionally indexed by the URL it came from."""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if url:
+                self._urls[url] = digest
+                self._sources[digest] = url
+            self._remember(digest, data)
+            if self._disk_enabled:
+                self._write_disk(url, digest, data)
+        return digest
+
+    def _get_content_locked(self, digest: str) -> Optional[bytes]:
+        data = self._memory.get(digest)
+        if data is not None and digest in self._disk and not os.path.exists(os.path.join(self.blob_dir, digest)):
+            # Another worker removed the shared blob (an invalidation or an eviction): stop serving it
+            self._forget(digest)
+            data = None
+        if data is not None:
+            self._memory.move_to_end(digest)
+            self.memory_hits += 1
+            return data
+
+        # Not only ``digest in self._disk``: another worker sharing the directory may have written it
+        data = self._read_blob(digest) if self._disk_enabled else None
+        if data is None:
+            self.misses += 1
+            return None
+
+        if digest in self._disk:
+            self._disk.move_to_end(digest)
+        else:
+            self._disk[digest] = len(data)
+            self._disk_bytes += len(data)
+        self.disk_hits += 1
+        self._remember(digest, data)
+        return data
+
+    def invalidate(self, url: str):
+        with self._lock:
+            digest = self._urls.pop(url, None)
+            if digest is None and self._disk_enabled:
+                digest = self._read_url_digest(url)
+            self._remove_file(os.path.join(self.url_dir, _url_key(url)))
+            if digest is None:
+                return
+            self.invalidations += 1
+            if self._sources.get(digest) == url:
+                del self._sources[digest]
+            source_path = os.path.join(self.source_dir, digest)
+            if self._read_text(source_path) == url:
+                self._remove_file(source_path)
+            # Other URLs may still point at the same content; they will miss and refetch.
+            self._forget(digest)
+            # Whichever worker wrote the blob, it is removed for every worker sharing the directory
+            self._remove_file(os.path.join(self.blob_dir, digest))
+
+    def _forget(self, digest: str):
+        data = self._memory.pop(digest, None)
+        if data is not None:
+            self._memory_bytes -= len(data)
+        size = self._disk.pop(digest, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _remember(self, digest: str, data: bytes):
+        if len(data) > self.memory_budget:
+            return
+        if digest in self._memory:
+            self._memory.move_to_end(digest)
+            return
+        self._memory[digest] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.memory_evictions += 1
+
+    def _read_url_digest(self, url: str) -> Optional[str]:
+        return self._read_text(os.path.join(self.url_dir, _url_key(url)))
+
+    @staticmethod
+    def _read_text(path: str) -> Optional[str]:
+        try:
+            with open(path, "r") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _read_blob(self, digest: str) -> Optional[bytes]:
+        path = os.path.join(self.blob_dir, digest)
+        try:
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    data = mapped[:]
+            os.utime(path)
+            return data
+        except (OSError, ValueError):
+            size = self._disk.pop(digest, None)
+            if size is not None:
+                self._disk_bytes -= size
+            return None
+
+    def _write_disk(self, url: Optional[str], digest: str, data: bytes):
+        if len(data) > self.disk_budget:
+            return
+        try:
+            blob_path = os.path.join(self.blob_dir, digest)
+            if digest not in self._disk:
+                self._atomic_write(blob_path, data)
+                self._disk[digest] = len(data)
+                self._disk_bytes += len(data)
+            else:
+                self._disk.move_to_end(digest)
+                if not os.path.exists(blob_path):
+                    self._atomic_write(blob_path, data)
+            if url:
+                self._atomic_write(os.path.join(self.url_dir, _url_key(url)), digest.encode("ascii"))
+                # Kept after the blob is evicted, so any worker can refetch it from Storage
+                self._atomic_write(os.path.join(self.source_dir, digest), url.encode("utf-8"))
+                self._index_writes += 1
+                if self._index_writes % max(self.index_entries // 10, 1) == 0:
+                    self._prune_index()
+        except OSError as e:
+            print(f"Failed to write image cache entry: {e}")
+            return
+
+        while self._disk_bytes > self.disk_budget and self._disk:
+            evicted, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._remove_file(os.path.join(self.blob_dir, evicted))
+            self.disk_evictions += 1
+
+    def _prune_index(self):
+        """Remove the least recently written URL and source entries beyond ``index_entries`` per directory."""
+        for directory in (self.url_dir, self.source_dir):
+            try:
+                entries = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(directory) if entry.is_file())
+            except OSError:
+                continue
+            for _, path in entries[:max(len(entries) - self.index_entries, 0)]:
+                self._remove_file(path)
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            ImageCache._remove_file(tmp_path)
+            raise
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "memory_evictions": self.memory_evictions,
+                "disk_evictions": self.disk_evictions,
+                "invalidations": self.invalidations,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_budget_bytes": self.memory_budget,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "disk_budget_bytes": self.disk_budget if self._disk_enabled else 0,
+            }
+
+
+image_cache = ImageCache(
+    memory_budget=IMAGE_CACHE_MEMORY_BYTES,
+    disk_budget=IMAGE_CACHE_DISK_BYTES,
+    disk_dir=IMAGE_CACHE_DIR,
+)
+
+
+async def get_cached_image(url: str) -> Optional[bytes]:
+    return await asyncio.to_thread(image_cache.get, url)
+
+
+async def get_cached_content(digest: str) -> Optional[bytes]:
+    return await asyncio.to_thread(image_cache.get_content, digest)
+
+
+async def get_source_url(digest: str) -> Optional[str]:
+    return await asyncio.to_thread(image_cache.source_url, digest)
+
+
+@traced("image_cache.store")
+async def cache_image(url: Optional[str], data: bytes) -> str:
+    current_span().set("bytes", len(data))
+    return await asyncio.to_thread(image_cache.put, url, data)
+
+
+async def invalidate_cached_image(url: Optional[str]):
+    if url:
+        await asyncio.to_thread(image_cache.invalidate, url)
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Optional
+
+from utils.image_pipeline import DERIVATIVE_MIME_TYPE, DERIVATIVE_SIZES, derivative_path, make_derivatives
+from utils.repositories import ImageStore
+
+
+def derivative_paths(path: str) -> list[str]:
+    return [derivative_path(path, name) for name in DERIVATIVE_SIZES]
+
+
+def derivative_columns(prefix: str, urls: dict[str, Optional[str]]) -> dict:
+    """Row columns for the derivative URLs, e.g. ``generated_`` -> ``generated_thumbnail_url``."""
+    return {f"{prefix}{name}_url": urls.get(name) for name in DERIVATIVE_SIZES}
+
+
+def with_thumbnail_fallback(row: dict, prefix: str, full_size_column: str) -> dict:
+    """Point missing derivative URLs at the full-size image, for rows stored before derivatives existed."""
+    for name in DERIVATIVE_SIZES:
+        column = f"{prefix}{name}_url"
+        if column in row and not row[column] and full_size_column in row:
+            row[column] = row[full_size_column]
+    return row
+
+
+async def store_derivatives(store: ImageStore, path: str, data: bytes, strict: bool = False) -> dict[str, Optional[str]]:
+    """Build the thumbnail and preview variants of an image and upload them next to ``path``.
+
+    Encoding runs in the image process pool and the uploads run concurrently; both overwrite
+    existing objects so retries are idempotent. Returns public URLs by variant name. Without
+    ``strict`` a failure is logged and yields no URLs, since the full-size image still works.
+    """
+    try:
+        derivatives = await make_derivatives(data)
+        names = list(derivatives)
+        urls = await asyncio.gather(*[
+            store.upload(derivative_path(path, name), derivatives[name], DERIVATIVE_MIME_TYPE, upsert=True)
+            for name in names
+        ])
+        return dict(zip(names, urls))
+    except Exception as e:
+        if strict:
+            raise
+        print(f"Failed to store derivatives of {path}: {e}")
+        return {}
@@ -0,0 +1,124 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+from config.clients import clients
+from utils.image_cache import cache_image, get_cached_image
+from utils.tracing import current_span, traced
+
+IMAGE_FETCH_TIMEOUT_SECONDS = float(os.getenv("IMAGE_FETCH_TIMEOUT_SECONDS", "10"))
+IMAGE_FETCH_DEADLINE_SECONDS = float(os.getenv("IMAGE_FETCH_DEADLINE_SECONDS", "15"))
+IMAGE_FETCH_MAX_CONNECTIONS = int(os.getenv("IMAGE_FETCH_MAX_CONNECTIONS", "32"))
+IMAGE_FETCH_HTTP2 = os.getenv("IMAGE_FETCH_HTTP2", "true").lower() == "true"
+
+
+@dataclass
+class FetchedImage:
+    url: str
+    data: Optional[bytes] = None
+    mime_type: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.data is not None
+
+
+def sniff_image_mime_type(data: bytes, default: str = "application/octet-stream") -> str:
+    """Detect the image type from its magic bytes instead of trusting headers or extensions."""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[4:8] == b"ftyp":
+        brand = data[8:12]
+        if brand in (b"heic", b"heix", b"hevc", b"hevx"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1", b"heif"):
+            return "image/heif"
+        if brand == b"avif":
+            return "image/avif"
+    return default
+
+
+def _create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=IMAGE_FETCH_HTTP2,
+        timeout=IMAGE_FETCH_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=IMAGE_FETCH_MAX_CONNECTIONS,
+            max_keepalive_connections=IMAGE_FETCH_MAX_CONNECTIONS,
+        ),
+        follow_redirects=True,
+    )
+
+
+async def _close_client(client: httpx.AsyncClient):
+    await client.aclose()
+
+
+clients.register("image_fetch", _create_client, _close_client)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    return clients.get("image_fetch")
+
+
+async def close_http_client():
+    await clients.close("image_fetch")
+
+
+@traced("image.fetch")
+async def fetch_image(url: str) -> FetchedImage:
+    """Fetch a Storage image, serving it from the local image cache when possible.
+
+    Stored images get UUID paths and are never rewritten, so a cached copy stays valid
+    until the owning row is deleted and the URL is invalidated.
+    """
+    try:
+        data = await get_cached_image(url)
+        current_span().set("cache_hit", data is not None)
+        if data is not None:
+            current_span().set("bytes", len(data))
+            return FetchedImage(url=url, data=data, mime_type=sniff_image_mime_type(data, "image/jpeg"))
+
+        response = await get_http_client().get(url)
+        if response.status_code != 200:
+            return FetchedImage(url=url, error=f"HTTP {response.status_code}")
+        data = response.content
+        current_span().set("bytes", len(data))
+        await cache_image(url, data)
+        return FetchedImage(url=url, data=data, mime_type=sniff_image_mime_type(data, "image/jpeg"))
+    except Exception as e:
+        return FetchedImage(url=url, error=f"{type(e).__name__}: {e}")
+
+
+@traced("image.fetch_batch")
+async def fetch_images(urls: list[str], deadline: float = IMAGE_FETCH_DEADLINE_SECONDS) -> list[FetchedImage]:
+    """Fetch all URLs concurrently, returning one result per URL in input order.
+
+    Anything still outstanding when ``deadline`` expires is cancelled and reported as failed,
+    so wall time is bounded by the slowest image (or the deadline), not the sum.
+    """
+    if not urls:
+        return []
+
+    tasks = [asyncio.create_task(fetch_image(url)) for url in urls]
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+
+    results = []
+    for url, task in zip(urls, tasks):
+        if task in pending:
+            results.append(FetchedImage(url=url, error=f"Deadline of {deadline}s exceeded"))
+        else:
+            results.append(task.result())
+    return results
@@ -0,0 +1,262 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageOps, features
+
+from utils.tracing import current_span, traced
+
+try:
+    from pillow_heif import register_heif_opener
+
+    register_heif_opener()
+except ImportError:
+    # Without pillow-heif, HEIC/HEIF uploads fail to decode and are rejected.
+    pass
+
+IMAGE_MAX_EDGE_PX = int(os.getenv("IMAGE_MAX_EDGE_PX", "1536"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_PIPELINE_WORKERS = int(os.getenv("IMAGE_PIPELINE_WORKERS", str(min(4, os.cpu_count() or 1))))
+IMAGE_THUMBNAIL_PX = int(os.getenv("IMAGE_THUMBNAIL_PX", "256"))
+IMAGE_PREVIEW_PX = int(os.getenv("IMAGE_PREVIEW_PX", "1024"))
+IMAGE_DERIVATIVE_QUALITY = int(os.getenv("IMAGE_DERIVATIVE_QUALITY", "80"))
+# AVIF is smaller but several times slower to encode, and needs a Pillow built with libavif
+IMAGE_DERIVATIVE_FORMAT = os.getenv("IMAGE_DERIVATIVE_FORMAT", "webp").lower()
+if IMAGE_DERIVATIVE_FORMAT not in ("webp", "avif") or not features.check(IMAGE_DERIVATIVE_FORMAT):
+    print(f"Image derivative format {IMAGE_DERIVATIVE_FORMAT!r} is not available, using webp")
+    IMAGE_DERIVATIVE_FORMAT = "webp"
+
+FILE_EXTENSIONS = {
+    "image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/avif": "avif",
+    "image/heic": "heic", "image/heif": "heif",
+}
+DERIVATIVE_MIME_TYPE = f"image/{IMAGE_DERIVATIVE_FORMAT}"
+# Largest first, so each smaller variant is downscaled from the previous one instead of the original
+DERIVATIVE_SIZES = {"preview": IMAGE_PREVIEW_PX, "thumbnail": IMAGE_THUMBNAIL_PX}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class ImageDecodeError(Exception):
+    """Raised when an upload cannot be decoded as an image."""
+
+
+def normalize_image_bytes(data: bytes, max_edge: int = IMAGE_MAX_EDGE_PX, quality: int = IMAGE_JPEG_QUALITY) -> tuple[bytes, str, dict]:
+    """Decode once, apply EXIF orientation, cap the long edge and re-encode without metadata.
+
+    Opaque images become JPEG; images with transparency become WebP so cut-out furniture keeps
+    its alpha channel. Runs in a worker process, so it only takes and returns picklable values.
+    """
+    started = time.perf_counter()
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        raise ImageDecodeError(str(e)) from e
+    source_format = image.format
+    original_size = image.size
+    decoded = time.perf_counter()
+
+    image = ImageOps.exif_transpose(image)
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    resized = time.perf_counter()
+
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    output = io.BytesIO()
+    if has_alpha:
+        image.convert("RGBA").save(output, format="WEBP", quality=quality, method=4)
+        mime_type = "image/webp"
+    else:
+        image.convert("RGB").save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+        mime_type = "image/jpeg"
+    encoded_bytes = output.getvalue()
+    encoded = time.perf_counter()
+
+    stats = {
+        "source_format": source_format,
+        "source_size": original_size,
+        "output_size": image.size,
+        "input_bytes": len(data),
+        "output_bytes": len(encoded_bytes),
+        "bytes_saved": len(data) - len(encoded_bytes),
+        "decode_ms": round((decoded - started) * 1000, 2),
+        "resize_ms": round((resized - decoded) * 1000, 2),
+        "encode_ms": round((encoded - resized) * 1000, 2),
+    }
+    return encoded_bytes, mime_type, stats
+
+
+def derivative_bytes(data: bytes, sizes: dict[str, int] = DERIVATIVE_SIZES, image_format: str = IMAGE_DERIVATIVE_FORMAT,
+                     quality: int = IMAGE_DERIVATIVE_QUALITY) -> dict[str, bytes]:
+    """Encode a downscaled copy of an image per entry of ``sizes`` (name -> long edge in px).
+
+    The image is decoded once; images smaller than a size are re-encoded without upscaling.
+    Runs in a worker process like ``normalize_image_bytes``.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        raise ImageDecodeError(str(e)) from e
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    derivatives = {}
+    for name, edge in sorted(sizes.items(), key=lambda item: -item[1]):
+        if max(image.size) > edge:
+            image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format=image_format.upper(), quality=quality)
+        derivatives[name] = output.getvalue()
+    return derivatives
+
+
+def derivative_path(path: str, name: str) -> str:
+    """Storage path of a derivative, next to the original: ``a/b.png`` -> ``a/b_thumbnail.webp``."""
+    stem = path.rsplit(".", 1)[0]
+    return f"{stem}_{name}.{FILE_EXTENSIONS[DERIVATIVE_MIME_TYPE]}"
+
+
+HASH_SIZE = 8
+HASH_DCT_SIZE = 32
+# 4 levels per RGB channel
+HISTOGRAM_LEVELS = 4
+HISTOGRAM_BINS = HISTOGRAM_LEVELS ** 3
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    matrix = np.sqrt(2 / n) * np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(HASH_DCT_SIZE)
+
+
+def fingerprint_bytes(data: bytes) -> tuple[int, list[float]]:
+    """Perceptual hash and color histogram of an image, for near-duplicate and similarity search.
+
+    The hash is the classic 64-bit DCT pHash: the low 8x8 frequencies of a 32x32 grayscale
+    copy, each bit set when above their median, so resizing, recompression and small edits
+    flip few bits. The histogram counts pixels in 4x4x4 RGB bins and sums to 1. JPEGs are
+    decoded at reduced scale, which keeps this cheap. Runs in a worker process.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.draft("RGB", (HASH_DCT_SIZE * 2, HASH_DCT_SIZE * 2))
+        image.load()
+    except Exception as e:
+        raise ImageDecodeError(str(e)) from e
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        # Judge cut-out furniture against white rather than whatever the transparent pixels hold
+        image = Image.alpha_composite(Image.new("RGBA", image.size, "white"), image.convert("RGBA"))
+    image = image.convert("RGB")
+
+    gray = np.asarray(image.convert("L").resize((HASH_DCT_SIZE, HASH_DCT_SIZE), Image.Resampling.LANCZOS), dtype=np.float64)
+    low = (_DCT @ gray @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = low > np.median(low[1:])
+    phash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+    levels = np.asarray(image.resize((64, 64), Image.Resampling.BILINEAR), dtype=np.uint8) // (256 // HISTOGRAM_LEVELS)
+    codes = (levels[..., 0].astype(np.int32) * HISTOGRAM_LEVELS + levels[..., 1]) * HISTOGRAM_LEVELS + levels[..., 2]
+    histogram = np.bincount(codes.ravel(), minlength=HISTOGRAM_BINS) / codes.size
+    return phash, [round(float(value), 4) for value in histogram]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Not fork: by now the app runs threads (to_thread, job workers, the span exporter)
+            # whose held locks a forked child would inherit, and could deadlock on
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["utils.image_pipeline"])
+            _pool = ProcessPoolExecutor(max_workers=IMAGE_PIPELINE_WORKERS, mp_context=context)
+        return _pool
+
+
+def shutdown_image_pipeline():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+class PipelineStats:
+    def __init__(self):
+        self.images = 0
+        self.failures = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.decode_ms = 0.0
+        self.resize_ms = 0.0
+        self.encode_ms = 0.0
+        self.queue_ms = 0.0
+
+    def record(self, stats: dict):
+        self.images += 1
+        self.input_bytes += stats["input_bytes"]
+        self.output_bytes += stats["output_bytes"]
+        self.decode_ms += stats["decode_ms"]
+        self.resize_ms += stats["resize_ms"]
+        self.encode_ms += stats["encode_ms"]
+        self.queue_ms += stats["queue_ms"]
+
+    def snapshot(self) -> dict:
+        return {
+            "images": self.images,
+            "failures": self.failures,
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "bytes_saved": self.input_bytes - self.output_bytes,
+            "total_decode_ms": round(self.decode_ms, 2),
+            "total_resize_ms": round(self.resize_ms, 2),
+            "total_encode_ms": round(self.encode_ms, 2),
+            "total_queue_ms": round(self.queue_ms, 2),
+        }
+
+
+pipeline_stats = PipelineStats()
+
+
+@traced("image.normalize")
+async def normalize_image(data: bytes) -> tuple[bytes, str, dict]:
+    """Normalize an upload in the process pool so decoding never blocks the event loop."""
+    current_span().set("bytes", len(data))
+    submitted = time.perf_counter()
+    try:
+        normalized, mime_type, stats = await asyncio.get_running_loop().run_in_executor(_get_pool(), normalize_image_bytes, data)
+    except ImageDecodeError:
+        pipeline_stats.failures += 1
+        raise
+    # Whatever wall time wasn't spent decoding/resizing/encoding was spent waiting for a worker.
+    elapsed_ms = (time.perf_counter() - submitted) * 1000
+    stats["queue_ms"] = round(max(elapsed_ms - stats["decode_ms"] - stats["resize_ms"] - stats["encode_ms"], 0.0), 2)
+    pipeline_stats.record(stats)
+    current_span().set("output_bytes", stats["output_bytes"])
+    current_span().set("queue_ms", stats["queue_ms"])
+    return normalized, mime_type, stats
+
+
+@traced("image.derivatives")
+async def make_derivatives(data: bytes) -> dict[str, bytes]:
+    """Build the ``DERIVATIVE_SIZES`` variants of an image in the process pool."""
+    return await asyncio.get_running_loop().run_in_executor(_get_pool(), derivative_bytes, data)
+
+
+@traced("image.fingerprint")
+async def fingerprint_image(data: bytes) -> tuple[int, list[float]]:
+    """Compute ``fingerprint_bytes`` in the process pool."""
+    return await asyncio.get_running_loop().run_in_executor(_get_pool(), fingerprint_bytes, data)
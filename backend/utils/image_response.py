@@ -0,0 +1,100 @@
+import re
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from utils.base64_helpers import array_buffer_to_base64
+from utils.tracing import span
+
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def inline_image_url(data: bytes, mime_type: str) -> str:
+    with span("response.base64", bytes=len(data)):
+        return f"data:{mime_type};base64,{array_buffer_to_base64(data)}"
+
+
+def image_field(request: Request, image_id: Optional[str], data: Optional[bytes], mime_type: Optional[str], inline: bool) -> Optional[str]:
+    """Value for the ``image`` key of generation responses.
+
+    By default this is a URL of ``/api/images/{image_id}``; ``inline=True`` keeps the old
+    base64 data URL for clients that still expect it.
+    """
+    if not data:
+        return None
+    if inline or not image_id:
+        return inline_image_url(data, mime_type)
+    return str(request.url_for("get_image", image_id=image_id))
+
+
+def _parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive (start, end); None means unsatisfiable."""
+    match = _RANGE_RE.match(header.strip())
+    if not match or size == 0:
+        return None
+    start, end = match.groups()
+    if start == "":
+        if end == "" or int(end) == 0:
+            return None
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    end = size - 1 if end == "" else min(int(end), size - 1)
+    if start > end:
+        return None
+    return start, end
+
+
+def _iter_chunks(view: memoryview):
+    for offset in range(0, len(view), STREAM_CHUNK_SIZE):
+        yield view[offset:offset + STREAM_CHUNK_SIZE].tobytes()
+
+
+def _image_headers(etag: str) -> dict:
+    return {
+        "ETag": f'"{etag}"',
+        "Cache-Control": IMAGE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+
+def not_modified_response(request: Request, etag: str) -> Optional[Response]:
+    """Return a 304 when the client's If-None-Match already covers ``etag``."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if "*" in tags or f'"{etag}"' in tags:
+        return Response(status_code=304, headers=_image_headers(etag))
+    return None
+
+
+def binary_image_response(request: Request, data: bytes, etag: str, mime_type: str) -> Response:
+    """Stream ``data`` with ETag/If-None-Match, immutable Cache-Control and single-range support."""
+    not_modified = not_modified_response(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    quoted_etag = f'"{etag}"'
+    headers = _image_headers(etag)
+    size = len(data)
+    view = memoryview(data)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == quoted_etag):
+        # Multipart ranges are rarely used for images; those get the full body instead.
+        if "," not in range_header:
+            byte_range = _parse_range(range_header, size)
+            if byte_range is None:
+                headers["Content-Range"] = f"bytes */{size}"
+                return Response(status_code=416, headers=headers)
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(_iter_chunks(view[start:end + 1]), status_code=206, media_type=mime_type, headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_iter_chunks(view), media_type=mime_type, headers=headers)
@@ -0,0 +1,314 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from typing import Awaitable, Callable, Optional
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(tempfile.gettempdir(), "home-designer-jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "4"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "60"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+# Finished jobs (and the files of failed ones) are deleted this long after they finished; 0 keeps them
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "168"))
+JOB_PRUNE_INTERVAL_SECONDS = float(os.getenv("JOB_PRUNE_INTERVAL_SECONDS", "3600"))
+
+TERMINAL_STATUSES = {"succeeded", "failed"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    idempotency_key TEXT,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    lease_expires_at REAL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (kind, idempotency_key)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (status, updated_at);
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    mime_type TEXT NOT NULL,
+    filename TEXT,
+    data BLOB NOT NULL,
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+
+class JobPermanentError(Exception):
+    """Raised by a job handler when retrying cannot help (bad input, missing rows, ...)."""
+
+
+def _row_to_job(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+class JobQueue:
+    """Persistent job queue on SQLite.
+
+    Workers claim jobs with a lease; a job whose worker crashed is picked up again once its
+    lease expires, so nothing is lost across restarts. Uploaded files are stored alongside the
+    job and dropped when it succeeds; failed jobs keep theirs so ``requeue_failed`` can replay them
+    until ``prune_finished`` deletes the job.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forget_connection)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """The connection, opened on first use (callers hold ``_lock``) so that importing the
+        module opens no file and each forked server worker gets its own."""
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    def _forget_connection(self):
+        # SQLite connections must not be used across a fork; the parent keeps its own
+        self._lock = threading.Lock()
+        self._db = None
+
+    def enqueue(self, kind: str, params: dict, files: list[tuple[bytes, str, Optional[str]]], idempotency_key: Optional[str] = None, max_attempts: int = JOB_MAX_ATTEMPTS) -> tuple[dict, bool]:
+        """Insert a job and its files; returns ``(job, created)``.
+
+        With an ``idempotency_key`` already used for this kind, the existing job is returned
+        instead and nothing new is queued.
+        """
+        now = time.time()
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                if idempotency_key:
+                    row = self._conn.execute("SELECT * FROM jobs WHERE kind = ? AND idempotency_key = ?", (kind, idempotency_key)).fetchone()
+                    if row is not None:
+                        self._conn.execute("COMMIT")
+                        return _row_to_job(row), False
+                self._conn.execute(
+                    "INSERT INTO jobs (id, kind, idempotency_key, status, params, max_attempts, next_attempt_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?)",
+                    (job_id, kind, idempotency_key, json.dumps(params), max_attempts, now, now, now),
+                )
+                self._conn.executemany(
+                    "INSERT INTO job_files (job_id, position, mime_type, filename, data) VALUES (?, ?, ?, ?, ?)",
+                    [(job_id, position, mime_type, filename, data) for position, (data, mime_type, filename) in enumerate(files)],
+                )
+                row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return _row_to_job(row), True
+
+    def claim(self, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[dict]:
+        """Atomically take the oldest due job (or one whose lease expired) and start a new attempt."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ("
+                "  SELECT id FROM jobs "
+                "  WHERE (status = 'queued' AND next_attempt_at <= ?) OR (status = 'running' AND lease_expires_at < ?) "
+                "  ORDER BY next_attempt_at LIMIT 1"
+                ") RETURNING *",
+                (now + lease_seconds, now, now, now),
+            ).fetchone()
+        return _row_to_job(row) if row else None
+
+    def load_files(self, job_id: str) -> list[tuple[bytes, str, Optional[str]]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data, mime_type, filename FROM job_files WHERE job_id = ? ORDER BY position", (job_id,)).fetchall()
+        return [(row["data"], row["mime_type"], row["filename"]) for row in rows]
+
+    def complete(self, job_id: str, result: dict):
+        self._finish(job_id, "succeeded", result=json.dumps(result))
+
+    def fail(self, job_id: str, error: str):
+        self._finish(job_id, "failed", error=error)
+
+    def retry_later(self, job_id: str, error: str, delay_seconds: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, next_attempt_at = ?, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+                (error, now + delay_seconds, now, job_id),
+            )
+
+    def release(self, job_id: str):
+        """Hand an interrupted attempt back to the queue without counting it."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), next_attempt_at = ?, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                (now, now, job_id),
+            )
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+                (status, result, error, now, job_id),
+            )
+            if status == "succeeded":
+                self._conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+            self._conn.execute("COMMIT")
+
+    def requeue_failed(self, kind: Optional[str] = None) -> int:
+        """Queue failed jobs (optionally of one kind) again with a fresh set of attempts; returns how many."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, error = NULL, next_attempt_at = ?, updated_at = ? "
+                "WHERE status = 'failed' AND (? IS NULL OR kind = ?)",
+                (now, now, kind, kind),
+            )
+        return cursor.rowcount
+
+    def prune_finished(self, older_than_seconds: float) -> int:
+        """Delete succeeded and failed jobs (and their files) that finished more than
+        ``older_than_seconds`` ago; returns how many."""
+        cutoff = time.time() - older_than_seconds
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute(
+                    "DELETE FROM job_files WHERE job_id IN (SELECT id FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?)",
+                    (cutoff,),
+                )
+                cursor = self._conn.execute("DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?", (cutoff,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with full +/-50% jitter so retried jobs don't stampede the model."""
+    base = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * (2 ** max(attempt - 1, 0)))
+    return base * random.uniform(0.5, 1.5)
+
+
+job_queue = JobQueue(JOB_DB_PATH)
+
+JobHandler = Callable[[dict, list[tuple[bytes, str, Optional[str]]]], Awaitable[dict]]
+
+
+class JobWorkerPool:
+    """Asyncio workers that drain a ``JobQueue`` by dispatching each job to the handler for its kind."""
+
+    def __init__(self, queue: JobQueue, handlers: dict[str, JobHandler], concurrency: int):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def notify(self):
+        """Wake idle workers after a job was enqueued in this process."""
+        self._wakeup.set()
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._work(), name=f"job-worker-{i}") for i in range(self.concurrency)]
+        if JOB_RETENTION_HOURS > 0:
+            self._tasks.append(asyncio.create_task(self._prune(), name="job-pruner"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self):
+        while True:
+            try:
+                job = await asyncio.to_thread(self.queue.claim)
+            except Exception as e:
+                print(f"Failed to claim job: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job)
+
+    async def _prune(self):
+        while True:
+            try:
+                pruned = await asyncio.to_thread(self.queue.prune_finished, JOB_RETENTION_HOURS * 3600)
+                if pruned:
+                    print(f"Pruned {pruned} finished jobs")
+            except Exception as e:
+                print(f"Failed to prune finished jobs: {e}")
+            await asyncio.sleep(JOB_PRUNE_INTERVAL_SECONDS)
+
+    async def _run(self, job: dict):
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await asyncio.to_thread(self.queue.fail, job["id"], f"No handler for job kind {job['kind']}")
+            return
+
+        try:
+            files = await asyncio.to_thread(self.queue.load_files, job["id"])
+            result = await handler(job["params"], files)
+            await asyncio.to_thread(self.queue.complete, job["id"], result)
+        except asyncio.CancelledError:
+            # Shutting down: requeue right away (if this process dies instead, the lease expires).
+            await asyncio.to_thread(self.queue.release, job["id"])
+            raise
+        except JobPermanentError as e:
+            await asyncio.to_thread(self.queue.fail, job["id"], str(e))
+        except Exception as e:
+            print(f"Job {job['id']} attempt {job['attempts']} failed: {e}")
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+            if job["attempts"] >= job["max_attempts"]:
+                await asyncio.to_thread(self.queue.fail, job["id"], error)
+            else:
+                await asyncio.to_thread(self.queue.retry_later, job["id"], error, retry_delay(job["attempts"]))
@@ -0,0 +1,141 @@
+import bisect
+import math
+from typing import Callable, Optional
+
+# Seconds; model calls take tens of seconds, Supabase reads a few milliseconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+# Bytes, 1KB to 64MB in powers of 4
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """A Prometheus histogram with a fixed label set, kept in plain per-series bucket counts."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labelvalues):
+        series = self._series.get(labelvalues)
+        if series is None:
+            # bucket counts (non-cumulative, last is +Inf), sum, count
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labelvalues, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}" for labelvalues, value in self._values.items())
+        return lines
+
+
+class CallbackGauge:
+    """A gauge read when scraped; ``read`` returns a number or ``{label value: number}``."""
+
+    def __init__(self, name: str, help: str, read: Callable[[], object], labelname: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labelname = labelname
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Failed to read gauge {self.name}: {e}")
+            return lines
+        if isinstance(value, dict):
+            lines.extend(f"{self.name}{_labels((self.labelname,), (key,))} {_number(item)}" for key, item in value.items())
+        elif value is not None:
+            lines.append(f"{self.name} {_number(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics of this process in the Prometheus text format (version 0.0.4).
+
+    Each worker process keeps its own registry, so with several workers every process has
+    to be scraped (or the numbers summed) to see the whole server.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, read: Callable[[], object], labelname: Optional[str] = None) -> CallbackGauge:
+        return self._register(CallbackGauge(name, help, read, labelname))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds", "Time from receiving a request to sending the last response byte.",
+    ("method", "route", "status"),
+)
+http_request_bytes = metrics.histogram("http_request_body_bytes", "Request body size.", ("method", "route"), SIZE_BUCKETS)
+http_response_bytes = metrics.histogram("http_response_body_bytes", "Response body size.", ("method", "route"), SIZE_BUCKETS)
+stage_seconds = metrics.histogram("app_stage_duration_seconds", "Time spent in each traced stage of a request.", ("stage",))
+stage_bytes = metrics.histogram("app_stage_payload_bytes", "Payload size handled by each traced stage.", ("stage",), SIZE_BUCKETS)
+stage_errors = metrics.counter("app_stage_errors_total", "Traced stages that raised.", ("stage",))
@@ -0,0 +1,64 @@
+import base64
+import json
+from typing import Optional
+
+from fastapi import HTTPException
+
+MAX_PAGE_SIZE = 200
+KEYSET_COLUMNS = ("created_at", "id")
+
+
+def encode_cursor(row: dict) -> str:
+    payload = json.dumps([row["created_at"], row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(created_at, str) or not isinstance(row_id, str) or '"' in created_at + row_id or "\\" in created_at + row_id:
+            raise ValueError("cursor values must be plain strings")
+        return created_at, row_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def select_columns(fields: Optional[str], allowed: list[str], default: list[str]) -> str:
+    """Build the ``select`` list for a ``fields=a,b`` projection.
+
+    The keyset columns are always included so the next cursor can be computed.
+    """
+    if not fields:
+        requested = list(default)
+    else:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in allowed]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    for column in KEYSET_COLUMNS:
+        if column not in requested:
+            requested.append(column)
+    return ",".join(requested)
+
+
+def apply_keyset(query, cursor: Optional[str], limit: int):
+    """Order newest first by ``(created_at, id)`` and continue after ``cursor``.
+
+    One extra row is requested so ``page_results`` can tell whether another page exists.
+    """
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{row_id}")')
+    return query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1)
+
+
+def page_results(rows: Optional[list], limit: int) -> tuple[list, Optional[str]]:
+    rows = rows or []
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1])
@@ -0,0 +1,223 @@
+import os
+import string
+import textwrap
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from google.genai import types
+
+from utils.image_fetcher import fetch_images
+
+FURNITURE_PART_CACHE_BYTES = int(os.getenv("FURNITURE_PART_CACHE_MB", "64")) * 1024 * 1024
+
+
+class PromptTemplate:
+    """A ``str.format``-style template parsed once at import.
+
+    The text is dedented and stripped when compiled, so the indentation of the source
+    literal isn't sent to the model with every request. ``render`` just joins the literal
+    pieces with the values, with no parsing per call; missing fields raise ``KeyError``.
+    """
+
+    def __init__(self, text: str):
+        self.text = textwrap.dedent(text).strip()
+        self._pieces = [(literal, field) for literal, field, _, _ in string.Formatter().parse(self.text)]
+        self.fields = {field for _, field in self._pieces if field}
+
+    def render(self, **values) -> str:
+        out = []
+        for literal, field in self._pieces:
+            out.append(literal)
+            if field is not None:
+                out.append(str(values[field]))
+        return "".join(out)
+
+
+TRY_ON_PROMPT = PromptTemplate("""
+    You are a professional AI interior and exterior designer.
+    Your task is to redesign a user's uploaded space.
+
+    ### User Input
+    - **Design Type:** {design_type}
+    - **Room Type:** {room_type}
+    - **Style:** {style}
+    - **Background Color Preference:** {background_color}
+    - **Foreground Color Preference:** {foreground_color}
+    - **Instructions:** {instructions}
+    {furniture_info}
+
+    ### Objective:
+    1. Apply the chosen design style (e.g., {style}) to the uploaded {room_type}.
+    2. Enhance the space visually while respecting the structure of the original layout.
+    3. Harmonize background/foreground color preferences subtly in the decor.
+    4. Produce a **photo-realistic redesign image** and a **short textual description**.
+    5. You don't need change any structure of the room, just the design.
+    6. The design should be realistic and practical for the user.
+    7. The design should be aligned with the user's preferences and instructions.
+    8. Also return the cost and time required for the redesign.
+    9. Return the cost of design and the the in depth description of the design.
+    10. Return all colors of the design in hex format.
+    11. Return cost of the design in USD.
+    12. **IMPORTANT**: If user furniture images are provided, naturally integrate them into the redesigned space. Place them appropriately based on their category and the room layout. Make sure they blend seamlessly with the overall design aesthetic.
+
+    Return:
+    - A realistic redesigned image of the space.
+    - A short caption describing the redesign, highlighting how it aligns with the selected preferences and suggesting improvements.
+""")
+
+TRY_ON_FURNITURE_HEADER = "\n\n### User's Furniture to Include:\n"
+
+FURNITURE_PLACEMENT_PROMPT = PromptTemplate("""
+    You are a professional AI interior designer specialized in furniture placement.
+
+    ### Task:
+    You are provided with:
+    1. A room design image (the base room)
+    2. {furniture_count} furniture/object image(s) that need to be placed in this room{placed_note}
+
+    ### Room Context:
+    - Design Type: {design_type}
+    - Room Type: {room_type}
+    - Style: {style}
+
+    ### Objective:
+    1. Naturally integrate ALL the provided furniture/object images into the room design
+    2. Place each furniture item in an appropriate location based on its type and the room layout
+    3. Ensure proper scaling so furniture looks proportional to the room
+    4. Maintain realistic perspective and shadows
+    5. Make sure the furniture blends seamlessly with the existing design aesthetic
+    6. Consider practical placement (e.g., sofa against wall, table in center, lamps near seating)
+    7. Preserve the original room's lighting, colors, and overall atmosphere
+
+    ### Important:
+    - The furniture should look like it naturally belongs in the room
+    - Maintain photorealistic quality
+    - Don't change the room structure, only add the furniture
+    - Ensure proper depth perception and spatial relationships
+
+    Return:
+    - A photorealistic image of the room WITH all the furniture items placed naturally
+    - A brief description of where each piece was placed and why
+""")
+
+
+FURNITURE_PLACED_NOTE = PromptTemplate("""
+    The room image already contains {placed_count} furniture item(s) placed earlier. Keep them exactly
+    where and as they are; only add the new furniture/object image(s).
+""")
+
+
+def furniture_placement_prompt(room_design: dict, furniture_count: int, placed_count: int = 0) -> str:
+    """Render the placement prompt for ``furniture_count`` new items, on top of ``placed_count`` already in the image."""
+    placed_note = "\n\n" + FURNITURE_PLACED_NOTE.render(placed_count=placed_count) if placed_count else ""
+    return FURNITURE_PLACEMENT_PROMPT.render(
+        furniture_count=furniture_count,
+        placed_note=placed_note,
+        design_type=room_design["design_type"],
+        room_type=room_design["room_type"],
+        style=room_design["style"],
+    )
+
+
+def furniture_line(furniture: dict) -> str:
+    return f"**{furniture['name']}** (Category: {furniture['category']})"
+
+
+def try_on_prompt(fields: dict, furniture_lines: list[str]) -> str:
+    """Render the try-on prompt; ``furniture_lines`` are numbered in order under their own heading."""
+    furniture_info = ""
+    if furniture_lines:
+        furniture_info = TRY_ON_FURNITURE_HEADER + "".join(f"{idx + 1}. {line}\n" for idx, line in enumerate(furniture_lines))
+    return TRY_ON_PROMPT.render(furniture_info=furniture_info, **fields)
+
+
+@dataclass
+class CatalogPart:
+    """A catalog furniture image ready to send to the model, with its prompt line."""
+    source: tuple
+    part: types.Part
+    line: str
+    size: int
+
+
+class FurniturePartCache:
+    """``types.Part`` objects and prompt lines of catalog furniture, by ``furniture_id``.
+
+    The first request that uses an item fetches its image and wraps it; later requests
+    reuse the same ``Part`` without fetching, copying or wrapping the bytes again. An entry
+    is rebuilt when the row's image URL, name or category changes. Bounded by the image
+    bytes held, least recently used first.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, CatalogPart] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _source(furniture: dict) -> tuple:
+        return furniture["image_url"], furniture["name"], furniture["category"]
+
+    def _get(self, furniture: dict) -> Optional[CatalogPart]:
+        with self._lock:
+            entry = self._entries.get(furniture["id"])
+            if entry is None or entry.source != self._source(furniture):
+                return None
+            self._entries.move_to_end(furniture["id"])
+            return entry
+
+    def _put(self, furniture_id: str, entry: CatalogPart):
+        with self._lock:
+            old = self._entries.pop(furniture_id, None)
+            if old:
+                self._bytes -= old.size
+            if entry.size > self.max_bytes:
+                return
+            self._entries[furniture_id] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def discard(self, furniture_id: str):
+        with self._lock:
+            old = self._entries.pop(furniture_id, None)
+            if old:
+                self._bytes -= old.size
+
+    async def get_many(self, furniture_items: list[dict]) -> tuple[list[str], list[types.Part], list[dict]]:
+        """Prompt lines for every item, image ``Part``s for those whose image loaded, and the
+        ``{"id", "error"}`` of those that failed. Missing images are fetched concurrently."""
+        entries = [self._get(furniture) for furniture in furniture_items]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        self.hits += len(entries) - len(missing)
+        self.misses += len(missing)
+
+        failed = []
+        fetched_images = await fetch_images([furniture_items[i]["image_url"] for i in missing]) if missing else []
+        for i, fetched in zip(missing, fetched_images):
+            furniture = furniture_items[i]
+            if fetched.ok:
+                entries[i] = CatalogPart(
+                    source=self._source(furniture),
+                    part=types.Part.from_bytes(data=fetched.data, mime_type=fetched.mime_type),
+                    line=furniture_line(furniture),
+                    size=len(fetched.data),
+                )
+                self._put(furniture["id"], entries[i])
+            else:
+                failed.append({"id": furniture["id"], "error": fetched.error})
+
+        lines = [entry.line if entry else furniture_line(furniture) for entry, furniture in zip(entries, furniture_items)]
+        return lines, [entry.part for entry in entries if entry], failed
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+furniture_part_cache = FurniturePartCache(FURNITURE_PART_CACHE_BYTES)
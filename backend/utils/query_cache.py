@@ -0,0 +1,136 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+QUERY_CACHE_TTL_SECONDS = {
+    "furniture_items": float(os.getenv("QUERY_CACHE_FURNITURE_TTL_SECONDS", "60")),
+    "room_designs": float(os.getenv("QUERY_CACHE_ROOM_DESIGNS_TTL_SECONDS", "300")),
+}
+QUERY_CACHE_STALE_SECONDS = float(os.getenv("QUERY_CACHE_STALE_SECONDS", "300"))
+QUERY_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "5000"))
+
+
+class QueryCache:
+    """Read-through cache for Supabase reads, grouped by table.
+
+    Within a table's TTL a cached value is returned as is. For ``stale_seconds`` after that the
+    stale value is still returned immediately while a single background task reloads it
+    (stale-while-revalidate). ``None`` results ("not found") are cached for the shorter
+    ``negative_ttl``. Writes call ``invalidate`` for the table they touched; a per-table
+    generation counter stops refreshes that started before the write from storing old data.
+    """
+
+    def __init__(self, ttls: dict[str, float], stale_seconds: float, negative_ttl: float, max_entries: int):
+        self.ttls = ttls
+        self.stale_seconds = stale_seconds
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, Hashable], tuple[Any, float]] = OrderedDict()
+        self._generations: dict[str, int] = {}
+        self._loading: dict[tuple[str, Hashable], asyncio.Future] = {}
+        self._refresh_tasks: set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.invalidations = 0
+
+    def _ttl(self, table: str, value: Any) -> float:
+        return self.negative_ttl if value is None else self.ttls.get(table, 0.0)
+
+    async def get(self, table: str, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for ``(table, key)``, awaiting ``loader()`` on a miss."""
+        cache_key = (table, key)
+        entry = self._entries.get(cache_key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            ttl = self._ttl(table, value)
+            if age < ttl:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return value
+            if value is not None and age < ttl + self.stale_seconds:
+                self._entries.move_to_end(cache_key)
+                self.stale_hits += 1
+                if cache_key not in self._loading:
+                    task = asyncio.create_task(self._load(cache_key, loader))
+                    self._refresh_tasks.add(task)
+                    task.add_done_callback(self._refresh_done)
+                return value
+
+        self.misses += 1
+        while (loading := self._loading.get(cache_key)) is not None:
+            try:
+                return await asyncio.shield(loading)
+            except asyncio.CancelledError:
+                # The caller that started the load was cancelled; take over instead of failing too
+                if not loading.cancelled():
+                    raise
+        return await self._load(cache_key, loader)
+
+    async def _load(self, cache_key: tuple[str, Hashable], loader: Callable[[], Awaitable[Any]]) -> Any:
+        table = cache_key[0]
+        generation = self._generations.get(table, 0)
+        future = asyncio.get_running_loop().create_future()
+        self._loading[cache_key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._loading[cache_key]
+
+        if self._generations.get(table, 0) == generation and self._ttl(table, value) > 0:
+            self._entries[cache_key] = (value, time.monotonic())
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def _refresh_done(self, task: asyncio.Task):
+        self._refresh_tasks.discard(task)
+        self.refreshes += 1
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Background cache refresh failed: {task.exception()}")
+
+    def invalidate(self, table: str, key: Hashable = None):
+        """Drop one key, or every entry of ``table`` when no key is given."""
+        self.invalidations += 1
+        self._generations[table] = self._generations.get(table, 0) + 1
+        if key is not None:
+            self._entries.pop((table, key), None)
+            return
+        for cache_key in [cache_key for cache_key in self._entries if cache_key[0] == table]:
+            del self._entries[cache_key]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "background_refreshes": self.refreshes,
+            "invalidations": self.invalidations,
+            "ttl_seconds": self.ttls,
+            "stale_seconds": self.stale_seconds,
+            "negative_ttl_seconds": self.negative_ttl,
+        }
+
+
+query_cache = QueryCache(
+    ttls=QUERY_CACHE_TTL_SECONDS,
+    stale_seconds=QUERY_CACHE_STALE_SECONDS,
+    negative_ttl=QUERY_CACHE_NEGATIVE_TTL_SECONDS,
+    max_entries=QUERY_CACHE_MAX_ENTRIES,
+)
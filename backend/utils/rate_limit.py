@@ -0,0 +1,226 @@
+import hashlib
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+from utils.generation_executor import generation_executor
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_CAPACITY = float(os.getenv("RATE_LIMIT_CAPACITY", "20"))
+RATE_LIMIT_REFILL_PER_MINUTE = float(os.getenv("RATE_LIMIT_REFILL_PER_MINUTE", "10"))
+RATE_LIMIT_BASE_COST = float(os.getenv("RATE_LIMIT_BASE_COST", "1"))
+RATE_LIMIT_COST_PER_IMAGE = float(os.getenv("RATE_LIMIT_COST_PER_IMAGE", "0.5"))
+RATE_LIMIT_COST_PER_MB = float(os.getenv("RATE_LIMIT_COST_PER_MB", "0.25"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+# Once the generation queue is this full, only requests costing at most RATE_LIMIT_SHED_COST are admitted
+RATE_LIMIT_SHED_QUEUE_FRACTION = float(os.getenv("RATE_LIMIT_SHED_QUEUE_FRACTION", "0.5"))
+RATE_LIMIT_SHED_COST = float(os.getenv("RATE_LIMIT_SHED_COST", "2"))
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory").lower()
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+
+
+class MemoryBucketStore:
+    """Token buckets in this process, for the most recently seen ``max_keys`` clients.
+
+    Forgetting an idle client is harmless: it would have refilled to a full bucket anyway.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, list] = OrderedDict()
+
+    async def take(self, key: str, cost: float, capacity: float, refill_per_second: float) -> tuple[bool, float]:
+        """Spend ``cost`` tokens if the bucket holds them; returns ``(allowed, tokens_left)``."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [capacity, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_per_second)
+            bucket[1] = now
+
+        if bucket[0] < cost:
+            return False, bucket[0]
+        bucket[0] -= cost
+        return True, bucket[0]
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+# Refill, check and spend in one round trip; Redis' own clock keeps all app servers consistent
+REDIS_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared by every app server through Redis (requires the ``redis`` package)."""
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "rate-limit:"):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise ValueError("RATE_LIMIT_STORE=redis requires the redis package (pip install redis)")
+        self.prefix = prefix
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(REDIS_TAKE_SCRIPT)
+
+    async def take(self, key: str, cost: float, capacity: float, refill_per_second: float) -> tuple[bool, float]:
+        allowed, tokens = await self.script(keys=[self.prefix + key], args=[capacity, refill_per_second, cost])
+        return bool(allowed), float(tokens)
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class RateLimiter:
+    """Per-client token buckets charged by the expected cost of a generation request.
+
+    A request costs ``base_cost`` plus ``cost_per_image`` for every image the model will see
+    and ``cost_per_mb`` per megabyte of request body. A request costing more than the bucket
+    capacity could never be paid for, so it is refused with a 413 instead of waiting on a 429.
+    Clients are identified by their ``X-API-Key`` (stored hashed) or, without one, their address.
+    """
+
+    def __init__(
+        self,
+        store,
+        capacity: float = RATE_LIMIT_CAPACITY,
+        refill_per_minute: float = RATE_LIMIT_REFILL_PER_MINUTE,
+        base_cost: float = RATE_LIMIT_BASE_COST,
+        cost_per_image: float = RATE_LIMIT_COST_PER_IMAGE,
+        cost_per_mb: float = RATE_LIMIT_COST_PER_MB,
+        enabled: bool = RATE_LIMIT_ENABLED,
+    ):
+        self.store = store
+        self.capacity = capacity
+        self.refill_per_second = refill_per_minute / 60
+        self.base_cost = base_cost
+        self.cost_per_image = cost_per_image
+        self.cost_per_mb = cost_per_mb
+        self.enabled = enabled
+        self.allowed = 0
+        self.limited = 0
+        self.shed = 0
+        self.too_large = 0
+        self.store_errors = 0
+
+    @staticmethod
+    def client_key(request: Request) -> str:
+        api_key = request.headers.get("x-api-key")
+        if api_key:
+            return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:32]
+        if RATE_LIMIT_TRUST_FORWARDED:
+            forwarded = request.headers.get("x-forwarded-for")
+            if forwarded:
+                return "ip:" + forwarded.split(",")[0].strip()
+        return "ip:" + (request.client.host if request.client else "unknown")
+
+    def cost(self, images: int, input_bytes: int) -> float:
+        return self.base_cost + self.cost_per_image * images + self.cost_per_mb * input_bytes / (1024 * 1024)
+
+    def _saturated(self) -> bool:
+        return generation_executor.waiting >= generation_executor.max_queue * RATE_LIMIT_SHED_QUEUE_FRACTION
+
+    async def check(self, request: Request, images: int, input_bytes: Optional[int] = None, shed: bool = True) -> float:
+        """Charge the client for a request that sends ``images`` images to the model; returns the cost.
+
+        Raises a 413 when the request costs more than a full bucket and a 429 when the client's
+        bucket is empty. With ``shed``, expensive requests are
+        also turned away (without being charged) while the generation queue is filling up, so
+        cheap ones keep flowing; queued job endpoints pass ``shed=False``. ``input_bytes``
+        defaults to the request's Content-Length.
+        """
+        if not self.enabled:
+            return 0.0
+        if input_bytes is None:
+            input_bytes = int(request.headers.get("content-length") or 0)
+        cost = self.cost(images, input_bytes)
+
+        if cost > self.capacity:
+            self.too_large += 1
+            raise HTTPException(
+                status_code=413,
+                detail=f"Request costs {cost:.1f} rate limit units, more than the {self.capacity:g} a client can spend at once; send fewer images",
+            )
+
+        if shed and cost > RATE_LIMIT_SHED_COST and self._saturated():
+            self.shed += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Server is busy; retry later, send fewer images or submit the work to /api/jobs",
+                headers={"Retry-After": str(generation_executor.retry_after)},
+            )
+
+        try:
+            allowed, tokens = await self.store.take(self.client_key(request), cost, self.capacity, self.refill_per_second)
+        except Exception as e:
+            # A shared store outage must not take generation down with it
+            self.store_errors += 1
+            print(f"Rate limit store error, allowing request: {e}")
+            return cost
+
+        if not allowed:
+            self.limited += 1
+            retry_after = math.ceil((cost - tokens) / self.refill_per_second) if self.refill_per_second else 60
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded, please retry later",
+                headers={"Retry-After": str(max(retry_after, 1))},
+            )
+        self.allowed += 1
+        return cost
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "store": self.store.name,
+            "clients": self.store.size(),
+            "capacity": self.capacity,
+            "refill_per_minute": self.refill_per_second * 60,
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "shed": self.shed,
+            "too_large": self.too_large,
+            "store_errors": self.store_errors,
+        }
+
+
+def create_bucket_store(name: str = RATE_LIMIT_STORE):
+    if name == "memory":
+        return MemoryBucketStore(RATE_LIMIT_MAX_CLIENTS)
+    if name == "redis":
+        return RedisBucketStore(RATE_LIMIT_REDIS_URL)
+    raise ValueError(f"Unknown RATE_LIMIT_STORE {name!r}, expected 'memory' or 'redis'")
+
+
+generation_rate_limiter = RateLimiter(create_bucket_store())
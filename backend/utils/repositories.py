@@ -0,0 +1,270 @@
+import asyncio
+import os
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from config.supabase_client import get_supabase
+from utils.pagination import apply_keyset
+from utils.query_cache import query_cache
+from utils.tracing import current_span, span, traced
+
+SUPABASE_READ_RETRIES = int(os.getenv("SUPABASE_READ_RETRIES", "2"))
+SUPABASE_RETRY_BASE_SECONDS = float(os.getenv("SUPABASE_RETRY_BASE_SECONDS", "0.2"))
+SCAN_PAGE_SIZE = 1000
+# Most object paths the Storage API accepts in one remove call
+STORAGE_REMOVE_BATCH = 1000
+
+
+async def execute_read(query):
+    """Execute a read query, retrying timeouts and dropped connections with exponential backoff.
+
+    Reads are idempotent, so unlike writes they are safe to resend after the request went out.
+    """
+    for attempt in range(SUPABASE_READ_RETRIES + 1):
+        try:
+            response = await query.execute()
+            if isinstance(response.data, list) and current_span():
+                current_span().set("rows", len(response.data))
+            return response
+        except httpx.TransportError as e:
+            if attempt == SUPABASE_READ_RETRIES:
+                raise
+            print(f"Supabase read failed ({type(e).__name__}), retrying")
+            await asyncio.sleep(SUPABASE_RETRY_BASE_SECONDS * 2 ** attempt)
+
+
+async def scan(table: str, columns: str, filters=None, page_size: int = SCAN_PAGE_SIZE, key: str = "id") -> AsyncIterator[list]:
+    """Yield every matching row of ``table`` in pages, walking the primary key so each page is an index range scan.
+
+    With another ``key`` (which must be in ``columns``) rows come in that column's order;
+    rows repeating the last value of a page are skipped, so it should be (nearly) unique.
+    """
+    last = None
+    while True:
+        query = get_supabase().table(table).select(columns)
+        if filters:
+            query = filters(query)
+        if last is not None:
+            query = query.gt(key, last)
+        response = await execute_read(query.order(key).limit(page_size))
+        if response.data:
+            yield response.data
+            last = response.data[-1][key]
+        if len(response.data) < page_size:
+            return
+
+
+async def _scan_rows(table: str, columns: str, not_null_column: str) -> AsyncIterator[dict]:
+    async for page in scan(table, columns, lambda query: query.not_.is_(not_null_column, "null")):
+        for row in page:
+            yield row
+
+
+class FurnitureRepo:
+    table = "furniture_items"
+
+    @traced("supabase.furniture_items.list_page")
+    async def list_page(self, columns: str, category: Optional[str], cursor: Optional[str], limit: int) -> list:
+        async def load():
+            query = get_supabase().table(self.table).select(columns)
+            if category:
+                query = query.eq("category", category)
+            response = await execute_read(apply_keyset(query, cursor, limit))
+            return response.data
+
+        return await query_cache.get(self.table, ("list", category, limit, cursor, columns), load)
+
+    @traced("supabase.furniture_items.get_many")
+    async def get_many(self, ids: list[str], cached: bool = True) -> list:
+        """Fetch the rows with these ids; ``cached=False`` reads the database, for callers acting on the result."""
+        async def load():
+            response = await execute_read(get_supabase().table(self.table).select("*").in_("id", ids))
+            return response.data
+
+        if not cached:
+            return await load()
+        return await query_cache.get(self.table, ("ids", tuple(sorted(set(ids)))), load)
+
+    @traced("supabase.furniture_items.get_image_url")
+    async def get_image_url(self, furniture_id: str) -> Optional[str]:
+        response = await execute_read(get_supabase().table(self.table).select("image_url").eq("id", furniture_id))
+        return response.data[0]["image_url"] if response.data else None
+
+    @traced("supabase.furniture_items.create")
+    async def create(self, row: dict) -> Optional[dict]:
+        response = await get_supabase().table(self.table).insert(row).execute()
+        query_cache.invalidate(self.table)
+        return response.data[0] if response.data else None
+
+    @traced("supabase.furniture_items.create_many")
+    async def create_many(self, rows: list[dict]) -> list:
+        """Insert all ``rows`` in one request; the created rows come back in the same order."""
+        response = await get_supabase().table(self.table).insert(rows).execute()
+        query_cache.invalidate(self.table)
+        return response.data
+
+    @traced("supabase.furniture_items.update")
+    async def update(self, furniture_id: str, fields: dict):
+        await get_supabase().table(self.table).update(fields).eq("id", furniture_id).execute()
+        query_cache.invalidate(self.table)
+
+    @traced("supabase.furniture_items.delete")
+    async def delete(self, furniture_id: str):
+        await get_supabase().table(self.table).delete().eq("id", furniture_id).execute()
+        query_cache.invalidate(self.table)
+
+    @traced("supabase.furniture_items.delete_many")
+    async def delete_many(self, ids: list[str]):
+        await get_supabase().table(self.table).delete().in_("id", ids).execute()
+        # Cached lists and id lookups may hold any of the rows, so the whole table goes
+        query_cache.invalidate(self.table)
+
+    def iter_hashes(self) -> AsyncIterator[dict]:
+        return _scan_rows(self.table, "id, category, phash, color_hist", "phash")
+
+
+class RoomDesignRepo:
+    table = "room_designs"
+
+    @traced("supabase.room_designs.list_page")
+    async def list_page(self, columns: str, cursor: Optional[str], limit: int) -> list:
+        query = get_supabase().table(self.table).select(columns)
+        response = await execute_read(apply_keyset(query, cursor, limit))
+        return response.data
+
+    @traced("supabase.room_designs.get")
+    async def get(self, design_id: str, columns: str = "*") -> Optional[dict]:
+        """Fetch one design by id; ``None`` if it does not exist. Full rows go through the query cache."""
+        async def load():
+            query = get_supabase().table(self.table).select(columns).eq("id", design_id).maybe_single()
+            response = await execute_read(query)
+            return response.data if response else None
+
+        if columns != "*":
+            return await load()
+        return await query_cache.get(self.table, design_id, load)
+
+    @traced("supabase.room_designs.get_many")
+    async def get_many(self, ids: list[str], columns: str = "*") -> list:
+        response = await execute_read(get_supabase().table(self.table).select(columns).in_("id", ids))
+        return response.data
+
+    @traced("supabase.room_designs.create")
+    async def create(self, row: dict) -> Optional[dict]:
+        response = await get_supabase().table(self.table).insert(row).execute()
+        return response.data[0] if response.data else None
+
+    @traced("supabase.room_designs.create_many")
+    async def create_many(self, rows: list[dict]) -> list:
+        """Insert all ``rows`` in one request; the created rows come back in the same order."""
+        response = await get_supabase().table(self.table).insert(rows).execute()
+        return response.data
+
+    @traced("supabase.room_designs.update")
+    async def update(self, design_id: str, fields: dict):
+        await get_supabase().table(self.table).update(fields).eq("id", design_id).execute()
+        query_cache.invalidate(self.table, design_id)
+
+    @traced("supabase.room_designs.delete")
+    async def delete(self, design_id: str):
+        await get_supabase().table(self.table).delete().eq("id", design_id).execute()
+        query_cache.invalidate(self.table, design_id)
+
+    @traced("supabase.room_designs.delete_many")
+    async def delete_many(self, ids: list[str]):
+        await get_supabase().table(self.table).delete().in_("id", ids).execute()
+        for design_id in ids:
+            query_cache.invalidate(self.table, design_id)
+
+    def iter_hashes(self) -> AsyncIterator[dict]:
+        return _scan_rows(self.table, "id, room_type, generated_phash, generated_color_hist", "generated_phash")
+
+
+class PlacementRepo:
+    table = "furniture_placements"
+
+    @traced("supabase.furniture_placements.get")
+    async def get(self, placement_id: str) -> Optional[dict]:
+        query = get_supabase().table(self.table).select("*").eq("id", placement_id).maybe_single()
+        response = await execute_read(query)
+        return response.data if response else None
+
+    @traced("supabase.furniture_placements.closest")
+    async def closest(self, room_design_id: str, allowed: list[str], required: list[str]) -> Optional[dict]:
+        """The placement of the design with the most furniture whose set lies between ``required``
+        and ``allowed`` (both furniture hashes), newest first on ties; ``None`` if there is none."""
+        query = (
+            get_supabase().table(self.table).select("*")
+            .eq("room_design_id", room_design_id)
+            .contained_by("furniture_hashes", allowed)
+        )
+        if required:
+            query = query.contains("furniture_hashes", required)
+        query = query.order("furniture_count", desc=True).order("created_at", desc=True).limit(1)
+        response = await execute_read(query)
+        return response.data[0] if response.data else None
+
+    @traced("supabase.furniture_placements.list_for_design")
+    async def list_for_design(self, room_design_id: str, columns: str = "*") -> list:
+        query = (
+            get_supabase().table(self.table).select(columns)
+            .eq("room_design_id", room_design_id)
+            .order("furniture_count", desc=True).order("created_at", desc=True)
+        )
+        response = await execute_read(query)
+        return response.data
+
+    @traced("supabase.furniture_placements.list_for_designs")
+    async def list_for_designs(self, room_design_ids: list[str], columns: str = "*") -> list:
+        response = await execute_read(get_supabase().table(self.table).select(columns).in_("room_design_id", room_design_ids))
+        return response.data
+
+    @traced("supabase.furniture_placements.create")
+    async def create(self, row: dict) -> Optional[dict]:
+        response = await get_supabase().table(self.table).insert(row).execute()
+        return response.data[0] if response.data else None
+
+
+class ImageStore:
+    """A public Supabase Storage bucket addressed by object path."""
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+
+    def path_from_url(self, public_url: str) -> str:
+        return public_url.split(f"/{self.bucket}/")[-1]
+
+    async def upload(self, path: str, data: bytes, content_type: str, upsert: bool = False) -> str:
+        """Upload ``data`` to ``path`` and return its public URL.
+
+        With ``upsert`` an existing object is overwritten, which makes retried uploads idempotent.
+        """
+        with span("storage.upload", bucket=self.bucket, bytes=len(data)):
+            bucket = get_supabase().storage.from_(self.bucket)
+            file_options = {"content-type": content_type}
+            if upsert:
+                file_options["upsert"] = "true"
+            await bucket.upload(path=path, file=data, file_options=file_options)
+            return await bucket.get_public_url(path)
+
+    async def remove(self, paths: list[str]):
+        """Remove objects in as few Storage calls as possible (one per ``STORAGE_REMOVE_BATCH`` paths)."""
+        with span("storage.remove", bucket=self.bucket, objects=len(paths)):
+            bucket = get_supabase().storage.from_(self.bucket)
+            for start in range(0, len(paths), STORAGE_REMOVE_BATCH):
+                await bucket.remove(paths[start:start + STORAGE_REMOVE_BATCH])
+
+    async def list(self, folder: str, offset: int, limit: int) -> list[dict]:
+        """One page of the objects (and subfolders, which have no ``id``) directly in ``folder``, by name."""
+        with span("storage.list", bucket=self.bucket, folder=folder):
+            return await get_supabase().storage.from_(self.bucket).list(
+                folder, {"limit": limit, "offset": offset, "sortBy": {"column": "name", "order": "asc"}}
+            )
+
+
+furniture_repo = FurnitureRepo()
+room_design_repo = RoomDesignRepo()
+placement_repo = PlacementRepo()
+furniture_images = ImageStore("furniture-images")
+room_images = ImageStore("room-images")
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+
+
+def _normalize(value: Optional[str]) -> str:
+    return " ".join((value or "").split()).lower()
+
+
+def generation_cache_key(image_bytes: bytes, furniture_ids: list[str], **fields: Optional[str]) -> str:
+    """Hash the input image, the normalized form fields and the sorted furniture ids.
+
+    Whitespace and case differences in the form fields don't change the key, so resubmitting
+    the same photo with the same choices maps to the same generation.
+    """
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(image_bytes).digest())
+    for name in sorted(fields):
+        digest.update(f"\x00{name}={_normalize(fields[name])}".encode("utf-8"))
+    digest.update(("\x00furniture=" + ",".join(sorted(set(furniture_ids)))).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """TTL + LRU map from a generation key to the id of the row that stored its result,
+    with single-flight coalescing of identical requests that are running at the same time."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, design_id: str):
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, design_id)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: str):
+        self._entries.pop(key, None)
+
+    def discard_design(self, design_id: str):
+        for key in [key for key, (_, cached_id) in self._entries.items() if cached_id == design_id]:
+            del self._entries[key]
+
+    async def single_flight(self, key: str, fn):
+        """Run ``fn()`` once per key; concurrent callers with the same key await the same result."""
+        while (future := self._in_flight.get(key)) is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The leader went away (e.g. its client disconnected); take over unless we were cancelled too.
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved so a leader-only failure doesn't log a warning.
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
+
+
+result_cache = ResultCache(
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+)
@@ -0,0 +1,284 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import numpy as np
+
+from utils.image_pipeline import HISTOGRAM_BINS, fingerprint_image
+from utils.repositories import furniture_repo, room_design_repo
+
+SIMILARITY_INDEX_REFRESH_SECONDS = float(os.getenv("SIMILARITY_INDEX_REFRESH_SECONDS", "300"))
+# Hamming candidates kept per requested result before re-ranking them by color
+SIMILARITY_RERANK_FACTOR = 10
+SIMILARITY_MAX_K = 100
+INITIAL_CAPACITY = 1024
+
+
+def to_signed64(value: int) -> int:
+    """Postgres ``bigint`` is signed; hashes are stored as their two's complement value."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class SimilarityIndex:
+    """64-bit perceptual hashes (plus optional color histograms) held in packed NumPy arrays.
+
+    A query XORs its hash against every entry and counts the differing bits with
+    ``np.bitwise_count``, which is a single vectorized pass; at 100k entries a query takes
+    under a millisecond (see ``benchmarks/bench_similarity_index``), so no tree is needed. The closest candidates by Hamming
+    distance are then re-ranked by color histogram L1 distance, which only ever breaks ties
+    between equal hash distances. Entries can be filtered by a group (e.g. category).
+
+    The index is filled from the table rows yielded by ``loader`` on first use and reloaded in
+    the background once it is older than ``refresh_seconds``, so rows written by other server
+    processes show up; rows written by this process are added right away with ``add_row``.
+    Hashes live in the ``{prefix}phash`` and ``{prefix}color_hist`` columns.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[], AsyncIterator[dict]],
+        prefix: str = "",
+        group_column: Optional[str] = None,
+        refresh_seconds: float = SIMILARITY_INDEX_REFRESH_SECONDS,
+    ):
+        self.name = name
+        self.loader = loader
+        self.prefix = prefix
+        self.group_column = group_column
+        self.refresh_seconds = refresh_seconds
+        self._clear()
+        self.loaded_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self._load_task: Optional[asyncio.Task] = None
+        # Changes made while a reload reads the table, replayed onto the fresh arrays
+        self._changes_during_load: Optional[list[tuple]] = None
+        self.queries = 0
+
+    def _clear(self, capacity: int = INITIAL_CAPACITY):
+        self._count = 0
+        self._ids: list[Optional[str]] = []
+        self._positions: dict[str, int] = {}
+        self._group_codes: dict[str, int] = {}
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._histograms = np.zeros((capacity, HISTOGRAM_BINS), dtype=np.float32)
+        self._has_histogram = np.zeros(capacity, dtype=bool)
+        self._groups = np.full(capacity, -1, dtype=np.int32)
+        self._alive = np.zeros(capacity, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def _grow(self):
+        capacity = len(self._hashes) * 2
+        self._hashes = np.resize(self._hashes, capacity)
+        self._histograms = np.resize(self._histograms, (capacity, HISTOGRAM_BINS))
+        self._has_histogram = np.resize(self._has_histogram, capacity)
+        self._groups = np.resize(self._groups, capacity)
+        self._alive = np.resize(self._alive, capacity)
+        self._alive[self._count:] = False
+
+    def _group_code(self, group: Optional[str]) -> int:
+        if group is None:
+            return -1
+        return self._group_codes.setdefault(group, len(self._group_codes))
+
+    def add(self, item_id: str, phash: int, histogram: Optional[list[float]] = None, group: Optional[str] = None):
+        """Insert or replace an entry; ``phash`` may be given signed (as stored) or unsigned."""
+        if self._changes_during_load is not None:
+            self._changes_during_load.append((item_id, phash, histogram, group))
+        elif self.loaded_at is None:
+            # Not loaded yet: the first load reads the row from the table anyway
+            return
+        self._put(item_id, phash, histogram, group)
+
+    def add_row(self, row: dict):
+        """Index a table row, if it has a hash."""
+        phash = row.get(f"{self.prefix}phash")
+        if phash is not None:
+            group = row.get(self.group_column) if self.group_column else None
+            self.add(row["id"], phash, row.get(f"{self.prefix}color_hist"), group)
+
+    def remove(self, item_id: str):
+        if self._changes_during_load is not None:
+            self._changes_during_load.append((item_id, None, None, None))
+        self._drop(item_id)
+
+    def _put(self, item_id: str, phash: int, histogram: Optional[list[float]], group: Optional[str]):
+        position = self._positions.get(item_id)
+        if position is None:
+            if self._count == len(self._hashes):
+                self._grow()
+            position = self._count
+            self._count += 1
+            self._ids.append(item_id)
+            self._positions[item_id] = position
+        self._hashes[position] = to_unsigned64(int(phash))
+        self._has_histogram[position] = histogram is not None and len(histogram) == HISTOGRAM_BINS
+        self._histograms[position] = histogram if self._has_histogram[position] else 0
+        self._groups[position] = self._group_code(group)
+        self._alive[position] = True
+
+    def _drop(self, item_id: str):
+        position = self._positions.pop(item_id, None)
+        if position is not None:
+            self._alive[position] = False
+            self._ids[position] = None
+
+    def get(self, item_id: str) -> Optional[tuple[int, Optional[np.ndarray]]]:
+        position = self._positions.get(item_id)
+        if position is None:
+            return None
+        histogram = self._histograms[position] if self._has_histogram[position] else None
+        return int(self._hashes[position]), histogram
+
+    def query(
+        self,
+        phash: int,
+        histogram: Optional[list[float]] = None,
+        k: int = 10,
+        max_distance: Optional[int] = None,
+        group: Optional[str] = None,
+        exclude: Optional[str] = None,
+    ) -> list[tuple[str, int, float]]:
+        """Return up to ``k`` ``(id, hamming_distance, color_distance)`` matches, closest first.
+
+        ``color_distance`` is half the histogram L1 distance (0 to 1), or ``None`` when either
+        side has no histogram.
+        """
+        self.queries += 1
+        n = self._count
+        if n == 0 or k < 1:
+            return []
+        distances = np.bitwise_count(self._hashes[:n] ^ np.uint64(to_unsigned64(int(phash))))
+        mask = self._alive[:n].copy()
+        if group is not None:
+            code = self._group_codes.get(group)
+            if code is None:
+                return []
+            mask &= self._groups[:n] == code
+        if max_distance is not None:
+            mask &= distances <= max_distance
+        if exclude is not None and exclude in self._positions:
+            mask[self._positions[exclude]] = False
+
+        scores = np.where(mask, distances.astype(np.float32), np.inf)
+        shortlist = min(n, max(k * SIMILARITY_RERANK_FACTOR, k))
+        candidates = np.argpartition(scores, shortlist - 1)[:shortlist] if shortlist < n else np.arange(n)
+        candidates = candidates[np.isfinite(scores[candidates])]
+
+        color = np.full(len(candidates), np.nan, dtype=np.float32)
+        if histogram is not None and len(histogram) == HISTOGRAM_BINS and len(candidates):
+            query_histogram = np.asarray(histogram, dtype=np.float32)
+            with_histogram = self._has_histogram[candidates]
+            color[with_histogram] = np.abs(self._histograms[candidates[with_histogram]] - query_histogram).sum(axis=1) / 2
+        # Ties on the hash go to the closer colors; entries without a histogram rank in the middle
+        ranked = scores[candidates] + np.where(np.isnan(color), 0.5, np.clip(color, 0, 0.999))
+        order = candidates[np.argsort(ranked, kind="stable")][:k]
+        color_by_position = dict(zip(candidates.tolist(), color.tolist()))
+        return [
+            (
+                self._ids[position],
+                int(distances[position]),
+                None if np.isnan(color_by_position[position]) else round(color_by_position[position], 4),
+            )
+            for position in order.tolist()
+        ]
+
+    def _fill(self, rows: list[dict]):
+        """Replace the contents with ``rows`` column by column rather than one ``_put`` each,
+        so a reload of a large table blocks the event loop as briefly as possible."""
+        n = len(rows)
+        self._clear(max(INITIAL_CAPACITY, n))
+        phash_column, histogram_column = f"{self.prefix}phash", f"{self.prefix}color_hist"
+        self._ids = [row["id"] for row in rows]
+        self._positions = {item_id: position for position, item_id in enumerate(self._ids)}
+        self._count = n
+        # Stored signed; the same 64 bits read as unsigned
+        self._hashes[:n] = np.array([row[phash_column] for row in rows], dtype=np.int64).view(np.uint64)
+        with_histogram = [
+            position for position, row in enumerate(rows)
+            if row.get(histogram_column) is not None and len(row[histogram_column]) == HISTOGRAM_BINS
+        ]
+        if with_histogram:
+            self._histograms[with_histogram] = np.array([rows[position][histogram_column] for position in with_histogram], dtype=np.float32)
+            self._has_histogram[with_histogram] = True
+        if self.group_column:
+            self._groups[:n] = [self._group_code(row.get(self.group_column)) for row in rows]
+        self._alive[:n] = True
+
+    async def _load(self):
+        started = time.perf_counter()
+        self._changes_during_load = []
+        try:
+            rows = [row async for row in self.loader()]
+        finally:
+            changes, self._changes_during_load = self._changes_during_load, None
+        self._fill(rows)
+        for item_id, phash, histogram, group in changes:
+            if phash is None:
+                self._drop(item_id)
+            else:
+                self._put(item_id, phash, histogram, group)
+        self.loaded_at = time.monotonic()
+        self.load_seconds = time.perf_counter() - started
+        print(f"Loaded {len(self)} {self.name} hashes in {self.load_seconds:.2f}s")
+
+    async def ready(self):
+        """Load the index on first use; later, start a background reload once it is stale."""
+        if self._load_task is None or (self._load_task.done() and self._load_task.exception()):
+            self._load_task = asyncio.create_task(self._load())
+        if self.loaded_at is None:
+            await asyncio.shield(self._load_task)
+        elif self._load_task.done() and time.monotonic() - self.loaded_at > self.refresh_seconds:
+            self._load_task = asyncio.create_task(self._load())
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self),
+            "queries": self.queries,
+            "loaded_seconds_ago": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at else None,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+        }
+
+
+def hash_columns(prefix: str, fingerprint: Optional[tuple[int, list[float]]]) -> dict:
+    """Row columns for a ``fingerprint_image`` result, e.g. ``generated_`` -> ``generated_phash``."""
+    if fingerprint is None:
+        return {}
+    phash, histogram = fingerprint
+    return {f"{prefix}phash": to_signed64(phash), f"{prefix}color_hist": histogram}
+
+
+async def fingerprint_or_none(data: bytes, label: str) -> Optional[tuple[int, list[float]]]:
+    """``fingerprint_image``, logging failures; an image without a hash is just left out of search."""
+    try:
+        return await fingerprint_image(data)
+    except Exception as e:
+        print(f"Failed to fingerprint {label}: {e}")
+        return None
+
+
+def similarity_k(k: int) -> int:
+    return max(1, min(k, SIMILARITY_MAX_K))
+
+
+async def rank_rows(matches: list[tuple[str, int, Optional[float]]], load_rows: Callable[[list[str]], Awaitable[list]]) -> list[dict]:
+    """Fetch the rows of ``matches`` and return them in match order with their distances."""
+    if not matches:
+        return []
+    rows = {row["id"]: row for row in await load_rows([item_id for item_id, _, _ in matches])}
+    return [
+        {**rows[item_id], "hash_distance": distance, "color_distance": color}
+        for item_id, distance, color in matches
+        if item_id in rows
+    ]
+
+
+furniture_index = SimilarityIndex("furniture", furniture_repo.iter_hashes, group_column="category")
+design_index = SimilarityIndex("room design", room_design_repo.iter_hashes, prefix="generated_", group_column="room_type")
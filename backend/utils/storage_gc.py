@@ -0,0 +1,220 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from utils.image_derivatives import derivative_paths
+from utils.image_pipeline import DERIVATIVE_SIZES
+from utils.repositories import ImageStore, furniture_images, room_images, scan
+from utils.structured_log import get_logger
+
+# Objects younger than this are left alone: their row may still be on its way (uploads come first)
+STORAGE_GC_MIN_AGE_HOURS = float(os.getenv("STORAGE_GC_MIN_AGE_HOURS", "24"))
+STORAGE_GC_DELETES_PER_SECOND = float(os.getenv("STORAGE_GC_DELETES_PER_SECOND", "50"))
+STORAGE_GC_BATCH_SIZE = int(os.getenv("STORAGE_GC_BATCH_SIZE", "100"))
+STORAGE_GC_PAGE_SIZE = int(os.getenv("STORAGE_GC_PAGE_SIZE", "1000"))
+
+logger = get_logger("storage_gc")
+
+
+def image_paths(store: ImageStore, url: Optional[str]) -> list[str]:
+    """The Storage path of a stored image and of its thumbnail and preview variants."""
+    if not url:
+        return []
+    path = store.path_from_url(url)
+    return [path, *derivative_paths(path)]
+
+
+async def remove_images(store: ImageStore, urls: list[Optional[str]]) -> int:
+    """Remove the images at ``urls`` with their variants in one Storage call per batch.
+
+    Returns the number of paths removed. Failures are logged, not raised: callers delete the
+    rows first, and whatever is left behind is found by ``collect_garbage``.
+    """
+    paths = [path for url in urls for path in image_paths(store, url)]
+    if not paths:
+        return 0
+    try:
+        await store.remove(paths)
+        return len(paths)
+    except Exception as e:
+        logger.error("storage_remove_failed", bucket=store.bucket, objects=len(paths), error=str(e))
+        return 0
+
+
+class StorageOrderError(Exception):
+    """A listing came back out of order, so the merge can't tell orphans apart; nothing more is removed."""
+
+
+@dataclass
+class GCFolder:
+    """A Storage folder whose images are owned by the rows referencing them in ``table.column``."""
+    store: ImageStore
+    folder: str
+    table: str
+    column: str
+
+
+GC_FOLDERS = [
+    GCFolder(furniture_images, "furniture", "furniture_items", "image_url"),
+    GCFolder(room_images, "room-designs/originals", "room_designs", "original_image_url"),
+    GCFolder(room_images, "room-designs/generated", "room_designs", "generated_image_url"),
+    GCFolder(room_images, "room-designs/placements", "furniture_placements", "image_url"),
+]
+
+_DERIVATIVE_SUFFIXES = tuple(f"_{name}" for name in DERIVATIVE_SIZES)
+
+
+def owner_key(name: str) -> str:
+    """The name of the full-size image an object belongs to, without extension.
+
+    ``generated_<uuid>.png`` and its ``generated_<uuid>_thumbnail.webp`` share the key
+    ``generated_<uuid>``, so variants live and die with their image.
+    """
+    stem = name.rsplit(".", 1)[0]
+    for suffix in _DERIVATIVE_SUFFIXES:
+        if stem.endswith(suffix):
+            return stem[: -len(suffix)]
+    return stem
+
+
+async def _ordered(keys: AsyncIterator, label: str) -> AsyncIterator:
+    """Pass through ``(key, ...)`` items, raising if a key is smaller than the one before."""
+    last = None
+    async for item in keys:
+        if last is not None and item[0] < last:
+            raise StorageOrderError(f"{label} listing is not sorted ({item[0]!r} after {last!r})")
+        last = item[0]
+        yield item
+
+
+class _FolderListing:
+    """Pages through a folder by offset, shifting it back by the objects removed behind it."""
+
+    def __init__(self, target: GCFolder):
+        self.target = target
+        self.offset = 0
+        self.scanned = 0
+
+    def removed(self, count: int):
+        self.offset -= count
+
+    async def objects(self) -> AsyncIterator[tuple[str, str, int, Optional[datetime]]]:
+        """Yield ``(key, path, size, created_at)`` for every object in the folder, by name."""
+        while True:
+            page = await self.target.store.list(self.target.folder, self.offset, STORAGE_GC_PAGE_SIZE)
+            self.offset += len(page)
+            for entry in page:
+                if entry.get("id") is None:
+                    continue  # a subfolder
+                self.scanned += 1
+                created_at = entry.get("created_at")
+                yield (
+                    owner_key(entry["name"]),
+                    f"{self.target.folder}/{entry['name']}",
+                    int((entry.get("metadata") or {}).get("size") or 0),
+                    datetime.fromisoformat(created_at) if created_at else None,
+                )
+            if len(page) < STORAGE_GC_PAGE_SIZE:
+                return
+
+
+async def _referenced_keys(target: GCFolder) -> AsyncIterator[tuple[str]]:
+    """Yield the key of every image in the folder that a row references, in URL order."""
+    prefix = f"{target.folder}/"
+    column = target.column
+    async for page in scan(target.table, column, lambda query: query.not_.is_(column, "null"), key=column):
+        for row in page:
+            path = target.store.path_from_url(row[column])
+            if path.startswith(prefix) and "/" not in path[len(prefix):]:
+                yield (owner_key(path[len(prefix):]),)
+
+
+async def orphaned_objects(objects: AsyncIterator, referenced: AsyncIterator) -> AsyncIterator:
+    """Objects whose key is not referenced: a set difference of two streams sorted by key.
+
+    Both streams are consumed once, side by side, so memory stays constant however many
+    objects and rows there are.
+    """
+    current = await anext(referenced, None)
+    async for item in objects:
+        while current is not None and current[0] < item[0]:
+            current = await anext(referenced, None)
+        if current is None or current[0] != item[0]:
+            yield item
+
+
+async def _collect_folder(target: GCFolder, dry_run: bool, min_age_seconds: float, deletes_per_second: float) -> dict:
+    listing = _FolderListing(target)
+    report = {"scanned": 0, "orphans": 0, "removed": 0, "bytes_reclaimed": 0, "skipped_recent": 0}
+    cutoff = time.time() - min_age_seconds
+    batch: list[tuple[str, int]] = []
+
+    async def flush():
+        paths = [path for path, _ in batch]
+        started = time.monotonic()
+        await target.store.remove(paths)
+        # Removed objects were all listed already, so the next page starts that much earlier
+        listing.removed(len(paths))
+        report["removed"] += len(paths)
+        report["bytes_reclaimed"] += sum(size for _, size in batch)
+        batch.clear()
+        # Pace removals so a large cleanup doesn't crowd out user traffic on the Storage API
+        if deletes_per_second > 0:
+            await asyncio.sleep(max(0.0, len(paths) / deletes_per_second - (time.monotonic() - started)))
+
+    label = f"{target.store.bucket}/{target.folder}"
+    objects = _ordered(listing.objects(), label)
+    referenced = _ordered(_referenced_keys(target), f"{target.table}.{target.column}")
+    try:
+        async for _, path, size, created_at in orphaned_objects(objects, referenced):
+            if created_at is not None and created_at.timestamp() > cutoff:
+                report["skipped_recent"] += 1
+                continue
+            report["orphans"] += 1
+            if dry_run:
+                report["bytes_reclaimed"] += size
+                continue
+            batch.append((path, size))
+            if len(batch) >= STORAGE_GC_BATCH_SIZE:
+                await flush()
+        if batch:
+            await flush()
+    finally:
+        report["scanned"] = listing.scanned
+    return report
+
+
+async def collect_garbage(
+    dry_run: bool = False,
+    min_age_hours: float = STORAGE_GC_MIN_AGE_HOURS,
+    deletes_per_second: float = STORAGE_GC_DELETES_PER_SECOND,
+) -> dict:
+    """Remove the Storage objects no row references, folder by folder.
+
+    Each folder listing and the referencing URL column are walked in name order and merged,
+    so the run holds a page of each at a time. Objects newer than ``min_age_hours`` are kept.
+    Returns per-folder counts and the bytes reclaimed (or reclaimable, with ``dry_run``); a
+    folder that fails reports its ``error`` and the others still run.
+    """
+    started = time.monotonic()
+    folders = {}
+    for target in GC_FOLDERS:
+        label = f"{target.store.bucket}/{target.folder}"
+        try:
+            folders[label] = await _collect_folder(target, dry_run, min_age_hours * 3600, deletes_per_second)
+        except Exception as e:
+            logger.error("storage_gc_folder_failed", folder=label, error=f"{type(e).__name__}: {e}")
+            folders[label] = {"error": f"{type(e).__name__}: {e}"}
+    report = {
+        "dry_run": dry_run,
+        "folders": folders,
+        "removed": sum(folder.get("removed", 0) for folder in folders.values()),
+        "bytes_reclaimed": sum(folder.get("bytes_reclaimed", 0) for folder in folders.values()),
+        "seconds": round(time.monotonic() - started, 3),
+    }
+    logger.info("storage_gc", **report)
+    return report
+
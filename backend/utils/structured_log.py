@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import random
+import sys
+import time
+from typing import Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction of debug and info events written; warnings and errors are always written
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+# Longer strings (e.g. prompts and model text) are cut down to this many characters
+LOG_MAX_STRING_CHARS = int(os.getenv("LOG_MAX_STRING_CHARS", "500"))
+
+
+def _summarize(value, depth: int = 0):
+    """Make ``value`` JSON-safe without ever including binary payloads.
+
+    Bytes become their length, objects with ``inline_data`` (model ``Part``s) become their
+    MIME type and length, and long strings are truncated, so an image can't end up in a log
+    line by accident however it is nested.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"bytes": len(value)}
+    if isinstance(value, str):
+        if len(value) > LOG_MAX_STRING_CHARS:
+            return value[:LOG_MAX_STRING_CHARS] + f"... ({len(value)} chars)"
+        return value
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if depth >= 4:
+        return type(value).__name__
+    if isinstance(value, dict):
+        return {str(key): _summarize(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_summarize(item, depth + 1) for item in value]
+    inline_data = getattr(value, "inline_data", None)
+    if inline_data is not None:
+        return {"inline_data": getattr(inline_data, "mime_type", None), "bytes": len(getattr(inline_data, "data", None) or b"")}
+    if isinstance(getattr(value, "text", None), str):
+        return {"text": _summarize(value.text, depth + 1)}
+    return type(value).__name__
+
+
+class StructuredLogger:
+    """Writes one JSON object per event: ``{"ts", "level", "logger", "event", **fields}``.
+
+    Disabled levels return before any field is touched, so ``debug`` calls cost almost
+    nothing in production. Debug and info events are kept with probability ``sample_rate``
+    (per call if given, else ``LOG_SAMPLE_RATE``) and carry the rate they were sampled at.
+    """
+
+    def __init__(self, name: str, sample_rate: float = LOG_SAMPLE_RATE):
+        self.logger = logging.getLogger(name)
+        self.sample_rate = sample_rate
+
+    def enabled(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level: int, event: str, sample_rate: Optional[float] = None, **fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING:
+            rate = self.sample_rate if sample_rate is None else sample_rate
+            if rate < 1:
+                if random.random() >= rate:
+                    return
+                fields["sample_rate"] = rate
+        record = {
+            "ts": round(time.time(), 3),
+            "level": logging.getLevelName(level).lower(),
+            "logger": self.logger.name,
+            "event": event,
+            **{key: _summarize(value) for key, value in fields.items()},
+        }
+        self.logger.log(level, json.dumps(record, default=str))
+
+    def debug(self, event: str, sample_rate: Optional[float] = None, **fields):
+        self.log(logging.DEBUG, event, sample_rate, **fields)
+
+    def info(self, event: str, sample_rate: Optional[float] = None, **fields):
+        self.log(logging.INFO, event, sample_rate, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+
+def _configure_root() -> logging.Logger:
+    root = logging.getLogger("app")
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        root.addHandler(handler)
+    # Kept out of uvicorn's handlers so every line stays plain JSON
+    root.propagate = False
+    return root
+
+
+_configure_root()
+
+
+def get_logger(name: str) -> StructuredLogger:
+    """A logger under the ``app`` hierarchy, e.g. ``get_logger("generation")``."""
+    return StructuredLogger(f"app.{name}")
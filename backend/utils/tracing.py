@@ -0,0 +1,356 @@
+import asyncio
+import functools
+import json
+import os
+import random
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+
+from utils.metrics import http_request_bytes, http_request_seconds, http_response_bytes, stage_bytes, stage_errors, stage_seconds
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "home-designer-api")
+# "file" appends OTLP/JSON lines to TRACING_FILE, "otlp" posts them to a collector, "" keeps only metrics
+TRACING_EXPORT = os.getenv("TRACING_EXPORT", "").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+# Fraction of traces exported; requests carrying a sampled traceparent are always exported
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "0.1"))
+TRACING_FLUSH_SECONDS = float(os.getenv("TRACING_FLUSH_SECONDS", "5"))
+TRACING_MAX_QUEUE = int(os.getenv("TRACING_MAX_QUEUE", "10000"))
+# Requests with "X-Profile: <token>" are profiled with pyinstrument; unset disables profiling
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+PROFILING_INTERVAL_SECONDS = float(os.getenv("PROFILING_INTERVAL_SECONDS", "0.001"))
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+# Stages listed in the Server-Timing header of one response
+SERVER_TIMING_MAX_STAGES = 20
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage of a request, shaped like an OpenTelemetry span.
+
+    Ending a span always records its duration (and its ``bytes`` attribute, if any) in the
+    stage histograms and adds it to its request's Server-Timing totals; only spans of sampled
+    traces are queued for export.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "kind", "attributes",
+                 "start_ns", "end_ns", "error", "root", "stage_totals", "_token")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, kind: int = SPAN_KIND_INTERNAL,
+                 trace_id: Optional[str] = None, parent_id: Optional[str] = None, sampled: Optional[bool] = None,
+                 attributes: Optional[dict] = None):
+        self.name = name
+        # Random ids as the OpenTelemetry SDK makes them; no syscall per span, unlike os.urandom
+        self.trace_id = parent.trace_id if parent else trace_id or f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else parent_id
+        if parent:
+            self.sampled = parent.sampled
+        else:
+            self.sampled = sampled if sampled is not None else random.random() < TRACING_SAMPLE_RATE
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self.root = parent.root if parent else self
+        self.stage_totals: Optional[dict[str, float]] = {} if parent is None else None
+        self._token = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def end(self, error: Optional[BaseException] = None, end_ns: Optional[int] = None):
+        self.end_ns = end_ns or time.time_ns()
+        duration = self.duration
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+            stage_errors.inc(self.name)
+        if self.kind == SPAN_KIND_INTERNAL:
+            stage_seconds.observe(duration, self.name)
+            if isinstance(self.attributes.get("bytes"), int):
+                stage_bytes.observe(self.attributes["bytes"], self.name)
+            totals = self.root.stage_totals
+            if self.root is not self and (self.name in totals or len(totals) < SERVER_TIMING_MAX_STAGES):
+                totals[self.name] = totals.get(self.name, 0.0) + duration
+        if self.sampled:
+            span_exporter.add(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Exited from another context (e.g. an async generator resumed elsewhere)
+            _current_span.set(None)
+        self.end(exc if exc_type and not issubclass(exc_type, (asyncio.CancelledError, GeneratorExit)) else None)
+        return False
+
+
+def span(name: str, **attributes) -> Span:
+    """Time a stage as a child of the current span: ``with span("storage.upload", bytes=n) as s:``."""
+    return Span(name, _current_span.get(), attributes=attributes)
+
+
+def traced(name: str):
+    """Decorate an async function so each call is timed as a ``name`` span.
+
+    Inside, ``current_span().set(...)`` adds attributes such as ``bytes``.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def record_span(name: str, start_ns: int, end_ns: int, **attributes):
+    """Record a stage that was timed by hand, e.g. one whose body yields and can't be a ``with`` block."""
+    finished = Span(name, _current_span.get(), attributes=attributes)
+    finished.start_ns = start_ns
+    finished.end(end_ns=end_ns)
+
+
+def _attribute_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(finished: Span) -> dict:
+    payload = {
+        "traceId": finished.trace_id,
+        "spanId": finished.span_id,
+        "name": finished.name,
+        "kind": finished.kind,
+        "startTimeUnixNano": str(finished.start_ns),
+        "endTimeUnixNano": str(finished.end_ns),
+        "attributes": [{"key": key, "value": _attribute_value(value)} for key, value in finished.attributes.items() if value is not None],
+        "status": {"code": STATUS_ERROR, "message": finished.error} if finished.error else {"code": STATUS_OK},
+    }
+    if finished.parent_id:
+        payload["parentSpanId"] = finished.parent_id
+    return payload
+
+
+class SpanExporter:
+    """Batches finished spans and writes them as OTLP/JSON ``ExportTraceServiceRequest`` objects.
+
+    ``file`` appends one request per line, which a collector's ``otlpjsonfile`` receiver (or
+    ``jq``) can read; ``otlp`` posts each batch to an OTLP/HTTP endpoint. The queue is bounded
+    and drops the oldest spans when the exporter falls behind; request handling never waits on it.
+    """
+
+    def __init__(self, mode: str, max_queue: int):
+        self.mode = mode
+        self._queue: deque[Span] = deque(maxlen=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def add(self, finished: Span):
+        if not self.mode:
+            return
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(finished)
+
+    def _payload(self, batch: list[Span]) -> str:
+        return json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "app"}, "spans": [_otlp_span(finished) for finished in batch]}],
+            }]
+        })
+
+    def _append_to_file(self, payload: str):
+        with open(TRACING_FILE, "a", encoding="utf-8") as f:
+            f.write(payload + "\n")
+
+    async def flush(self):
+        if not self._queue:
+            return
+        batch = list(self._queue)
+        self._queue.clear()
+        payload = self._payload(batch)
+        try:
+            if self.mode == "file":
+                await asyncio.to_thread(self._append_to_file, payload)
+            else:
+                from utils.image_fetcher import get_http_client
+
+                response = await get_http_client().post(
+                    TRACING_OTLP_ENDPOINT, content=payload, headers={"Content-Type": "application/json"}
+                )
+                response.raise_for_status()
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Failed to export {len(batch)} spans: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(TRACING_FLUSH_SECONDS)
+            await self.flush()
+
+    def start(self):
+        if self.mode and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {"mode": self.mode or None, "queued": len(self._queue), "exported": self.exported,
+                "dropped": self.dropped, "failed": self.failed}
+
+
+span_exporter = SpanExporter(TRACING_EXPORT if TRACING_EXPORT in ("file", "otlp") else "", TRACING_MAX_QUEUE)
+_profiling = False
+
+
+def _server_timing(root: Span) -> str:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in root.stage_totals.items()]
+    entries.append(f"total;dur={root.duration * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def _write_profile(profiler, trace_id: str) -> str:
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    path = os.path.join(PROFILING_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{trace_id}.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profiler.output_html())
+    return path
+
+
+class TracingMiddleware:
+    """Opens the root span of every HTTP request and records the request metrics.
+
+    An incoming W3C ``traceparent`` is continued (and its sampling decision kept); the
+    response carries the request's own ``traceparent`` and a ``Server-Timing`` header with
+    the stages finished before the response started, which browsers show in their network
+    panel. Requests sending ``X-Profile: <PROFILING_TOKEN>`` are run under pyinstrument, one
+    at a time, and the HTML profile is written to ``PROFILING_DIR``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        global _profiling
+
+        headers = dict(scope["headers"])
+        incoming = _TRACEPARENT.match(headers.get(b"traceparent", b"").decode("latin-1").strip())
+        root = Span(
+            "http.request",
+            kind=SPAN_KIND_SERVER,
+            trace_id=incoming.group(1) if incoming else None,
+            parent_id=incoming.group(2) if incoming else None,
+            sampled=(incoming.group(3) == "01") if incoming else None,
+            attributes={"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        token = _current_span.set(root)
+
+        profiler = None
+        if PROFILING_TOKEN and headers.get(b"x-profile", b"").decode("latin-1") == PROFILING_TOKEN and not _profiling:
+            if Profiler is None:
+                print("X-Profile ignored: pyinstrument is not installed")
+            else:
+                _profiling = True
+                profiler = Profiler(interval=PROFILING_INTERVAL_SECONDS, async_mode="enabled")
+                profiler.start()
+
+        request_bytes = 0
+        response_bytes = 0
+        status = 500
+
+        async def traced_receive():
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def traced_send(message):
+            nonlocal response_bytes, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = MutableHeaders(scope=message)
+                response_headers["traceparent"] = root.traceparent()
+                response_headers["server-timing"] = _server_timing(root)
+                if profiler:
+                    response_headers["x-profile-id"] = root.trace_id
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, traced_receive, traced_send)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            root.name = f"{method} {route}"
+            root.attributes.update({"http.route": route, "http.status_code": status,
+                                    "http.request_content_length": request_bytes, "http.response_content_length": response_bytes})
+            root.end(error if isinstance(error, Exception) else None)
+            http_request_seconds.observe(root.duration, method, route, str(status))
+            http_request_bytes.observe(request_bytes, method, route)
+            http_response_bytes.observe(response_bytes, method, route)
+            if profiler:
+                profiler.stop()
+                _profiling = False
+                try:
+                    path = await asyncio.to_thread(_write_profile, profiler, root.trace_id)
+                    print(f"Profile of {method} {scope['path']} written to {path}")
+                except Exception as e:
+                    print(f"Failed to write profile: {e}")
@@ -0,0 +1,105 @@
+import hashlib
+import io
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from utils.image_fetcher import sniff_image_mime_type
+from utils.tracing import current_span, traced
+
+ALLOWED_MIME_TYPES = {"image/jpeg", "image/png", "image/webp", "image/heic", "image/heif"}
+MAX_IMAGE_SIZE_MB = 10
+MAX_IMAGE_SIZE_BYTES = MAX_IMAGE_SIZE_MB * 1024 * 1024
+MAX_REQUEST_BODY_BYTES = int(os.getenv("MAX_REQUEST_BODY_MB", "60")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class ValidatedUpload:
+    data: bytes
+    mime_type: str
+    sha256: str
+    filename: Optional[str]
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+@traced("upload.read")
+async def read_upload(upload: UploadFile, label: str, max_bytes: int = MAX_IMAGE_SIZE_BYTES) -> ValidatedUpload:
+    """Read an uploaded image in chunks, rejecting it as soon as it is known to be invalid.
+
+    The declared content type is checked first, then the size Starlette recorded while
+    spooling the part, then the magic bytes of the first chunk, and finally a running byte
+    count, so oversized or non-image files are never fully loaded. The SHA-256 is computed
+    on the fly and the returned MIME type is the sniffed one.
+    """
+    if upload.content_type not in ALLOWED_MIME_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type for {label}: {upload.content_type}")
+
+    too_large = HTTPException(status_code=400, detail=f"{label} exceeds {max_bytes // (1024 * 1024)}MB size limit")
+    if upload.size is not None and upload.size > max_bytes:
+        raise too_large
+
+    digest = hashlib.sha256()
+    # BytesIO hands its buffer over on getvalue(), so the body is held once rather than as chunks + a joined copy
+    buffer = io.BytesIO()
+    total = 0
+    mime_type = None
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        if mime_type is None:
+            mime_type = sniff_image_mime_type(chunk, default="")
+            if mime_type not in ALLOWED_MIME_TYPES:
+                raise HTTPException(status_code=400, detail=f"{label} is not a supported image")
+        total += len(chunk)
+        if total > max_bytes:
+            raise too_large
+        digest.update(chunk)
+        buffer.write(chunk)
+
+    if mime_type is None:
+        raise HTTPException(status_code=400, detail=f"{label} is empty")
+
+    current_span().set("bytes", total)
+
+    return ValidatedUpload(data=buffer.getvalue(), mime_type=mime_type, sha256=digest.hexdigest(), filename=upload.filename)
+
+
+class RequestBodyLimitMiddleware:
+    """Reject request bodies over ``max_body_bytes`` before they are parsed.
+
+    Requests announcing a larger Content-Length are answered with 413 without reading the
+    body; chunked or lying clients are cut off by a running count as the body streams in.
+    """
+
+    def __init__(self, app, max_body_bytes: int = MAX_REQUEST_BODY_BYTES):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds {self.max_body_bytes // (1024 * 1024)}MB limit"
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_body_bytes:
+                await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
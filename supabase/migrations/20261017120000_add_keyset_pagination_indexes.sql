@@ -0,0 +1,15 @@
+/*
+  # Add keyset pagination indexes
+
+  1. Indexes
+    - `furniture_items (category, created_at DESC, id DESC)` for category-filtered list pages
+    - `furniture_items (created_at DESC, id DESC)` for unfiltered list pages
+    - `room_designs (created_at DESC, id DESC)` for design list pages (the table had no index)
+
+  List endpoints page on `(created_at, id)` newest first, so each page is an index range scan
+  starting right after the previous page's cursor instead of an offset scan.
+*/
+
+CREATE INDEX IF NOT EXISTS idx_furniture_category_created_at_id ON furniture_items(category, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_furniture_created_at_id ON furniture_items(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_room_designs_created_at_id ON room_designs(created_at DESC, id DESC);
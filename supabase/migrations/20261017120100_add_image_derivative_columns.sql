@@ -0,0 +1,24 @@
+/*
+  # Add thumbnail and preview image columns
+
+  1. Modified Tables
+    - `furniture_items`
+      - `thumbnail_url` (text, nullable) - 256px variant of `image_url`
+      - `preview_url` (text, nullable) - 1024px variant of `image_url`
+    - `room_designs`
+      - `original_thumbnail_url` / `original_preview_url` (text, nullable) - variants of `original_image_url`
+      - `generated_thumbnail_url` / `generated_preview_url` (text, nullable) - variants of `generated_image_url`
+
+  The variants (WebP by default) are stored next to the full-size objects in the
+  `furniture-images` and `room-images` buckets, e.g. `furniture/<id>_thumbnail.webp`.
+  Rows created before this migration keep NULL here; list endpoints fall back to the
+  full-size URL for them.
+*/
+
+ALTER TABLE furniture_items ADD COLUMN IF NOT EXISTS thumbnail_url text;
+ALTER TABLE furniture_items ADD COLUMN IF NOT EXISTS preview_url text;
+
+ALTER TABLE room_designs ADD COLUMN IF NOT EXISTS original_thumbnail_url text;
+ALTER TABLE room_designs ADD COLUMN IF NOT EXISTS original_preview_url text;
+ALTER TABLE room_designs ADD COLUMN IF NOT EXISTS generated_thumbnail_url text;
+ALTER TABLE room_designs ADD COLUMN IF NOT EXISTS generated_preview_url text;
@@ -0,0 +1,28 @@
+/*
+  # Add perceptual hashes for image similarity search
+
+  1. Modified Tables
+    - `furniture_items`
+      - `phash` (bigint, nullable) - 64-bit DCT perceptual hash of `image_url`
+      - `color_hist` (real[], nullable) - 64-bin (4x4x4 RGB) color histogram, sums to 1
+    - `room_designs`
+      - `generated_phash` (bigint, nullable) - perceptual hash of `generated_image_url`
+      - `generated_color_hist` (real[], nullable) - color histogram of `generated_image_url`
+
+  2. Indexes
+    - Partial indexes on `id` over the hashed rows, which the API server walks in id
+      order to build its in-memory similarity index
+
+  Hashes are unsigned 64-bit values stored as their two's complement. Similarity is
+  computed in the API server, so the columns are only read in bulk. Existing rows keep
+  NULL until `python -m scripts.backfill_image_hashes` is run.
+*/
+
+ALTER TABLE furniture_items ADD COLUMN IF NOT EXISTS phash bigint;
+ALTER TABLE furniture_items ADD COLUMN IF NOT EXISTS color_hist real[];
+
+ALTER TABLE room_designs ADD COLUMN IF NOT EXISTS generated_phash bigint;
+ALTER TABLE room_designs ADD COLUMN IF NOT EXISTS generated_color_hist real[];
+
+CREATE INDEX IF NOT EXISTS idx_furniture_hashed_id ON furniture_items(id) WHERE phash IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_room_designs_hashed_id ON room_designs(id) WHERE generated_phash IS NOT NULL;
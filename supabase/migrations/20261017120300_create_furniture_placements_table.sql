@@ -0,0 +1,69 @@
+/*
+  # Create furniture_placements table for versioned furniture placement results
+
+  1. New Tables
+    - `furniture_placements`
+      - `id` (uuid, primary key)
+      - `room_design_id` (uuid) - the room design the furniture was placed into
+      - `base_placement_id` (uuid, nullable) - the placement whose image this one was generated from,
+        NULL when it was generated from the design's `generated_image_url`
+      - `version` (integer) - 1 for a placement on the bare design, base version + 1 otherwise
+      - `furniture_hashes` (text[]) - sorted SHA-256 digests of every furniture image in the result
+      - `added_hashes` (text[]) - digests of the furniture images sent to the model for this version
+      - `furniture_count` (integer) - number of entries in `furniture_hashes`
+      - `image_url` (text) - URL to the placement image in the `room-images` bucket
+      - `description` (text, nullable) - AI-generated description
+      - `created_at` (timestamptz)
+
+  2. Indexes
+    - GIN index on `furniture_hashes` for the subset lookups (`<@` and `@>`) that pick the
+      closest stored version of a requested furniture set
+    - `(room_design_id, furniture_count DESC, created_at DESC)` for listing a design's placements
+      largest set first
+
+  3. Security
+    - Enable RLS on `furniture_placements` table
+    - Same public testing policies as `room_designs`
+    - Note: In production, these should be restricted to authenticated users
+
+  Rows are removed with their room design; their images are removed from Storage by the API.
+*/
+
+CREATE TABLE IF NOT EXISTS furniture_placements (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  room_design_id uuid NOT NULL REFERENCES room_designs(id) ON DELETE CASCADE,
+  base_placement_id uuid REFERENCES furniture_placements(id) ON DELETE SET NULL,
+  version integer NOT NULL DEFAULT 1,
+  furniture_hashes text[] NOT NULL,
+  added_hashes text[] NOT NULL DEFAULT '{}',
+  furniture_count integer NOT NULL,
+  image_url text NOT NULL,
+  description text,
+  created_at timestamptz DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_furniture_placements_hashes ON furniture_placements USING GIN (furniture_hashes);
+CREATE INDEX IF NOT EXISTS idx_furniture_placements_design
+  ON furniture_placements(room_design_id, furniture_count DESC, created_at DESC);
+
+ALTER TABLE furniture_placements ENABLE ROW LEVEL SECURITY;
+
+-- For testing purposes, allow public access
+-- In production, replace with proper user-based policies
+CREATE POLICY "Allow public read access for testing"
+  ON furniture_placements
+  FOR SELECT
+  TO public
+  USING (true);
+
+CREATE POLICY "Allow public insert for testing"
+  ON furniture_placements
+  FOR INSERT
+  TO public
+  WITH CHECK (true);
+
+CREATE POLICY "Allow public delete for testing"
+  ON furniture_placements
+  FOR DELETE
+  TO public
+  USING (true);
@@ -0,0 +1,17 @@
+/*
+  # Index the image URL columns for storage garbage collection
+
+  1. Indexes
+    - `furniture_items.image_url`
+    - `room_designs.original_image_url` and `room_designs.generated_image_url`
+    - `furniture_placements.image_url`
+
+  The garbage collector (`python -m scripts.storage_gc`, run from the `backend` folder)
+  reads each column in order, one page at a time, next to the matching Storage folder
+  listing. These indexes make every page an index range scan instead of a sort of the table.
+*/
+
+CREATE INDEX IF NOT EXISTS idx_furniture_items_image_url ON furniture_items(image_url);
+CREATE INDEX IF NOT EXISTS idx_room_designs_original_image_url ON room_designs(original_image_url);
+CREATE INDEX IF NOT EXISTS idx_room_designs_generated_image_url ON room_designs(generated_image_url);
+CREATE INDEX IF NOT EXISTS idx_furniture_placements_image_url ON furniture_placements(image_url);